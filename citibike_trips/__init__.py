@@ -1,19 +1,35 @@
+import collections
 import json
 import logging
-import browser_cookie3
 import requests
-from bs4 import BeautifulSoup
 import time
 import datetime
-import pytz
+import glob
+import hashlib
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from . import columnar, feeds, hydrate, parse, records, routes, snapshots, store, transport, writers
+from .metrics import Metrics
+from .cache import ResponseCache
+from .ratelimit import RateLimiter
+from .stations import StationIndex
 
 
 log = logging.getLogger(__name__)
 
 __version__ = "0.0.3"
-DTS = "%m/%d/%Y %H:%M:%S %p"
+DTS = "%m/%d/%Y %I:%M:%S %p"
 TZS = "US/Eastern"
-TZ = pytz.timezone(TZS)
+
+
+def __getattr__(name):
+    # pytz is only imported once times are converted, TZ is still there for code that used it
+    if name == "TZ":
+        import pytz
+
+        return pytz.timezone(TZS)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 class CitibikeTrips:
@@ -21,6 +37,7 @@ class CitibikeTrips:
     password: str
     t: int
     w: int
+    workers: int
     account: object
     stations: object
     trips: object
@@ -31,6 +48,9 @@ class CitibikeTrips:
     data_dir: str
     verbose: bool
     debug: bool
+    incremental: bool
+    parser: str
+    formats: tuple
     url_stations: str
     url_member_base: str
     url_login_get: str
@@ -52,6 +72,24 @@ class CitibikeTrips:
         extended=False,
         http_timeout=60,
         http_wait=1,
+        http_rate=None,
+        http_workers=1,
+        http_retries=3,
+        http_backoff=0.5,
+        incremental=False,
+        parser="html5lib",
+        formats=("csv", "json"),
+        store=None,
+        http_cache=False,
+        http_cache_ttls=None,
+        offline=False,
+        stations_ttl=0,
+        compact=False,
+        account_dirs=False,
+        distances=False,
+        json_indent=2,
+        compression=None,
+        parse_workers=1,
         url_stations="https://layer.bicyclesharing.net/map/v1/nyc/stations",
         url_member_base="https://member.citibikenyc.com",
         user_agent="curl",
@@ -70,6 +108,24 @@ class CitibikeTrips:
         :type extended: bool
         :type http_timeout: int
         :type http_wait: int
+        :type http_rate: float
+        :type http_workers: int
+        :type http_retries: int
+        :type http_backoff: float
+        :type incremental: bool
+        :type parser: str
+        :type formats: tuple
+        :type store: str
+        :type http_cache: bool
+        :type http_cache_ttls: dict
+        :type offline: bool
+        :type stations_ttl: int
+        :type compact: bool
+        :type account_dirs: bool
+        :type distances: bool
+        :type json_indent: int
+        :type compression: str
+        :type parse_workers: int
         :type url_stations: str
         :type url_member_base: str
         :type user_agent: str
@@ -77,6 +133,7 @@ class CitibikeTrips:
 
         log.debug("init")
         self.ts = int(time.time())
+        self.metrics = Metrics()
         self.username = username
         self.password = password
         self.ba = ba
@@ -84,9 +141,37 @@ class CitibikeTrips:
         self.recent = recent
         self.keep = keep
         self.data_dir = keep
+        self.account_dirs = account_dirs
         self.verbose = verbose
         self.debug = debug
         self.extended = extended
+        self.incremental = incremental
+        if parser not in parse.PARSERS:
+            raise ValueError("parser must be one of {}".format(", ".join(parse.PARSERS)))
+        self.parser = parser
+        self.formats = tuple(formats)
+        if compression not in (None, "gz", "zst"):
+            raise ValueError("compression must be one of gz, zst")
+        self.compression = compression
+        self.json_indent = json_indent
+        self.store = store
+        self._trip_store = None
+        self.offline = offline
+        self.cache = None
+        if http_cache or offline:
+            if not keep:
+                raise ValueError("http_cache and offline need keep, responses are cached in the keep dir")
+            # the profile url is the same for every account, so each login gets its own cache from the first request
+            self.cache = ResponseCache(
+                "{}/http/{}".format(keep, hashlib.sha256((username or jar or "").encode("utf-8")).hexdigest()[:16]),
+                self.http_cache_class,
+                ttls=http_cache_ttls,
+                offline=offline,
+            )
+        self.stations_ttl = stations_ttl
+        self.stations_ts = None
+        self._station_feeds = None
+        self._routes = None
         self.url_stations = url_stations
         self.url_member_base = url_member_base
         self.url_login_get = "{}/profile/login".format(self.url_member_base)
@@ -95,13 +180,32 @@ class CitibikeTrips:
         self.url_last = None
         self.t = http_timeout
         self.w = http_wait
-        self.s = requests.session()
+        self.workers = max(1, http_workers or 1)
+        self.parse_workers = max(1, parse_workers or 1)
+        self.limiter = RateLimiter(rate=http_rate, burst=self.workers, wait=http_wait)
+        self.user_agent = user_agent
+        self.retries = http_retries
+        self.backoff = http_backoff
         if jar:
+            # browser_cookie3 pulls in crypto and keyring modules, only load it when a cookie jar is used
+            import browser_cookie3
+
             self.jar = jar
             self.cj = browser_cookie3.firefox(domain_name=self.url_member_base, cookie_file=self.jar)
-            self.s.cookies = self.cj
-        self.trips = []
+        self.s = self.http_session()
+        self.csv_header = records.TRIP_FIELDS
+        self.csv_header_full = records.TRIP_FULL_FIELDS
+        self.distances = distances
+        self.distance_cache = hydrate.DistanceCache()
+        if distances:
+            self.csv_header_full = records.TRIP_FULL_FIELDS + records.DISTANCE_FIELDS
+        self.compact = compact
+        self.pool = records.Pool()
+        self.trips = self.trips_table()
         self.trips_full = None
+        self.trips_full_columns = None
+        self.time_cache = hydrate.TimeCache(TZS, DTS)
+        self._station_index = StationIndex()
         self.stations = {}
 
         self.account = {
@@ -139,77 +243,106 @@ class CitibikeTrips:
             "ts": self.ts,
         }
 
-        self.csv_header = (
-            "start_time",
-            "end_time",
-            "start_name",
-            "end_name",
-            "start_points",
-            "end_points",
-            "points",
-            "billed",
-            "duration",
-        )
+    @property
+    def stations(self):
+        """Raw stations feed object"""
 
-        self.csv_header_full = (
-            "account_id",
-            "observed",
-            "start_time",
-            "end_time",
-            "start_name",
-            "end_name",
-            "start_points",
-            "end_points",
-            "points",
-            "billed",
-            "duration",
-            "start_id",
-            "end_id",
-            "start_terminal",
-            "end_terminal",
-            "start_lon",
-            "start_lat",
-            "end_lon",
-            "end_lat",
-            "dollars",
-            "seconds",
-            "start_epoch",
-            "end_epoch",
-            "start_iso8601",
-            "end_iso8601",
-        )
+        return self._stations
+
+    @stations.setter
+    def stations(self, stations):
+        """Replace stations feed object and rebuild station index"""
+
+        self._stations = stations
+        self._station_index = StationIndex(stations)
+
+    @property
+    def station_index(self):
+        """StationIndex for the current stations object, rebuilt if the feed changed in place"""
+
+        if self._station_index.is_stale(self._stations):
+            log.debug("stations changed, rebuilding station index")
+            self._station_index = StationIndex(self._stations)
+        return self._station_index
+
+    def trips_table(self, rows=None, header=None):
+        """Return container for trips, a TripTable sharing the string pool when compact, else a list"""
+
+        if not self.compact:
+            return rows if isinstance(rows, list) else list(rows or ())
+        return records.TripTable.from_rows(rows or (), header or self.csv_header, self.pool)
 
     def load_trips(self, file=None):
-        """Load trips object from json file"""
+        """Load trips object from json, ndjson or columnar cbc file"""
 
         log.info("loading trips from {}".format(file))
-        with open(file, "r", encoding="utf-8") as f:
-            self.trips = json.load(f)
+        self.trips = self.trips_table(self.read_trips(file))
+
+    @staticmethod
+    def read_trips(file):
+        """Return list of trips read from json, ndjson or columnar cbc file, json and ndjson may be gz or zst compressed"""
+
+        if writers.compression(file):
+            name = os.path.splitext(file)[0]
+        else:
+            name = file
+        if name.endswith(".ndjson"):
+            return list(writers.read_ndjson(file))
+
+        if file.endswith(".cbc"):
+            with columnar.ColumnarSnapshot(file) as snapshot:
+                return snapshot.to_rows()
+
+        return writers.read_json(file)
+
+    def load_trips_full(self, file=None, rows=True):
+        """Load extended trips object from json or columnar cbc file.
 
-    def load_trips_full(self, file=None):
-        """Load extended trips object from json file"""
+        A cbc file is memory mapped and trips_full_columns points straight at it. With rows=False trips_full is left
+        empty so nothing is copied."""
 
         log.info("loading extended trips from {}".format(file))
-        with open(file, "r", encoding="utf-8") as f:
-            self.trips_full = json.load(f)
+        if file.endswith(".cbc"):
+            self.trips_full_snapshot = columnar.ColumnarSnapshot(file)
+            self.trips_full_columns = self.trips_full_snapshot.columns
+            self.trips_full = self.trips_full_snapshot.to_rows() if rows else None
+            if self.trips_full is not None and self.compact:
+                self.trips_full = self.trips_table(self.trips_full, self.csv_header_full)
+            return
+
+        self.trips_full = self.trips_table(writers.read_json(file), self.csv_header_full)
 
     def get_trips(self, last_page=0):
         """Get all trips and write data to disk. Calls login if needed."""
-        if not self.login():
-            return False
+        with self.metrics.phase("login"):
+            if not self.login():
+                return False
 
-        self.extract_profile()
-        self.get_trips_loop(last_page=last_page)
-        self.get_stations()
+        with self.metrics.phase("profile"):
+            self.extract_profile()
+        if self.account_dirs and self.keep:
+            self.use_account_dir()
+        with self.metrics.phase("trips"):
+            if self.incremental and self.keep:
+                self.get_trips_incremental(last_page=last_page)
+            else:
+                self.get_trips_loop(last_page=last_page)
+        with self.metrics.phase("stations"):
+            self.get_stations()
 
         if self.extended:
-            self.hydrate_trips()
+            with self.metrics.phase("hydrate"):
+                self.hydrate_trips()
 
         if self.keep:
-            self.save_account()
-            self.save_stations()
-            self.save_trips()
-
+            with self.metrics.phase("save"):
+                self.save_account()
+                self.save_stations()
+                self.save_trips()
+                if "routes" in self.formats:
+                    self.save_routes()
+
+        self.metrics.connections = self.connection_stats()
         if self.extended:
             return self.trips_full
         else:
@@ -217,45 +350,147 @@ class CitibikeTrips:
 
     def get_account(self):
         """Get account data. Calls login if needed."""
-        if not self.login():
-            return False
+        with self.metrics.phase("login"):
+            if not self.login():
+                return False
 
-        self.extract_profile()
+        with self.metrics.phase("profile"):
+            self.extract_profile()
+        if self.account_dirs and self.keep:
+            self.use_account_dir()
 
         if self.keep:
-            self.save_account()
+            with self.metrics.phase("save"):
+                self.save_account()
 
         return self.account
 
+    def use_account_dir(self):
+        """Point data_dir at a subdirectory of keep named by account id, taken from the trips link in the profile"""
+
+        self.data_dir = os.path.join(self.keep, self.resolve_account_id())
+        os.makedirs(self.data_dir, exist_ok=True)
+        log.info("keeping files for account {} in {}".format(self.account_id(), self.data_dir))
+        return self.data_dir
+
+    def json_file(self, kind):
+        """Return path of the json snapshot of kind for this run, with the compression extension"""
+
+        file = "{}/cb_{}_{}.json".format(self.data_dir, kind, self.ts)
+        return "{}.{}".format(file, self.compression) if self.compression else file
+
     def save_account(self):
         log.info("saving account output")
-        self.write_account_json("{}/cb_account_{}.json".format(self.data_dir, self.ts))
+        # get_account never needs the trips link, the account id comes from it
+        self.resolve_account_id()
+        if "json" in self.formats:
+            self.write_account_json(self.json_file("account"))
+        if "sqlite" in self.formats:
+            self.trip_store.save_account(self.account, self.account_id(), self.ts)
 
     def save_stations(self):
         log.info("saving stations output")
-        self.write_stations_json("{}/cb_stations_{}.json".format(self.data_dir, self.ts))
+        if "feed" in self.formats:
+            self.station_feeds.save(self.stations, self.stations_ts or self.ts)
+        elif "json" in self.formats:
+            self.write_stations_json(self.json_file("stations"))
+        if "sqlite" in self.formats:
+            self.trip_store.save_stations(self.stations, self.ts)
+
+    @property
+    def station_feeds(self):
+        """StationFeedStore in data_dir/stations, opened on first use"""
+
+        if self._station_feeds is None:
+            self._station_feeds = feeds.StationFeedStore("{}/stations".format(self.data_dir))
+        return self._station_feeds
+
+    @property
+    def routes(self):
+        """Origin destination ODMatrix, loaded from cb_routes.json in data_dir when routes is in formats"""
+
+        if self._routes is None:
+            if self.keep and "routes" in self.formats:
+                self._routes = routes.ODMatrix.load(self.routes_file())
+            else:
+                self._routes = routes.ODMatrix()
+        return self._routes
+
+    def routes_file(self):
+        return "{}/cb_routes.json".format(self.data_dir)
+
+    def update_routes(self, trips=None, header=None):
+        """Add trips not yet counted, all of trips by default, to the routes matrix and return it"""
+
+        if trips is None:
+            trips = self.trips
+        self.routes.add(trips, header or self.csv_header)
+        return self.routes
+
+    def save_routes(self):
+        log.info("saving routes output")
+        self.update_routes().save(self.routes_file())
+
+    @property
+    def trip_store(self):
+        """TripStore in data_dir or at the store path, opened on first use"""
+
+        if self._trip_store is None:
+            self._trip_store = store.TripStore(self.store or "{}/citibike_trips.sqlite".format(self.data_dir))
+        return self._trip_store
+
+    def account_id(self):
+        """Return account id extracted from trips link or '-' if not known yet"""
+
+        return self.account["id"][0] if self.account["id"] else "-"
+
+    def resolve_account_id(self):
+        """Return account id, extracting it from the trips link in the profile soup if it is not known yet"""
+
+        if not self.account["id"] and getattr(self, "soup_profile", None):
+            self.extract_trips_link(self.soup_profile)
+        return self.account_id()
 
     def save_trips(self):
         log.info("saving trips output")
-        self.write_trips_csv("{}/cb_trips_{}.csv".format(self.data_dir, self.ts))
-        self.write_trips_json("{}/cb_trips_{}.json".format(self.data_dir, self.ts))
+        if "csv" in self.formats:
+            self.write_trips_csv("{}/cb_trips_{}.csv".format(self.data_dir, self.ts))
+        if "json" in self.formats:
+            self.write_trips_json(self.json_file("trips"))
+        if "cbc" in self.formats:
+            self.write_trips_cbc("{}/cb_trips_{}.cbc".format(self.data_dir, self.ts))
+        if "sqlite" in self.formats:
+            if self.extended and not self.trips_full:
+                self.hydrate_trips()
+            if self.extended:
+                self.trip_store.save_trips(self.trips_full, self.csv_header_full, self.account_id(), self.ts)
+            else:
+                self.trip_store.save_trips(self.trips, self.csv_header, self.account_id(), self.ts)
 
         if self.extended:
             # hydrate is automatically called by write_trips_full
-            self.write_trips_full_csv("{}/cb_trips_full_{}.csv".format(self.data_dir, self.ts))
-            self.write_trips_full_json("{}/cb_trips_full_{}.json".format(self.data_dir, self.ts))
+            if "csv" in self.formats:
+                self.write_trips_full_csv("{}/cb_trips_full_{}.csv".format(self.data_dir, self.ts))
+            if "json" in self.formats:
+                self.write_trips_full_json(self.json_file("trips_full"))
+            if "cbc" in self.formats:
+                self.write_trips_full_cbc("{}/cb_trips_full_{}.cbc".format(self.data_dir, self.ts))
 
     def get_trips_recent(self):
         """Get only the most recent trips page. Calls login if needed."""
-        return self.get_trips(self, last_page=1)
+        return self.get_trips(last_page=1)
 
     def login(self):
         """Login to citibike website and return True or False."""
 
         log.info("login")
+        if self.offline:
+            log.info("offline replay, skipping login")
+            return True
+
         # Find csrf token for login
-        res = self.s.get(self.url_login_get, timeout=self.t)
-        soup = BeautifulSoup(res.text, "html5lib")
+        res = self.http_get(self.url_login_get, timeout=self.t)
+        soup = parse.soup(res.text)
         self.csrf = soup.find("input", {"name": "_login_csrf_security_token"}).get("value")
 
         log.debug("Found csrf: {}".format(self.csrf))
@@ -270,9 +505,12 @@ class CitibikeTrips:
             }
 
             # post login
+            wait = self.limiter.acquire()
+            t = time.perf_counter()
             res = self.s.post(
                 self.url_login_post, data=payload, allow_redirects=False, headers=dict(referer=self.url_login_get)
             )
+            self.metrics.request(time.perf_counter() - t, len(res.content), res.status_code, wait)
 
             log.debug("POST login status {}".format(res.status_code))
             if res.status_code == requests.codes["ok"]:
@@ -287,11 +525,59 @@ class CitibikeTrips:
                 log.warning("POST login fail")
                 return False
 
+    def http_get(self, url, **kwargs):
+        """GET url through the response cache when enabled. Only requests that reach the network are rate limited."""
+
+        if self.cache:
+            return self.cache.get(self.http_get_network, url, **kwargs)
+        return self.http_get_network(url, **kwargs)
+
+    def http_get_network(self, url, **kwargs):
+        """Rate limited GET on the shared session. The response gets the seconds spent on the rate limiter as wait."""
+
+        wait = self.limiter.acquire()
+        t = time.perf_counter()
+        res = self.s.get(url, **kwargs)
+        self.metrics.request(time.perf_counter() - t, len(res.content), res.status_code, wait)
+        res.wait = wait
+        return res
+
+    def http_session(self):
+        """Return requests session for the http options and cookie jar"""
+
+        # one keep-alive connection per worker, every request gets the timeout and GETs retry on 429 and 5xx
+        s = transport.session(
+            user_agent=self.user_agent,
+            pool_size=self.workers,
+            timeout=self.t,
+            retries=self.retries,
+            backoff=self.backoff,
+        )
+        if hasattr(self, "cj"):
+            s.cookies = self.cj
+        return s
+
+    def connection_stats(self):
+        """Return connection pool reuse, retry and status code counts of the http session"""
+
+        return transport.connection_stats(self.s)
+
+    def http_cache_class(self, url):
+        """Return response cache ttl class for url, None for urls never cached"""
+
+        if url == self.url_stations:
+            return "stations"
+        if url.startswith(self.url_login_get):
+            return None
+        if "pageNumber=" in url:
+            return "trips_first" if url.endswith("pageNumber=1") else "trips"
+        return "profile"
+
     def get_account_soup(self):
         """ get profile page and return soup object."""
 
-        res = self.s.get(self.url_profile, headers=dict(referer=self.url_profile))
-        self.soup_profile = BeautifulSoup(res.content, "html5lib")
+        res = self.http_get(self.url_profile, headers=dict(referer=self.url_profile))
+        self.soup_profile = parse.soup(res.content)
         return self.soup_profile
 
     def extract_profile(self):
@@ -299,61 +585,19 @@ class CitibikeTrips:
 
         log.info("Extract profile from account page")
 
-        if not hasattr("self", "soup_profile"):
+        if not hasattr(self, "soup_profile"):
             self.get_account_soup()
         soup = self.soup_profile
 
-        self.account["profile"]["first_name"] = self.from_soup_get_profile_first_name(soup)
-        self.account["profile"]["last_name"] = self.from_soup_get_profile_last_name(soup)
-        self.account["profile"]["user_name"] = self.from_soup_get_profile_user_name(soup)
-        self.account["profile"]["date_of_birth"] = self.from_soup_get_profile_date_of_birth(soup)
-        self.account["profile"]["gender"] = self.from_soup_get_profile_gender(soup)
-        self.account["profile"]["phone"] = self.from_soup_get_profile_phone_number(soup)
-        self.account["profile"]["email"] = self.from_soup_get_profile_email(soup)
-        self.account["profile"]["member_since"] = self.from_soup_get_profile_member_since(soup)
-        self.account["profile"]["bike_angel_since"] = self.from_soup_get_profile_bike_angel_since(soup)
-
-        self.account["trips"]["lifetime"] = self.from_soup_get_lifetime_stats(soup)
-
-        self.account["my_statistics"]["number_of_trips"] = self.from_soup_get_lifetime_stats_number_of_trips(soup)
-        self.account["my_statistics"]["total_usage_time"] = self.from_soup_get_lifetime_stats_total_usage_time(soup)
-        self.account["my_statistics"]["distance_traveled"] = self.from_soup_get_lifetime_stats_distance_traveled(soup)
-        self.account["my_statistics"]["gas_saved"] = self.from_soup_get_lifetime_stats_gas_saved(soup)
-        self.account["my_statistics"]["co2_reduced"] = self.from_soup_get_lifetime_stats_co2_reduced(soup)
-
-        self.account["last_trip"]["date"] = self.from_soup_get_last_trip_dates(soup)
-        self.account["last_trip"]["station"] = self.from_soup_get_last_trip_stations(soup)
-        self.account["last_trip"]["trip_time"] = self.from_soup_get_last_trip_time(soup)
-
-        self.account["bike_key"]["number"] = self.from_soup_get_bike_key_number(soup)
-        self.account["bike_key"]["status"] = self.from_soup_get_bike_key_status(soup)
-
-        self.account["membership_status"]["current"]["type"] = self.from_soup_get_membership_current_type(soup)
-        self.account["membership_status"]["current"]["status"] = self.from_soup_get_membership_current_status(soup)
-        self.account["membership_status"]["current"]["expiration"] = self.from_soup_get_membership_current_expiration(
-            soup
-        )
-
-        self.account["membership_status"]["next"]["type"] = self.from_soup_get_membership_next_type(soup)
-        self.account["membership_status"]["next"]["status"] = self.from_soup_get_membership_next_status(soup)
-        self.account["membership_status"]["next"]["start"] = self.from_soup_get_membership_next_start(soup)
-        self.account["membership_status"]["next"]["expiration"] = self.from_soup_get_membership_next_expiration(soup)
-
-        self.account["billing_summary"]["next_billing_date"] = self.from_soup_get_billing_summary_next_billing_date(
-            soup
-        )
-        self.account["billing_summary"]["current_balance"] = self.from_soup_get_billing_summary_current_balance(soup)
-
-        self.account["billing_information"]["postal_code"] = self.from_soup_get_billing_info_postal_code(soup)
-
         if self.ba:
-            # these should work because try/except but we'll be safe
             log.info("Extracting bikeangels from profile")
-            self.account["my_statistics"]["bike_angels_current"] = self.from_soup_get_ba_points_current(soup)
-            self.account["my_statistics"]["bike_angels_annual"] = self.from_soup_get_ba_points_annual(soup)
-            self.account["my_statistics"]["bike_angels_lifetime"] = self.from_soup_get_ba_points_lifetime(soup)
 
-            self.account["last_trip"]["bike_angels_points"] = self.from_soup_get_last_trip_bike_angels_points(soup)
+        # one pass over the profile instead of a soup.find per field, from_soup_get_* helpers return the same values
+        for path, value in parse.extract_profile_fields(soup, ba=self.ba):
+            _ = self.account
+            for key in path[:-1]:
+                _ = _[key]
+            _[path[-1]] = value
 
         log.debug(self.account)
         return self.account
@@ -781,10 +1025,24 @@ class CitibikeTrips:
     def get_trips_links(self):
         """Extract trips link from profile and number of last trips page. Will Get request and process account data from profile page if soup_profile does not exist."""
 
-        if not self.soup_profile:
+        if not getattr(self, "soup_profile", None):
             self.get_account_soup()
         soup = self.soup_profile
 
+        self.extract_trips_link(soup)
+        soup = self.get_trips_soup()
+        self.extract_trips_last(soup)
+        # keep first page so the trips loop does not request it twice
+        self.soup_trips_first = soup
+        if self.cache:
+            # a new trip pushes every older one down, cached pages past the first are only good until that happens
+            first = self.extract_trip_data(soup)[:1]
+            marker = [self.trips_last] + [list(self.trip_key(_)) for _ in first]
+            self.cache.invalidate_on_change("trips", marker, prefix=self.trips_url)
+
+    def extract_trips_link(self, soup):
+        """Extract trips link and account id from profile soup"""
+
         self.trips_link = soup.find(
             "li", {"class": "ed-profile-menu__link ed-profile-menu__link_trips ed-profile-menu__link_level1"},
         ).a.get("href")
@@ -794,9 +1052,13 @@ class CitibikeTrips:
 
         # extract unique account id from trip link, this is different than bike key
         # TODO test account with multiple riders?
-        self.account["id"].append(self.trips_link.split("/")[-1])
+        account_id = self.trips_link.split("/")[-1]
+        if account_id not in self.account["id"]:
+            self.account["id"].append(account_id)
+        return self.trips_link
 
-        soup = self.get_trips_soup()
+    def extract_trips_last(self, soup):
+        """Extract number of last trips page from pagination footer of trips page soup"""
 
         self.trips_last = int(
             soup.find(
@@ -807,13 +1069,32 @@ class CitibikeTrips:
             .split("=")[1]
         )
         log.info("Total number of trips pages {}".format(self.trips_last))
+        return self.trips_last
 
     def get_trips_soup(self, page_num=1):
         """Request trip by by number and return parsed html as beautiful soup object. Lower page numbers are more recent, starting at zero."""
 
+        content = self.get_trips_content(page_num)
+        if content is False:
+            return False
+
+        t = time.perf_counter()
+        soup = parse.soup(content)
+        self.metrics.page(page_num, parse=time.perf_counter() - t)
+        return soup
+
+    def get_trips_content(self, page_num=1):
+        """Request trip page by number and return raw html bytes or False"""
+
         page_url = self.gen_trips_url_num(page_num)
         log.debug("GET trips page url {}".format(page_url))
-        res = self.s.get(page_url, headers=dict(referer=self.url_profile))
+        t = time.perf_counter()
+        res = self.http_get(page_url, headers=dict(referer=self.url_profile))
+        # cached responses never waited on the rate limiter
+        wait = getattr(res, "wait", 0.0)
+        self.metrics.page(
+            page_num, fetch=time.perf_counter() - t - wait, wait=wait, bytes=len(res.content), status=res.status_code
+        )
 
         if res.status_code == requests.codes["ok"]:
             log.debug("GET trips page {} PASS".format(page_num))
@@ -822,114 +1103,275 @@ class CitibikeTrips:
             log.debug("GET trips page {} FAIL".format(page_num))
             return False
 
-        soup = BeautifulSoup(res.content, "html5lib")
-        return soup
+        return res.content
 
     def get_trips_loop(self, last_page=0):
         """Get trip pages starting at most recent up to last_page.
 
         If last_page not provided, will collect all pages. The last_page is extracted from footer by get_trips_links"""
 
-        if not hasattr("self", "trips_last"):
+        if not hasattr(self, "trips_last"):
             self.get_trips_links()
 
         if 0 == last_page:
             last_page = self.trips_last
 
-        log.info("Grabbing trips from 1 to {}".format(last_page))
-        for tp in range(1, last_page + 1):
-            log.info("get trips page {}".format(tp))
-            soup = self.get_trips_soup(tp)
-            trips = self.extract_trip_data(soup)
+        for tp, trips in self.iter_trips_pages(last_page=last_page):
             self.trips.extend(trips)
 
         log.info("total trips {}".format(len(self.trips)))
 
+    def iter_trips_pages(self, last_page=0):
+        """Generator of (page number, trips) from most recent page up to last_page, in page order. Call login first.
+
+        Nothing is kept on the object, so memory does not grow with history length."""
+
+        if not hasattr(self, "trips_last"):
+            self.get_trips_links()
+
+        if 0 == last_page:
+            last_page = self.trips_last
+
+        log.info("Grabbing trips from 1 to {}".format(last_page))
+        pages = range(1, last_page + 1)
+        if self.parse_workers > 1 and len(pages) > 1:
+            yield from self.get_trips_pages_pipeline(pages)
+        elif self.workers > 1 and len(pages) > 1:
+            yield from zip(pages, self.get_trips_pages_concurrent(pages))
+        else:
+            for tp in pages:
+                yield tp, self.get_trips_page(tp)
+
+    def iter_trips(self, last_page=0):
+        """Generator of single trips from most recent up to last_page. Call login first."""
+
+        for tp, trips in self.iter_trips_pages(last_page=last_page):
+            yield from trips
+
+    def get_trips_page(self, page_num):
+        """Request one trips page and return the extracted trips"""
+
+        log.info("get trips page {}".format(page_num))
+        if page_num == 1 and getattr(self, "soup_trips_first", None):
+            soup = self.soup_trips_first
+            self.soup_trips_first = None
+        elif self.parser == "lxml":
+            content = self.get_trips_content(page_num)
+            t = time.perf_counter()
+            trips = self.extract_trip_data_content(content)
+            self.metrics.page(page_num, parse=time.perf_counter() - t, rows=len(trips))
+            return trips
+        else:
+            soup = self.get_trips_soup(page_num)
+        t = time.perf_counter()
+        trips = self.extract_trip_data(soup)
+        self.metrics.page(page_num, parse=time.perf_counter() - t, rows=len(trips))
+        return trips
+
+    def latest_trips_file(self):
+        """Return path of the newest cb_trips_<ts>.json or .cbc snapshot in data_dir or None, json may be compressed"""
+
+        snapshots = []
+        for file in glob.glob("{}/cb_trips_*".format(self.data_dir)):
+            name = os.path.basename(file)[len("cb_trips_") :]
+            if writers.compression(name):
+                name = os.path.splitext(name)[0]
+            ts, ext = os.path.splitext(name)
+            if ts.isdigit() and ext in (".json", ".cbc"):
+                snapshots.append((int(ts), ext == ".json", file))
+
+        if not snapshots:
+            return None
+        return max(snapshots)[2]
+
+    def trip_key(self, trip):
+        """Return (start_time, start_name) identifying a trip, billed and points can still change after the ride"""
+
+        return trip[self.csv_header.index("start_time")], trip[self.csv_header.index("start_name")]
+
+    def get_trips_incremental(self, last_page=0):
+        """Get only trips newer than the latest snapshot in data_dir and merge them with the stored history.
+
+        Trip pages are newest first, so crawling stops at the first page containing a trip already in the snapshot,
+        matched on start time and start station. Pages are fetched until one overlaps whatever last_page is, so new
+        trips spilling over more pages never leave a gap. If no page overlaps, every page was fetched and known trips
+        missing from them are kept after the fresh ones. Falls back to get_trips_loop when there is no snapshot."""
+
+        file = self.latest_trips_file()
+        if not file:
+            log.info("no trips snapshot in {}, getting full history".format(self.data_dir))
+            return self.get_trips_loop(last_page=last_page)
+
+        log.info("loading known trips from {}".format(file))
+        known = self.read_trips(file)
+        known_keys = set(map(self.trip_key, known))
+        if known:
+            log.info("high watermark trip {}".format(known[0]))
+
+        if not hasattr(self, "trips_last"):
+            self.get_trips_links()
+
+        new = []
+        overlap = False
+        for tp in range(1, self.trips_last + 1):
+            trips = self.get_trips_page(tp)
+            fresh = list(itertools.takewhile(lambda trip: self.trip_key(trip) not in known_keys, trips))
+            new.extend(fresh)
+            if len(fresh) < len(trips):
+                log.info("trips page {} overlaps known trips, stopping".format(tp))
+                overlap = True
+                break
+            if tp == last_page:
+                log.info("no known trips up to page {}, getting more pages".format(tp))
+
+        if known and not overlap:
+            log.warning("no trips page overlaps the known trips in {}, merged with a full crawl".format(file))
+            new_keys = set(map(self.trip_key, new))
+            known = [_ for _ in known if self.trip_key(_) not in new_keys]
+
+        log.info("new trips {} known trips {}".format(len(new), len(known)))
+        self.trips_new = new
+        self.trips.extend(new)
+        self.trips.extend(known)
+
+    def get_trips_pages_concurrent(self, pages):
+        """Request trips pages over a pool of http_workers threads sharing the session and rate limiter.
+
+        Generator of extracted trips per page in the same order as pages. At most two pages per worker are in flight
+        or waiting to be consumed."""
+
+        log.info("Grabbing {} trips pages with {} workers".format(len(pages), self.workers))
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = collections.deque()
+            for tp in pages:
+                pending.append(pool.submit(self.get_trips_page, tp))
+                if len(pending) >= self.workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+        # threads finish out of order, point url_last at the final page like the sequential loop does
+        self.url_last = self.gen_trips_url_num(pages[-1])
+
+    def get_trips_pages_pipeline(self, pages):
+        """Fetch trips pages and parse them in a pool of parse_workers processes.
+
+        Generator of (page number, trips) in the same order as pages. Raw page bytes go to the pool and only trip
+        tuples come back, so parsing uses every core while pages are fetched, over http_workers threads when more than
+        one. Page 1 is parsed here when get_trips_links already has its soup."""
+
+        log.info("Grabbing {} trips pages parsing in {} processes".format(len(pages), self.parse_workers))
+        if pages[0] == 1 and getattr(self, "soup_trips_first", None):
+            yield 1, self.get_trips_page(1)
+            pages = pages[1:]
+        if not pages:
+            return
+
+        for tp, trips, seconds in parse.extract_pages(self.iter_trips_contents(pages), self.parser, self.parse_workers):
+            self.metrics.page(tp, parse=seconds, rows=len(trips))
+            yield tp, trips
+
+        # pages may be fetched out of order, point url_last at the final page like the sequential loop does
+        self.url_last = self.gen_trips_url_num(pages[-1])
+
+    def iter_trips_contents(self, pages):
+        """Generator of (page number, raw html) in the same order as pages, fetched over http_workers threads"""
+
+        if self.workers == 1:
+            for tp in pages:
+                yield tp, self.get_trips_content(tp)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = collections.deque()
+            for tp in pages:
+                pending.append((tp, pool.submit(self.get_trips_content, tp)))
+                if len(pending) >= self.workers * 2:
+                    tp, future = pending.popleft()
+                    yield tp, future.result()
+            while pending:
+                tp, future = pending.popleft()
+                yield tp, future.result()
+
+    def extract_trip_data_content(self, content):
+        """Extracts trip data from raw trips page html with the lxml parser, falling back to html5lib soup"""
+
+        trips = parse.extract_trip_rows(content)
+        if trips is None:
+            log.info("lxml found no trip table, falling back to html5lib")
+            trips = self.extract_trip_data(parse.soup(content))
+        return trips
+
     def extract_trip_data(self, soup):
         """Extracts trip data from a beautiful soup object and returns trip object"""
 
-        table = soup.find("table", {"class": "ed-html-table ed-html-table_trip"})
-        log.debug("Found trip table: {}".format(table))
-
-        trips = []
-        for row in table.find_all("tr"):
-            cells = row.find_all("td")
-            log.debug("found trip table row has {} cells".format(len(cells)))
-            # first tr row is th header instead of td data cells
-            if len(cells) < 1:
-                # skip th header row or other possibly empty row
-                log.debug("skipping short trip table row")
-                continue
-
-            _ = cells[0].find_all("div")
-            start_station = _[0].text.strip()
-            start_time = _[1].text.strip()
-
-            # bikeangles points always return zero even if disabled
-            try:
-                start_points = int(_[2].text.strip())
-            except:
-                start_points = 0
-
-            _ = cells[1].find_all("div")
-            end_station = _[0].text.strip()
-            end_time = _[1].text.strip()
-
-            # bikeangles points always return zero even if disabled
-            try:
-                end_points = int(_[2].text.strip())
-            except:
-                end_points = 0
-
-            duration = cells[2].get_text().strip()
-            billed = cells[3].get_text().strip()
-            try:
-                points = int(cells[4].get_text().strip().split(" ")[0])
-            except:
-                points = 0
-
-            trip = (
-                start_station,
-                end_station,
-                start_time,
-                end_time,
-                start_points,
-                end_points,
-                points,
-                billed,
-                duration,
-            )
-            trips.append(trip)
+        return parse.extract_trip_soup(soup)
 
-        return trips
+    def write_trips_stream(self, csv_file=None, ndjson_file=None, last_page=0, append=None):
+        """Stream trips page by page to CSV and/or NDJSON files without keeping them in self.trips. Call login first.
+
+        Each page is written and flushed as soon as it is parsed, so a killed run still leaves a usable partial file.
+        Files are rewritten unless append is set, which defaults to incremental. Appending stops at the first trip
+        already in the files, matched on start time and start station, and adds the new trips after the known ones.
+        Returns number of trips written."""
+
+        if append is None:
+            append = self.incremental
+
+        known = set()
+        if append:
+            for file, read in ((ndjson_file, writers.read_ndjson), (csv_file, writers.read_csv)):
+                if file and os.path.exists(file):
+                    known = set(map(self.trip_key, read(file)))
+                    log.info("{} trips already in {}".format(len(known), file))
+                    break
+
+        sinks = []
+        if csv_file:
+            sinks.append(writers.TripsCsvWriter(csv_file, self.csv_header, append=append))
+        if ndjson_file:
+            sinks.append(writers.TripsNdjsonWriter(ndjson_file, append=append))
+
+        total = 0
+        try:
+            for tp, trips in self.iter_trips_pages(last_page=last_page):
+                fresh = list(itertools.takewhile(lambda trip: self.trip_key(trip) not in known, trips))
+                for sink in sinks:
+                    sink.write(fresh)
+                total += len(fresh)
+                if len(fresh) < len(trips):
+                    log.info("trips page {} overlaps known trips, stopping".format(tp))
+                    break
+        finally:
+            for sink in sinks:
+                sink.close()
+
+        log.info("streamed {} trips".format(total))
+        return total
 
     def write_stations_json(self, file):
         """Write stations object out to file in json format"""
 
         log.info("writing stations json to {}".format(file))
-        with open(file, "w") as f:
-            f.write(json.dumps(self.stations, indent=2))
+        writers.write_json(self.stations, file, indent=self.json_indent)
 
     def write_account_json(self, file):
         """Writes account object with profile data out to file in json format"""
 
         log.info("writing account json to {}".format(file))
-        with open(file, "w") as f:
-            f.write(json.dumps(self.account, indent=2))
+        writers.write_json(self.account, file, indent=self.json_indent)
 
     def write_trips_json(self, file):
         """Writes trip object out to file in json format"""
 
         log.info("writing trips json to {}".format(file))
-        with open(file, "w") as f:
-            f.write(json.dumps(self.trips, indent=2))
+        writers.write_json(self.trips, file, indent=self.json_indent)
 
     def write_trips_full_json(self, file):
         """Writes trips_full object out to file in json format"""
 
         log.info("writing trips full json to {}".format(file))
-        with open(file, "w") as f:
-            f.write(json.dumps(self.trips_full, indent=2))
+        writers.write_json(self.trips_full, file, indent=self.json_indent)
 
     def write_trips_csv(self, file):
         """Writes trips object out to file in CSV format"""
@@ -955,194 +1397,184 @@ class CitibikeTrips:
             writer.writerow(self.csv_header_full)
             writer.writerows(self.trips_full)
 
+    def write_trips_cbc(self, file):
+        """Writes trips object out to file in columnar cbc format"""
+
+        log.info("writing trips cbc to {}".format(file))
+        columnar.write_columnar(file, self.csv_header, columnar.rows_to_columns(self.trips, self.csv_header))
+
+    def write_trips_full_cbc(self, file):
+        """Calls hydrate_trips if trips_full missing, then writes out to columnar cbc file"""
+
+        if not self.trips_full:
+            self.hydrate_trips()
+
+        log.info("writing trips full cbc to {}".format(file))
+        columns = self.trips_full_columns
+        if columns is None or len(columns[self.csv_header_full[0]]) != len(self.trips_full):
+            columns = columnar.rows_to_columns(self.trips_full, self.csv_header_full)
+        columnar.write_columnar(file, self.csv_header_full, columns)
+
     def load_json(self, ts):
         """Load a set of cached trips, account, and stations objects from filesystem given a timestamp string"""
 
         self.ts = ts
 
-        file = "{}/cb_trips_{}.json".format(self.data_dir, self.ts)
+        file = writers.find_json("{}/cb_trips_{}.json".format(self.data_dir, self.ts))
         log.debug("loading trips from {}".format(file))
-        with open(file, "r", encoding="utf-8") as f:
-            self.trips = json.load(f)
+        self.trips = self.trips_table(writers.read_json(file))
 
-        file = "{}/cb_account_{}.json".format(self.data_dir, self.ts)
+        file = writers.find_json("{}/cb_account_{}.json".format(self.data_dir, self.ts))
         log.debug("loading account from {}".format(file))
-        with open(file, "r", encoding="utf-8") as f:
-            self.account = json.load(f)
+        self.account = writers.read_json(file)
 
-        file = "{}/cb_stations_{}.json".format(self.data_dir, self.ts)
+        file = writers.find_json("{}/cb_stations_{}.json".format(self.data_dir, self.ts))
         log.debug("loading stations from {}".format(file))
-        with open(file, "r", encoding="utf-8") as f:
-            self.stations = json.load(f)
+        self.stations = writers.read_json(file)
+
+    def load_history(self, kinds=("trips", "account"), processes=None, start=None, end=None):
+        """Load every json snapshot in data_dir with ts between start and end over a process pool.
+
+        trips, trips_full, account and stations are set from the merged history, the newest snapshot for account and
+        stations. Returns the snapshots.History with the per snapshot account series."""
+
+        history = snapshots.load_history(self.data_dir, kinds=kinds, processes=processes, start=start, end=end)
+        self.trips = self.trips_table(history.trips)
+        if history.trips_full:
+            self.trips_full = self.trips_table(history.trips_full, self.csv_header_full)
+        if history.accounts:
+            self.account = history.account()
+        if history.stations:
+            self.stations = history.stations[next(reversed(history.stations))]
+        return history
 
     def get_stations(self, file=None):
         """Create stations object from net or load from cached file"""
 
         if file:
             log.debug("loading stations from {}".format(file))
-            with open(file, "r", encoding="utf-8") as f:
-                self.stations = json.load(f)
-        else:
+            self.stations = writers.read_json(file)
+            self.stations_ts = None
+        elif not self.reuse_stations():
             log.debug("getting stations from {}".format(self.url_stations))
-            r = self.s.get(self.url_stations, timeout=self.t)
+            r = self.http_get(self.url_stations, timeout=self.t)
             self.stations = r.json()
+            self.stations_ts = int(time.time())
+            self.keep_stations_checked()
+
+    def reuse_stations(self):
+        """Use the latest kept stations feed when downloaded less than stations_ttl seconds ago. Returns True if used."""
+
+        if not self.stations_ttl or not self.data_dir:
+            return False
+        stations = self.station_feeds.fresh(self.stations_ttl, time.time())
+        if stations is None:
+            return False
+        log.debug("reusing stations feed checked at {}".format(self.station_feeds.index["checked"]))
+        self.stations = stations
+        self.stations_ts = self.station_feeds.index["checked"]
+        return True
+
+    def keep_stations_checked(self):
+        """Record a stations download in the feed store whatever the formats, so stations_ttl can reuse it next run"""
+
+        if self.stations_ttl and self.data_dir:
+            self.station_feeds.save(self.stations, self.stations_ts)
+
+    def load_stations_feed(self, ts=None):
+        """Load stations feed current at ts, or the latest, from the feed store in data_dir"""
+
+        stations = self.station_feeds.load(ts)
+        if stations is None:
+            log.warning("no stations feed kept for {}".format(ts))
+            return False
+        self.stations = stations
+        return self.stations
 
     def hydrate_trips(self, datestring=True, locations=True):
         """given a citibike trips object, add all the data for the full report"""
 
         # TODO making zipcode and bikeangels optional makes us question what a "full report" means
         log.info("hydrating trip data")
-        self.trips_full = []
-        for trip in self.trips:
-            log.debug("start station {}".format(trip[2]))
-
-            # Starting station exceptions happen when stations don't exist anymore
-            # "W 17 St & 9 Ave" is in history but cannot lookup in stations.json
-            try:
-                start_station = self.station_by_name(trip[2])
-
-                start_id = start_station["properties"]["station_id"]
-                start_terminal = start_station["properties"]["terminal"]
-                # TODO named tuples would have avoided this bug
-                dollars = self.dollars_to_float(trip[7])
-                # TODO add iso8601 duration format https://en.wikipedia.org/wiki/ISO_8601#Time_intervals
-                seconds = self.str_to_secs(trip[8])
-
-                start_dt = datetime.datetime.strptime(trip[0], DTS)
-                # TODO python3 doesn't need pytz anymore? https://stackoverflow.com/questions/2150739/iso-time-iso-8601-in-python
-                start_dtz = TZ.localize(start_dt)
-                start_epoch = int(start_dtz.timestamp())
-                # TODO add iso8601 datetime format https://en.wikipedia.org/wiki/ISO_8601
-                start_iso8601 = start_dtz.isoformat()
-
-                start_loc = start_station["geometry"]["coordinates"]
-                start_lon = start_station["geometry"]["coordinates"][0]
-                start_lat = start_station["geometry"]["coordinates"][1]
-            except:
-                start_id = "-"
-                start_terminal = "-"
-
-                start_dt = datetime.datetime.strptime(trip[0], DTS)
-                start_dtz = TZ.localize(start_dt)
-                start_epoch = int(start_dtz.timestamp())
-
-                start_loc = "-"
-                start_lon = "-"
-                start_lat = "-"
-
-            # Ending station exceptions happen when trips are not closed properly
-            # bikes not returned, dock malfunctions, whatever
-            try:
-                end_station = self.station_by_name(trip[3])
-                end_id = end_station["properties"]["station_id"]
-                end_terminal = end_station["properties"]["terminal"]
-                end_loc = end_station["geometry"]["coordinates"]
-                end_lon = end_station["geometry"]["coordinates"][0]
-                end_lat = end_station["geometry"]["coordinates"][1]
-                end_dt = datetime.datetime.strptime(trip[0], DTS)
-                end_dtz = TZ.localize(end_dt)
-                end_epoch = int(end_dtz.timestamp())
-                end_iso8601 = end_dtz.isoformat()
-                dollars = self.dollars_to_float(trip[7])
-                seconds = self.str_to_secs(trip[8])
-            except:
-                end_station = "-"
-                end_id = "-"
-                end_terminal = "-"
-                end_loc = "-"
-                end_lon = "-"
-                end_lat = "-"
-                end_dt = "-"
-                end_dtz = "-"
-                end_iso8601 = "-"
-                dollars = 0.0
-                seconds = 0
-
-            row = []
-            row.append(self.account["id"][0])
-            row.append(self.ts)
-            row.extend(trip)
-            row.extend(
-                [
-                    start_id,
-                    end_id,
-                    start_terminal,
-                    end_terminal,
-                    start_lon,
-                    start_lat,
-                    end_lon,
-                    end_lat,
-                    dollars,
-                    seconds,
-                    start_epoch,
-                    end_epoch,
-                    start_iso8601,
-                    end_iso8601,
-                ]
-            )
-            self.trips_full.append(row)
+        self.trips_full_columns = hydrate.hydrate_columns(
+            self.trips,
+            self.station_index.name,
+            self.account["id"][0],
+            self.ts,
+            self.time_cache,
+            distances=self.distance_cache if self.distances else None,
+        )
+        if self.compact:
+            self.trips_full = records.TripTable.from_columns(self.trips_full_columns, self.csv_header_full, self.pool)
+        else:
+            self.trips_full = hydrate.columns_to_rows(self.trips_full_columns, self.csv_header_full)
+        log.info("time cache {}".format(self.time_cache.info()))
+        if self.distances:
+            log.info("distance cache {}".format(self.distance_cache.info()))
         return self.trips_full
 
     def str_to_secs(self, st):
         """convert string of minutes and seconds to seconds"""
 
-        # TODO need to support '1 h 26 min 55 s'
-        m, sm, s, ss = st.split(" ")
-        secs = int(s) + int(m) * 60
-        return secs
+        return hydrate.str_to_secs(st)
 
     def dollars_to_float(self, st):
         """convert us currency string to float"""
 
-        dollars = float(st[2:])
-        return dollars
+        return hydrate.dollars_to_float(st)
 
     def loc_by_name(self, name):
         """Search stations object by station name and return station object"""
 
-        try:
-            station = [_ for _ in self.stations["features"] if name == _["properties"]["name"]]
-            log.debug("searching for station {} found {}".format(name, station))
-            return station[0]
-        except:
-            log.debug("searching for station {} found None")
-            return None
+        return self.station_by_name(name)
 
     def station_by_name(self, name):
         """Search stations object by station name and return station object"""
 
-        try:
-            station = [_ for _ in self.stations["features"] if name == _["properties"]["name"]]
-            log.debug("searching for station {} found {}".format(name, station))
-            return station[0]
-        except:
-            log.debug("Exception: searching for station {} found None".format(name))
-            return None
+        station = self.station_index.name(name)
+        log.debug("searching for station {} found {}".format(name, station))
+        return station
 
     def station_by_location(self, location):
         """Search stations object by location coordinates and return station object"""
 
-        try:
-            station = [_ for _ in self.stations["features"] if location == _["geometry"]["coordinates"]]
-            log.debug("searching for location {} found {}".format(location, station))
-            return station[0]
-        except:
-            log.debug("searching for location {} found None")
-            return None
+        station = self.station_index.location(location)
+        log.debug("searching for location {} found {}".format(location, station))
+        return station
 
     def station_by_id(self, id):
         """Search stations object by station id and return station object"""
 
-        try:
-            station = [_ for _ in self.stations["features"] if _["properties"]["station_id"] == id]
-            log.debug("searching for station_id {} found {}".format(id, station))
-            return station[0]
-        except:
-            log.debug("searching for station_id {} found None".format(id))
-            return None
+        station = self.station_index.id(id)
+        log.debug("searching for station_id {} found {}".format(id, station))
+        return station
+
+    def station_by_terminal(self, terminal):
+        """Search stations object by terminal and return station object"""
+
+        station = self.station_index.terminal(terminal)
+        log.debug("searching for terminal {} found {}".format(terminal, station))
+        return station
+
+    def station_nearest(self, lon, lat, k=1, max_distance=None):
+        """Return list of up to k (meters, station object) pairs nearest to lon, lat"""
+
+        return self.station_index.spatial.nearest(lon, lat, k=k, max_distance=max_distance)
+
+    def stations_near(self, lon, lat, radius=300):
+        """Return list of (meters, station object) pairs within radius meters of lon, lat"""
+
+        return self.station_index.spatial.within(lon, lat, radius)
+
+    def stations_nearest_many(self, points, k=1, max_distance=None):
+        """Return station_nearest results for each (lon, lat) pair in points"""
+
+        return self.station_index.spatial.nearest_many(points, k=k, max_distance=max_distance)
 
     def all_routes(self):
-        """Return array of route start terminal and end terminal pairs from trips object"""
+        """Return array of route start station and end station pairs from trips object"""
 
-        routes = [(x[2], x[3]) for x in self.trips]
+        start_name = self.csv_header.index("start_name")
+        end_name = self.csv_header.index("end_name")
+        routes = [(x[start_name], x[end_name]) for x in self.trips]
         return routes
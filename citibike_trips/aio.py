@@ -0,0 +1,334 @@
+import asyncio
+import collections
+import inspect
+import json
+import logging
+import time
+from functools import partial
+
+import aiohttp
+
+from . import CitibikeTrips, parse, transport
+
+
+log = logging.getLogger(__name__)
+
+
+class AsyncCitibikeTrips(CitibikeTrips):
+    """asyncio counterpart of CitibikeTrips.
+
+    Network calls are coroutines on one pooled aiohttp session with a per host connection limit. BeautifulSoup parsing
+    and extraction run in an executor so the event loop is never blocked by html5lib. Parsing, hydration and the
+    writers are inherited unchanged from CitibikeTrips, the requests session is not built. The response cache, offline
+    and incremental modes are not supported and raise ValueError.
+
+        async with AsyncCitibikeTrips(username='XXX', password='XXX') as cb:
+            trips = await cb.get_trips(last_page=0)
+    """
+
+    limit_per_host: int
+
+    def __init__(self, *args, http_limit_per_host=4, executor=None, **kwargs):
+        """
+
+        :type http_limit_per_host: int
+        :type executor: concurrent.futures.Executor
+        """
+
+        # checked before CitibikeTrips.__init__ so the response cache is never built
+        options = inspect.signature(CitibikeTrips.__init__).bind(self, *args, **kwargs).arguments
+        unsupported = [_ for _ in ("incremental", "http_cache", "offline") if options.get(_)]
+        if unsupported:
+            raise ValueError("AsyncCitibikeTrips does not support {}".format(", ".join(unsupported)))
+        super().__init__(*args, **kwargs)
+        self.limit_per_host = http_limit_per_host
+        self.executor = executor
+        self.session = None
+
+    def http_session(self):
+        """No requests session, every request goes through the aiohttp session from open()"""
+
+        return None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def open(self):
+        """Create the pooled http session if needed"""
+
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit_per_host=self.limit_per_host, keepalive_timeout=30)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.t),
+                headers={"User-Agent": self.user_agent},
+            )
+            if hasattr(self, "cj"):
+                self.session.cookie_jar.update_cookies({c.name: c.value for c in self.cj})
+        return self.session
+
+    async def close(self):
+        """Close the pooled http session"""
+
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def run(self, func, *args):
+        """Run blocking func in the executor and return its result"""
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args))
+
+    async def parse(self, content):
+        """Parse html in the executor and return soup object"""
+
+        return await self.run(parse.soup, content)
+
+    async def fetch(self, method, url, **kwargs):
+        """Rate limited request returning status code and body bytes.
+
+        GET is retried on 429 and 5xx with the same jittered backoff as the requests session."""
+
+        status, content, wait = await self.fetch_timed(method, url, **kwargs)
+        return status, content
+
+    async def fetch_timed(self, method, url, **kwargs):
+        """fetch returning status code, body bytes and seconds spent waiting on the rate limiter over every attempt"""
+
+        session = await self.open()
+        attempt = 0
+        waited = 0.0
+        while True:
+            wait = await self.limiter.acquire_async()
+            waited += wait
+            t = time.perf_counter()
+            async with session.request(method, url, **kwargs) as res:
+                content = await res.read()
+                retry_after = res.headers.get("Retry-After")
+            self.metrics.request(time.perf_counter() - t, len(content), res.status, wait)
+
+            attempt += 1
+            retry = method in transport.RETRY_METHODS and res.status in transport.RETRY_STATUSES
+            if not retry or attempt > self.retries:
+                return res.status, content, waited
+            delay = transport.backoff_delay(attempt, self.backoff, retry_after)
+            log.info("{} {} status {} retrying in {:.1f}s".format(method, url, res.status, delay))
+            await asyncio.sleep(delay)
+
+    async def login(self):
+        """Login to citibike website and return True or False."""
+
+        log.info("login")
+        status, content = await self.fetch("GET", self.url_login_get)
+        soup = await self.parse(content)
+        self.csrf = soup.find("input", {"name": "_login_csrf_security_token"}).get("value")
+
+        log.debug("Found csrf: {}".format(self.csrf))
+
+        if hasattr(self, "cj"):
+            return True
+
+        payload = {
+            "_username": self.username,
+            "_password": self.password,
+            "_login_csrf_security_token": self.csrf,
+        }
+        status, _ = await self.fetch(
+            "POST", self.url_login_post, data=payload, allow_redirects=False, headers=dict(referer=self.url_login_get)
+        )
+
+        log.debug("POST login status {}".format(status))
+        if status == 200:
+            log.debug("POST login pass")
+            return True
+        elif status == 303:
+            log.warning("POST login fail 303 probably reCAPTCHA")
+            return False
+        else:
+            log.warning("POST login fail")
+            return False
+
+    async def get_account_soup(self):
+        """get profile page and return soup object."""
+
+        status, content = await self.fetch("GET", self.url_profile, headers=dict(referer=self.url_profile))
+        self.soup_profile = await self.parse(content)
+        return self.soup_profile
+
+    async def extract_profile(self):
+        """Request profile page if needed and extract profile data in the executor"""
+
+        if not hasattr(self, "soup_profile"):
+            await self.get_account_soup()
+        return await self.run(super().extract_profile)
+
+    async def get_account(self):
+        """Get account data. Calls login."""
+
+        with self.metrics.phase("login"):
+            if not await self.login():
+                return False
+
+        with self.metrics.phase("profile"):
+            await self.extract_profile()
+        if self.account_dirs and self.keep:
+            self.use_account_dir()
+
+        if self.keep:
+            with self.metrics.phase("save"):
+                await self.run(self.save_account)
+
+        return self.account
+
+    async def get_trips_links(self):
+        """Extract trips link from profile and number of last trips page from first trips page"""
+
+        if not hasattr(self, "soup_profile"):
+            await self.get_account_soup()
+
+        self.extract_trips_link(self.soup_profile)
+        soup = await self.get_trips_soup()
+        self.extract_trips_last(soup)
+        # keep first page so iter_trips_pages does not request it twice
+        self.soup_trips_first = soup
+
+    async def get_trips_soup(self, page_num=1):
+        """Request trip page by number and return parsed html as beautiful soup object or False"""
+
+        content = await self.get_trips_content(page_num)
+        if content is False:
+            return False
+        t = time.perf_counter()
+        soup = await self.parse(content)
+        self.metrics.page(page_num, parse=time.perf_counter() - t)
+        return soup
+
+    async def get_trips_content(self, page_num=1):
+        """Request trip page by number and return raw html bytes or False"""
+
+        page_url = self.gen_trips_url_num(page_num)
+        log.debug("GET trips page url {}".format(page_url))
+        t = time.perf_counter()
+        status, content, wait = await self.fetch_timed("GET", page_url, headers=dict(referer=self.url_profile))
+        self.metrics.page(page_num, fetch=time.perf_counter() - t - wait, wait=wait, bytes=len(content), status=status)
+
+        if status != 200:
+            log.debug("GET trips page {} FAIL".format(page_num))
+            return False
+
+        log.debug("GET trips page {} PASS".format(page_num))
+        self.url_last = page_url
+        return content
+
+    async def get_trips_page(self, page_num):
+        """Request one trips page and return the extracted trips"""
+
+        log.info("get trips page {}".format(page_num))
+        if page_num == 1 and getattr(self, "soup_trips_first", None):
+            soup = self.soup_trips_first
+            self.soup_trips_first = None
+            t = time.perf_counter()
+            trips = await self.run(self.extract_trip_data, soup)
+        elif self.parser == "lxml":
+            content = await self.get_trips_content(page_num)
+            t = time.perf_counter()
+            trips = await self.run(self.extract_trip_data_content, content)
+        else:
+            soup = await self.get_trips_soup(page_num)
+            t = time.perf_counter()
+            trips = await self.run(self.extract_trip_data, soup)
+        self.metrics.page(page_num, parse=time.perf_counter() - t, rows=len(trips))
+        return trips
+
+    async def iter_trips_pages(self, last_page=0):
+        """Async iterator of (page number, trips) from most recent page up to last_page, in page order.
+
+        Pages are requested concurrently up to the per host limit. At most two pages per connection are in flight or
+        waiting to be consumed, so a long history does not start a task for every page up front."""
+
+        if not hasattr(self, "trips_last"):
+            await self.get_trips_links()
+
+        if 0 == last_page:
+            last_page = self.trips_last
+
+        log.info("Grabbing trips from 1 to {}".format(last_page))
+        semaphore = asyncio.Semaphore(self.limit_per_host)
+
+        async def bounded(page_num):
+            async with semaphore:
+                return await self.get_trips_page(page_num)
+
+        pending = collections.deque()
+        try:
+            for tp in range(1, last_page + 1):
+                pending.append((tp, asyncio.ensure_future(bounded(tp))))
+                if len(pending) >= self.limit_per_host * 2:
+                    tp, task = pending.popleft()
+                    yield tp, await task
+            while pending:
+                tp, task = pending.popleft()
+                yield tp, await task
+        finally:
+            for tp, task in pending:
+                task.cancel()
+
+        self.url_last = self.gen_trips_url_num(last_page)
+
+    async def get_trips_loop(self, last_page=0):
+        """Get trip pages starting at most recent up to last_page into self.trips"""
+
+        async for tp, trips in self.iter_trips_pages(last_page=last_page):
+            self.trips.extend(trips)
+
+        log.info("total trips {}".format(len(self.trips)))
+
+    async def get_stations(self, file=None):
+        """Create stations object from net or load from cached file"""
+
+        if file:
+            return await self.run(super().get_stations, file)
+        if await self.run(self.reuse_stations):
+            return
+
+        log.debug("getting stations from {}".format(self.url_stations))
+        status, content = await self.fetch("GET", self.url_stations)
+        self.stations = json.loads(content)
+        self.stations_ts = int(time.time())
+        await self.run(self.keep_stations_checked)
+
+    async def get_trips(self, last_page=0):
+        """Get trips and write data to disk. Calls login."""
+
+        with self.metrics.phase("login"):
+            if not await self.login():
+                return False
+
+        with self.metrics.phase("profile"):
+            await self.extract_profile()
+        if self.account_dirs and self.keep:
+            self.use_account_dir()
+        with self.metrics.phase("trips"):
+            await self.get_trips_loop(last_page=last_page)
+        with self.metrics.phase("stations"):
+            await self.get_stations()
+
+        if self.extended:
+            with self.metrics.phase("hydrate"):
+                await self.run(self.hydrate_trips)
+
+        if self.keep:
+            with self.metrics.phase("save"):
+                await self.run(self.save_account)
+                await self.run(self.save_stations)
+                await self.run(self.save_trips)
+
+        if self.extended:
+            return self.trips_full
+        else:
+            return self.trips
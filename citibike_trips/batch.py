@@ -0,0 +1,147 @@
+"""Run the get_trips pipeline for many accounts in a process pool.
+
+A batch config is json with shared options and a list of accounts, each account overriding the shared options:
+
+    {
+        "keep": "data",
+        "extended": true,
+        "formats": ["json", "sqlite"],
+        "store": "data/citibike_trips.sqlite",
+        "processes": 4,
+        "rate": 2.0,
+        "last_page": 0,
+        "accounts": [
+            {"username": "a@example.com", "password": "xxx"},
+            {"username": "b@example.com", "password": "xxx", "ba": true}
+        ]
+    }
+
+Files for each account land in keep/<account id>/. processes caps how many accounts run at once and rate caps requests
+per second across all of them, split evenly between the processes. With http_cache or offline each account's responses
+are cached in keep/http/ under its username, so the same login may only appear once.
+"""
+import inspect
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import CitibikeTrips
+
+
+log = logging.getLogger(__name__)
+
+DEFAULTS = {"keep": "data", "processes": 2, "rate": None, "last_page": 0}
+
+# batch level options that are not CitibikeTrips arguments
+BATCH_OPTIONS = ("accounts", "processes", "rate", "last_page")
+
+
+def account_options(config):
+    """Return list of per account option dicts from a batch config, with the rate cap split between processes"""
+
+    config = dict(DEFAULTS, **config)
+    accounts = config.get("accounts") or []
+    processes = max(1, min(config["processes"], len(accounts) or 1))
+    shared = {k: v for k, v in config.items() if k not in BATCH_OPTIONS}
+
+    allowed = set(inspect.signature(CitibikeTrips.__init__).parameters) - {"self"}
+    out = []
+    cached = set()
+    for account in accounts:
+        options = dict(shared, **account)
+        unknown = set(options) - allowed - {"last_page"}
+        if unknown:
+            raise ValueError("unknown account options {}".format(", ".join(sorted(unknown))))
+        if options.get("http_cache") or options.get("offline"):
+            # concurrent runs of one login would share its response cache
+            login = options.get("username") or options.get("jar")
+            if login in cached:
+                raise ValueError("account {} appears twice with http_cache or offline".format(login))
+            cached.add(login)
+        options.setdefault("last_page", config["last_page"])
+        if config["rate"]:
+            options["http_rate"] = config["rate"] / processes
+        options["account_dirs"] = True
+        out.append(options)
+    return out, processes
+
+
+def run_account(options):
+    """Run get_trips for one account and return summary dict, never raises so one account can not stop a batch"""
+
+    options = dict(options)
+    last_page = options.pop("last_page", 0)
+    summary = {"username": options.get("username"), "ok": False, "error": None, "pid": os.getpid()}
+    start = time.perf_counter()
+    cb = None
+    try:
+        cb = CitibikeTrips(**options)
+        trips = cb.get_trips(last_page=last_page)
+        if trips is False:
+            summary["error"] = "login failed"
+        else:
+            summary["ok"] = True
+            summary["trips"] = len(trips)
+    except Exception as e:
+        log.exception("account {} failed".format(options.get("username")))
+        summary["error"] = repr(e)
+
+    summary["seconds"] = time.perf_counter() - start
+    if cb is not None:
+        metrics = cb.metrics.as_dict()
+        summary["account_id"] = cb.account_id()
+        summary["data_dir"] = cb.data_dir
+        summary["phases"] = metrics["phases"]
+        summary["requests"] = metrics["requests"]
+    return summary
+
+
+def run_batch(config, processes=None):
+    """Run every account in config and return batch summary dict. processes overrides the config."""
+
+    if processes:
+        config = dict(config, processes=processes)
+    accounts, processes = account_options(config)
+    log.info("running {} accounts in {} processes".format(len(accounts), processes))
+
+    ts = int(time.time())
+    start = time.perf_counter()
+    results = []
+    if processes == 1:
+        results = [run_account(_) for _ in accounts]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = {pool.submit(run_account, _): _["username"] for _ in accounts}
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    # the worker process died, run_account itself never raises
+                    log.error("account {} failed {}".format(futures[future], repr(e)))
+                    results.append({"username": futures[future], "ok": False, "error": repr(e)})
+                log.info("account {} done".format(futures[future]))
+
+    order = {_["username"]: i for i, _ in enumerate(accounts)}
+    results.sort(key=lambda _: order.get(_["username"], len(order)))
+    return {
+        "ts": ts,
+        "seconds": time.perf_counter() - start,
+        "processes": processes,
+        "succeeded": sum(1 for _ in results if _["ok"]),
+        "failed": sum(1 for _ in results if not _["ok"]),
+        "trips": sum(_.get("trips", 0) for _ in results),
+        "accounts": results,
+    }
+
+
+def load_config(file):
+    with open(file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_summary(summary, file):
+    log.info("writing batch summary to {}".format(file))
+    with open(file, "w") as f:
+        f.write(json.dumps(summary, indent=2))
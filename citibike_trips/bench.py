@@ -0,0 +1,242 @@
+"""Microbenchmarks over synthetic pages and trips.
+
+    python -m citibike_trips.bench --sizes 100,1000,10000 --output bench.json
+    python -m citibike_trips.bench --compare bench.json
+
+Each case is run repeat times per size and reported with min and median seconds and min seconds per item, as JSON so
+runs from different commits or library versions can be compared.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import bs4
+from bs4 import BeautifulSoup
+
+from . import CitibikeTrips, parse, synthetic, writers
+
+
+log = logging.getLogger(__name__)
+
+SIZES = (100, 1000, 10000)
+STATIONS = 1000
+
+
+def timeit(func, repeat):
+    """Return list of wall seconds of repeat calls to func, with the gc off like timeit does"""
+
+    times = []
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            t = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - t)
+    finally:
+        if enabled:
+            gc.enable()
+    return times
+
+
+def client(stations, trips=None):
+    """Return CitibikeTrips that never touches the network, loaded with stations and trips"""
+
+    cb = CitibikeTrips("bench", "bench")
+    cb.stations = stations
+    cb.account["id"] = ["ACCT1"]
+    cb.trips = list(trips or [])
+    return cb
+
+
+def cases(size, stations, directory):
+    """Yield (name, items, setup) for one input size, setup returns the function to time"""
+
+    names = [_["properties"]["name"] for _ in stations["features"]]
+    trips = synthetic.trips(size, names=names, seed=size)
+    page = synthetic.trips_page(trips).encode("utf-8")
+    profile = synthetic.profile_page(padding=size // 10).encode("utf-8")
+
+    def parse_trips_html5lib():
+        return lambda: BeautifulSoup(page, "html5lib")
+
+    def extract_trip_data():
+        cb = client(stations)
+        soup = BeautifulSoup(page, "html5lib")
+        return lambda: cb.extract_trip_data(soup)
+
+    def extract_trip_rows_lxml():
+        return lambda: parse.extract_trip_rows(page)
+
+    def extract_profile():
+        cb = client(stations)
+        cb.ba = True
+        cb.soup_profile = BeautifulSoup(profile, "html5lib")
+        return cb.extract_profile
+
+    def hydrate_trips():
+        cb = client(stations, trips)
+        cb.station_index
+
+        def run():
+            # start cold every time so repeats do not just measure time cache hits
+            cb.time_cache.clear()
+            return cb.hydrate_trips()
+
+        return run
+
+    def station_by_name():
+        cb = client(stations)
+        lookup = [_[0] for _ in trips]
+        return lambda: [cb.station_by_name(_) for _ in lookup]
+
+    def station_nearest():
+        cb = client(stations)
+        points = [tuple(_["geometry"]["coordinates"]) for _ in stations["features"]]
+        points = [points[i % len(points)] for i in range(size)]
+        cb.station_index.spatial
+        return lambda: cb.stations_nearest_many(points)
+
+    def write(method, ext, hydrated=False):
+        def setup():
+            cb = client(stations, trips)
+            if hydrated:
+                cb.hydrate_trips()
+            file = os.path.join(directory, "bench{}".format(ext))
+            return lambda: getattr(cb, method)(file)
+
+        return setup
+
+    def write_ndjson():
+        file = os.path.join(directory, "bench.ndjson")
+
+        def run():
+            with writers.TripsNdjsonWriter(file, append=False) as w:
+                w.write(trips)
+
+        return run
+
+    yield "parse_trips_html5lib", size, parse_trips_html5lib
+    yield "extract_trip_data", size, extract_trip_data
+    yield "extract_trip_rows_lxml", size, extract_trip_rows_lxml
+    yield "extract_profile", size // 10, extract_profile
+    yield "hydrate_trips", size, hydrate_trips
+    yield "station_by_name", size, station_by_name
+    yield "station_nearest", size, station_nearest
+    yield "write_trips_csv", size, write("write_trips_csv", ".csv")
+    yield "write_trips_json", size, write("write_trips_json", ".json")
+    yield "write_trips_ndjson", size, write_ndjson
+    yield "write_trips_cbc", size, write("write_trips_cbc", ".cbc")
+    yield "write_trips_full_csv", size, write("write_trips_full_csv", ".full.csv", hydrated=True)
+
+
+def commit():
+    """Return git commit of the working tree or None"""
+
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run(sizes=SIZES, repeat=3, only=None):
+    """Run benchmark cases for each size and return report dict"""
+
+    stations = synthetic.stations_feed(STATIONS)
+    directory = tempfile.mkdtemp(prefix="citibike_bench_")
+    results = []
+    try:
+        for size in sizes:
+            for name, items, setup in cases(size, stations, directory):
+                if only and name not in only:
+                    continue
+                func = setup()
+                times = timeit(func, repeat)
+                best = min(times)
+                log.info("{} size {} min {:.6f}s".format(name, size, best))
+                results.append(
+                    {
+                        "name": name,
+                        "size": size,
+                        "items": items,
+                        "repeat": repeat,
+                        "min": best,
+                        "median": statistics.median(times),
+                        "per_item": best / items if items else None,
+                    }
+                )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        "ts": int(time.time()),
+        "commit": commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "bs4": bs4.__version__,
+        "stations": STATIONS,
+        "results": results,
+    }
+
+
+def compare(old, new):
+    """Return list of (name, size, old min, new min, new / old) for cases in both reports"""
+
+    before = {(_["name"], _["size"]): _["min"] for _ in old["results"]}
+    out = []
+    for _ in new["results"]:
+        key = (_["name"], _["size"])
+        if key in before:
+            out.append((key[0], key[1], before[key], _["min"], _["min"] / before[key] if before[key] else None))
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Citibike trips microbenchmarks.")
+    parser.add_argument(
+        "-s", "--sizes", required=False, type=str, help="Comma separated trip counts. Defaults to 100,1000,10000.",
+    )
+    parser.add_argument("-r", "--repeat", required=False, default=3, type=int, help="Runs per case. Defaults to 3.")
+    parser.add_argument("-k", "--cases", required=False, type=str, help="Comma separated case names to run.")
+    parser.add_argument("-o", "--output", required=False, type=str, help="Write JSON report to file instead of stdout.")
+    parser.add_argument("-c", "--compare", required=False, type=str, help="Print ratios against an earlier report.")
+    parser.add_argument("-v", "--verbose", required=False, action="store_true", help="Log each case as it runs.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    sizes = [int(_) for _ in args.sizes.split(",")] if args.sizes else SIZES
+    only = set(args.cases.split(",")) if args.cases else None
+
+    report = run(sizes=sizes, repeat=args.repeat, only=only)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(json.dumps(report, indent=2))
+    elif not args.compare:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        for name, size, before, after, ratio in compare(old, report):
+            print("{:<24} {:>7} {:>12.6f} {:>12.6f} {:>7.2f}x".format(name, size, before, after, ratio or 0))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
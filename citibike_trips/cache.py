@@ -0,0 +1,199 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+log = logging.getLogger(__name__)
+
+# seconds a stored response is used without asking the server, 0 always revalidates
+TTLS = {
+    "stations": 300,
+    "profile": 0,
+    "trips_first": 0,
+    "trips": 30 * 24 * 3600,
+}
+
+# file in the cache directory keeping the invalidate_on_change markers
+MARKERS = "markers.json"
+
+
+def replace(file, data):
+    """Write bytes to file atomically through a temporary file in the same directory"""
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(file) or ".")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, file)
+
+
+class ResponseCache:
+    """On disk cache of GET responses keyed by url, bodies stored gzip compressed.
+
+    classify maps a url to a ttl class name or None for urls that must never be cached, like the login form with its
+    csrf token. Stale entries are revalidated with If-None-Match and If-Modified-Since when the server sent an ETag
+    or Last-Modified. In offline mode every request is answered from disk and misses get a 504 response."""
+
+    directory: str
+    offline: bool
+    hits: int
+    misses: int
+    revalidated: int
+
+    def __init__(self, directory, classify, ttls=None, offline=False):
+        """
+
+        :type directory: str
+        :type classify: callable
+        :type ttls: dict
+        :type offline: bool
+        """
+
+        self.directory = directory
+        self.classify = classify
+        self.ttls = dict(TTLS, **(ttls or {}))
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, url):
+        """Return path prefix of cache files for url"""
+
+        return os.path.join(self.directory, hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    def load(self, url):
+        """Return (metadata, body) stored for url or (None, None)"""
+
+        path = self.path(url)
+        try:
+            with open(path + ".json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with gzip.open(path + ".gz", "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None, None
+        return meta, body
+
+    def store(self, url, res, body=None):
+        """Write response body and validators for url, replacing files atomically"""
+
+        path = self.path(url)
+        meta = {
+            "url": url,
+            "stored": time.time(),
+            "encoding": res.encoding,
+            "headers": {k: v for k, v in res.headers.items() if k.lower() in ("content-type", "etag", "last-modified")},
+        }
+        if body is not None:
+            replace(path + ".gz", gzip.compress(body))
+        replace(path + ".json", json.dumps(meta).encode("utf-8"))
+
+    @staticmethod
+    def response(url, meta, body, status=200):
+        """Build a requests Response from stored data"""
+
+        res = requests.models.Response()
+        res.url = url
+        res.status_code = status
+        res._content = body
+        res.headers = CaseInsensitiveDict(meta["headers"] if meta else {})
+        res.encoding = meta["encoding"] if meta else None
+        return res
+
+    def get(self, fetch, url, **kwargs):
+        """GET url through the cache, calling fetch(url, **kwargs) when the network is needed"""
+
+        cls = self.classify(url)
+        if cls is None and not self.offline:
+            return fetch(url, **kwargs)
+
+        meta, body = self.load(url)
+        if self.offline:
+            if meta is None:
+                log.warning("offline cache miss {}".format(url))
+                self.misses += 1
+                return self.response(url, None, b"", status=504)
+            self.hits += 1
+            return self.response(url, meta, body)
+
+        if meta is not None and time.time() - meta["stored"] < self.ttls.get(cls, 0):
+            log.debug("cache hit {}".format(url))
+            self.hits += 1
+            return self.response(url, meta, body)
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        validators = CaseInsensitiveDict(meta["headers"] if meta else {})
+        if "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if "last-modified" in validators:
+            headers["If-Modified-Since"] = validators["last-modified"]
+
+        res = fetch(url, headers=headers, **kwargs)
+        if res.status_code == 304 and meta is not None:
+            log.debug("cache revalidated {}".format(url))
+            self.revalidated += 1
+            meta["stored"] = time.time()
+            replace(self.path(url) + ".json", json.dumps(meta).encode("utf-8"))
+            return self.response(url, meta, body)
+
+        self.misses += 1
+        if res.status_code == requests.codes["ok"]:
+            self.store(url, res, res.content)
+        return res
+
+    def invalidate(self, cls, prefix=""):
+        """Remove every stored response of ttl class cls whose url starts with prefix, return how many were removed"""
+
+        removed = 0
+        for name in os.listdir(self.directory):
+            path, ext = os.path.splitext(os.path.join(self.directory, name))
+            if ext != ".json" or name == MARKERS:
+                continue
+            try:
+                with open(path + ".json", "r", encoding="utf-8") as f:
+                    url = json.load(f)["url"]
+            except (OSError, ValueError, KeyError):
+                continue
+            if url.startswith(prefix) and self.classify(url) == cls:
+                for file in (path + ".json", path + ".gz"):
+                    if os.path.exists(file):
+                        os.remove(file)
+                removed += 1
+        return removed
+
+    def invalidate_on_change(self, cls, marker, prefix=""):
+        """Remove stored responses of ttl class cls under url prefix when marker differs from the one given last time.
+
+        For responses only valid while another one is unchanged, like older trips pages, which shift down a page with
+        every new trip. Markers are kept per class and prefix, so the trips pages of one account are never dropped
+        because another account's changed. Never removes anything offline, when there is no way to fetch them again."""
+
+        if self.offline:
+            return 0
+        file = os.path.join(self.directory, MARKERS)
+        try:
+            with open(file, "r", encoding="utf-8") as f:
+                markers = json.load(f)
+        except (OSError, ValueError):
+            markers = {}
+        key = "{} {}".format(cls, prefix) if prefix else cls
+        if markers.get(key) == marker:
+            return 0
+        removed = self.invalidate(cls, prefix)
+        log.info("cache marker for {} changed, removed {} responses".format(key, removed))
+        markers[key] = marker
+        replace(file, json.dumps(markers).encode("utf-8"))
+        return removed
+
+    def info(self):
+        """Return dict of cache counters"""
+
+        return {"hits": self.hits, "misses": self.misses, "revalidated": self.revalidated, "offline": self.offline}
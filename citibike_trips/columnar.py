@@ -0,0 +1,215 @@
+"""Columnar binary snapshots of trips and trips_full.
+
+A .cbc file is laid out as
+
+    8 bytes   magic b"CBCOL001"
+    4 bytes   little endian uint32 length of the metadata
+    metadata  utf-8 json {"rows": n, "columns": [{"name", "kind", "offset", "length", "values"}, ...]}
+    columns   each starting on an 8 byte boundary, offsets are from the first 8 byte boundary after the metadata
+
+Column kinds are
+    "q"     little endian int64, every value an int
+    "d"     little endian float64, every value a float
+    "dict"  little endian int32 codes into the "values" list kept in the metadata, used for strings and mixed columns
+            like start_lon that hold "-" placeholders
+
+Loading memory maps the file. Numeric columns are memoryviews straight onto the map and dict columns decode codes on
+access, so nothing is copied until rows are asked for.
+"""
+import array
+import json
+import logging
+import mmap
+import struct
+import sys
+from collections.abc import Sequence
+
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"CBCOL001"
+ALIGN = 8
+
+
+def column_kind(values):
+    """Pick storage kind for a list of values"""
+
+    if values and all(type(_) is int for _ in values):
+        return "q"
+    if values and all(type(_) is float for _ in values):
+        return "d"
+    return "dict"
+
+
+def encode_dict(values):
+    """Dictionary encode values, return (distinct values list, int32 codes array)"""
+
+    lookup = {}
+    distinct = []
+    codes = array.array("i")
+    for value in values:
+        try:
+            key = (type(value), value)
+            code = lookup.get(key)
+        except TypeError:
+            # unhashable like a coordinates list
+            key = (type(value), json.dumps(value))
+            code = lookup.get(key)
+        if code is None:
+            code = lookup[key] = len(distinct)
+            distinct.append(value)
+        codes.append(code)
+    return distinct, codes
+
+
+def little_endian(arr):
+    """Return bytes of array in little endian order"""
+
+    if sys.byteorder != "little":
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def write_columnar(file, header, columns):
+    """Write dict of columns keyed by header names to file in the .cbc layout"""
+
+    rows = len(columns[header[0]]) if header else 0
+    blocks = []
+    meta = {"rows": rows, "columns": []}
+    for name in header:
+        values = list(columns[name])
+        kind = column_kind(values)
+        column = {"name": name, "kind": kind}
+        if kind == "dict":
+            column["values"], data = encode_dict(values)
+        else:
+            data = array.array(kind, values)
+        blocks.append(little_endian(data))
+        meta["columns"].append(column)
+
+    position = 0
+    for column, block in zip(meta["columns"], blocks):
+        column["offset"] = position
+        column["length"] = len(block)
+        position = align(position + len(block))
+    encoded = json.dumps(meta).encode("utf-8")
+
+    log.info("writing columnar {} rows to {}".format(rows, file))
+    with open(file, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(encoded)))
+        f.write(encoded)
+        start = align(f.tell())
+        for column, block in zip(meta["columns"], blocks):
+            f.write(b"\0" * (start + column["offset"] - f.tell()))
+            f.write(block)
+
+
+def align(position):
+    return (position + ALIGN - 1) // ALIGN * ALIGN
+
+
+def rows_to_columns(rows, header):
+    """Transpose list of row sequences into dict of column lists"""
+
+    if not rows:
+        return {name: [] for name in header}
+    return {name: list(values) for name, values in zip(header, zip(*rows))}
+
+
+class DictColumn(Sequence):
+    """Read only sequence decoding int32 codes against a values list"""
+
+    def __init__(self, codes, values):
+        self.codes = codes
+        self.values = values
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.values[_] for _ in self.codes[i]]
+        return self.values[self.codes[i]]
+
+    def __iter__(self):
+        return map(self.values.__getitem__, self.codes)
+
+
+class ColumnarSnapshot:
+    """Memory mapped .cbc file. columns maps header names to zero copy column sequences."""
+
+    file: str
+    rows: int
+    header: tuple
+    columns: dict
+
+    def __init__(self, file):
+        """
+
+        :type file: str
+        """
+
+        self.file = file
+        self.f = open(file, "rb")
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.mm)
+
+        if view[: len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError("{} is not a columnar snapshot".format(file))
+        (size,) = struct.unpack_from("<I", self.mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        meta = json.loads(bytes(view[start : start + size]).decode("utf-8"))
+        base = align(start + size)
+
+        self.rows = meta["rows"]
+        self.header = tuple(_["name"] for _ in meta["columns"])
+        self.columns = {}
+        for column in meta["columns"]:
+            offset = base + column["offset"]
+            data = view[offset : offset + column["length"]]
+            if column["kind"] == "dict":
+                self.columns[column["name"]] = DictColumn(self.cast(data, "i"), column["values"])
+            else:
+                self.columns[column["name"]] = self.cast(data, column["kind"])
+
+    @staticmethod
+    def cast(data, typecode):
+        """Cast little endian bytes to typed sequence, copying only on big endian hosts"""
+
+        if sys.byteorder == "little":
+            return data.cast(typecode)
+        arr = array.array(typecode, data.tobytes())
+        arr.byteswap()
+        return arr
+
+    def __len__(self):
+        return self.rows
+
+    def iter_rows(self):
+        """Generator of row tuples in header order"""
+
+        return zip(*(self.columns[_] for _ in self.header))
+
+    def to_rows(self):
+        """Materialize all rows as a list of tuples"""
+
+        return list(self.iter_rows())
+
+    def close(self):
+        """Release column views and the memory map"""
+
+        self.columns = {}
+        try:
+            self.mm.close()
+        except BufferError:
+            log.debug("columns of {} still referenced, leaving map open".format(self.file))
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
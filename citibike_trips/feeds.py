@@ -0,0 +1,255 @@
+"""Content addressed history of the stations feed.
+
+Every distinct feed is identified by the sha256 of its canonical json. Only the first feed and every keyframe_interval
+changes after it are stored in full, the rest are stored as a delta against the previous distinct feed:
+
+    {
+        "parent": "<hash>",
+        "meta": {...},                      top level keys other than features
+        "added": [feature, ...],
+        "removed": [station_id, ...],
+        "renamed": {station_id: name},
+        "moved": {station_id: geometry},
+        "changed": {station_id: feature},  any other difference, whole feature
+        "order": [station_id, ...]          only when order is not parent order with added appended
+    }
+
+Files live in one directory as <hash>.json.gz or <hash>.delta.json.gz next to index.json, which lists the timestamp
+each distinct feed was first seen and when the feed was last downloaded.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+
+from .cache import replace
+
+
+log = logging.getLogger(__name__)
+
+
+def feed_hash(stations):
+    """Return sha256 hex digest of the canonical json of a stations feed"""
+
+    return hashlib.sha256(json.dumps(stations, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def feed_features(stations):
+    """Return OrderedDict of features keyed by station_id or None if an id is missing or repeats"""
+
+    out = OrderedDict()
+    for feature in stations.get("features") or []:
+        try:
+            key = feature["properties"]["station_id"]
+        except (KeyError, TypeError):
+            return None
+        if key in out:
+            return None
+        out[key] = feature
+    return out
+
+
+def diff_feeds(old, new):
+    """Return delta turning stations feed old into new, None when features can not be keyed by station_id"""
+
+    before = feed_features(old)
+    after = feed_features(new)
+    if before is None or after is None:
+        return None
+
+    delta = {
+        "meta": {k: v for k, v in new.items() if k != "features"},
+        "added": [f for k, f in after.items() if k not in before],
+        "removed": [k for k in before if k not in after],
+        "renamed": {},
+        "moved": {},
+        "changed": {},
+    }
+    for key, feature in after.items():
+        previous = before.get(key)
+        if previous is None or previous == feature:
+            continue
+        rest = dict(feature, geometry=None, properties=dict(feature.get("properties"), name=None))
+        previous_rest = dict(previous, geometry=None, properties=dict(previous.get("properties"), name=None))
+        if rest != previous_rest:
+            delta["changed"][key] = feature
+            continue
+        if feature["properties"].get("name") != previous["properties"].get("name"):
+            delta["renamed"][key] = feature["properties"].get("name")
+        if feature.get("geometry") != previous.get("geometry"):
+            delta["moved"][key] = feature.get("geometry")
+
+    expected = [k for k in before if k in after] + [f["properties"]["station_id"] for f in delta["added"]]
+    if expected != list(after):
+        delta["order"] = list(after)
+    return delta
+
+
+def apply_delta(old, delta):
+    """Return new stations feed from old and a delta made by diff_feeds, old is not modified"""
+
+    features = feed_features(old)
+    for key in delta["removed"]:
+        del features[key]
+    for key, name in delta["renamed"].items():
+        feature = features[key]
+        features[key] = dict(feature, properties=dict(feature["properties"], name=name))
+    for key, geometry in delta["moved"].items():
+        features[key] = dict(features[key], geometry=geometry)
+    for key, feature in delta["changed"].items():
+        features[key] = feature
+    for feature in delta["added"]:
+        features[feature["properties"]["station_id"]] = feature
+
+    order = delta.get("order") or list(features)
+    return dict(delta["meta"], features=[features[_] for _ in order])
+
+
+def delta_size(delta):
+    """Return dict of change counts in a delta"""
+
+    return {_: len(delta[_]) for _ in ("added", "removed", "renamed", "moved", "changed")}
+
+
+class StationFeedStore:
+    """Directory of station feeds stored once per distinct content, mostly as deltas.
+
+    Reconstructed feeds are kept in a small LRU so hydrating against recent history does not replay delta chains.
+    Feeds returned are shared and must be treated as read only."""
+
+    directory: str
+    keyframe_interval: int
+
+    def __init__(self, directory, keyframe_interval=30, maxsize=8):
+        """
+
+        :type directory: str
+        :type keyframe_interval: int
+        :type maxsize: int
+        """
+
+        self.directory = directory
+        self.keyframe_interval = keyframe_interval
+        self.maxsize = maxsize
+        self.feeds = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+        self.index = self.read_index()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def read_index(self):
+        try:
+            with open(self.path("index.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"checked": None, "snapshots": [], "objects": {}}
+
+    def write_index(self):
+        replace(self.path("index.json"), json.dumps(self.index).encode("utf-8"))
+
+    def write_object(self, name, obj):
+        replace(self.path(name), gzip.compress(json.dumps(obj).encode("utf-8")))
+
+    def read_object(self, name):
+        with gzip.open(self.path(name), "rb") as f:
+            return json.loads(f.read().decode("utf-8"))
+
+    def latest_hash(self):
+        return self.index["snapshots"][-1][1] if self.index["snapshots"] else None
+
+    def remember(self, digest, stations):
+        self.feeds[digest] = stations
+        self.feeds.move_to_end(digest)
+        while len(self.feeds) > self.maxsize:
+            self.feeds.popitem(last=False)
+
+    def save(self, stations, ts):
+        """Record stations feed downloaded at ts, writing it only when it differs from the latest. Returns hash."""
+
+        digest = feed_hash(stations)
+        parent = self.latest_hash()
+        self.index["checked"] = max(ts, self.index["checked"] or ts)
+        if digest == parent:
+            log.debug("stations feed unchanged {}".format(digest))
+            self.write_index()
+            return digest
+
+        if digest not in self.index["objects"]:
+            delta = None
+            depth = self.index["objects"][parent]["depth"] + 1 if parent else 0
+            if parent and depth < self.keyframe_interval:
+                delta = diff_feeds(self.load_hash(parent), stations)
+                # keep a keyframe if the delta does not round trip exactly
+                if delta is not None and feed_hash(apply_delta(self.load_hash(parent), delta)) != digest:
+                    delta = None
+            if delta is None:
+                log.info("storing stations keyframe {}".format(digest))
+                self.write_object("{}.json.gz".format(digest), stations)
+                self.index["objects"][digest] = {"parent": None, "depth": 0}
+            else:
+                log.info("storing stations delta {} {}".format(digest, delta_size(delta)))
+                delta["parent"] = parent
+                self.write_object("{}.delta.json.gz".format(digest), delta)
+                self.index["objects"][digest] = {"parent": parent, "depth": depth}
+
+        self.index["snapshots"].append([ts, digest])
+        self.write_index()
+        self.remember(digest, stations)
+        return digest
+
+    def load_hash(self, digest):
+        """Return stations feed with content hash, replaying deltas from the nearest keyframe or cached feed"""
+
+        chain = []
+        while digest not in self.feeds and self.index["objects"][digest]["parent"] is not None:
+            chain.append(digest)
+            digest = self.index["objects"][digest]["parent"]
+
+        stations = self.feeds.get(digest) or self.read_object("{}.json.gz".format(digest))
+        self.remember(digest, stations)
+        for digest in reversed(chain):
+            stations = apply_delta(stations, self.read_object("{}.delta.json.gz".format(digest)))
+            self.remember(digest, stations)
+        return stations
+
+    def hash_at(self, ts=None):
+        """Return hash of the feed current at ts, latest when ts is None, None before the first snapshot"""
+
+        current = None
+        for seen, digest in self.index["snapshots"]:
+            if ts is not None and seen > ts:
+                break
+            current = digest
+        return current
+
+    def load(self, ts=None):
+        """Return stations feed current at ts or the latest, None when nothing is stored"""
+
+        digest = self.hash_at(ts)
+        return self.load_hash(digest) if digest else None
+
+    def fresh(self, ttl, now):
+        """Return latest stations feed when it was last downloaded less than ttl seconds before now, else None"""
+
+        checked = self.index["checked"]
+        if not ttl or checked is None or now - checked >= ttl:
+            return None
+        return self.load()
+
+    def changes(self):
+        """Return list of (ts, delta) for every change after the first snapshot, computed when stored as keyframe"""
+
+        out = []
+        previous = None
+        for ts, digest in self.index["snapshots"]:
+            if previous is not None and previous != digest:
+                if self.index["objects"][digest]["parent"] == previous:
+                    delta = self.read_object("{}.delta.json.gz".format(digest))
+                else:
+                    delta = diff_feeds(self.load_hash(previous), self.load_hash(digest))
+                out.append((ts, delta))
+            previous = digest
+        return out
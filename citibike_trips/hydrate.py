@@ -0,0 +1,437 @@
+import datetime
+import functools
+import logging
+import math
+import re
+
+from .records import TRIP_FIELDS
+from .stations import EARTH_RADIUS_M
+
+
+log = logging.getLogger(__name__)
+
+METERS_PER_MILE = 1609.344
+
+
+def str_to_secs(st):
+    """convert string of minutes and seconds to seconds"""
+
+    # TODO need to support '1 h 26 min 55 s'
+    m, sm, s, ss = st.split(" ")
+    secs = int(s) + int(m) * 60
+    return secs
+
+
+def dollars_to_float(st):
+    """convert us currency string to float"""
+
+    dollars = float(st[2:])
+    return dollars
+
+
+def convert_unique(values, func):
+    """Apply func once per distinct value and return dict of results, None where func raised"""
+
+    out = {}
+    for value in set(values):
+        try:
+            out[value] = func(value)
+        except Exception:
+            out[value] = None
+    return out
+
+
+UNRESOLVED = ("-", "-", "-", "-")
+
+
+def station_fields(station):
+    """Return (station_id, terminal, lon, lat) from station object or None if incomplete"""
+
+    try:
+        return (
+            station["properties"]["station_id"],
+            station["properties"]["terminal"],
+            station["geometry"]["coordinates"][0],
+            station["geometry"]["coordinates"][1],
+        )
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def localize(time_string, fmt, tz, is_dst=False):
+    """Parse time string in tz and return (epoch, iso8601)"""
+
+    dtz = tz.localize(datetime.datetime.strptime(time_string, fmt), is_dst=is_dst)
+    return int(dtz.timestamp()), dtz.isoformat()
+
+
+# layout TimeCache can slice instead of calling strptime, 12 hour clock with AM or PM
+FAST_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+FAST_PATTERN = re.compile(r"([01]\d)/([0-3]\d)/(\d{4}) (0[1-9]|1[0-2]):([0-5]\d):([0-5]\d) ([AaPp])[Mm]")
+# FAST_PATTERN split at [:14] into date and hour and [14:] into minute, second and AM or PM
+HEAD_PATTERN = re.compile(r"([01]\d)/([0-3]\d)/(\d{4}) (0[1-9]|1[0-2]):")
+TAIL_PATTERN = re.compile(r"([0-5]\d):([0-5]\d) ([AaPp])[Mm]")
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+HOURS = tuple("{:02d}:".format(_) for _ in range(24))
+
+
+class TimeCache:
+    """Bounded LRU cache converting raw trip time strings to (epoch, iso8601) in a timezone.
+
+    Strings in the fixed citibike layout skip strptime: fields are sliced out and the utc offset is looked up once per
+    local date, or once per hour on a date whose offset changes. That is exact because US zones change offset at most
+    once a day and only on the hour, and ambiguous or skipped times around a DST change resolve with the same is_dst
+    flag pytz localize uses, False by default. Other layouts go through strptime and localize. Hit and miss counters
+    are available from info(). tz may be a zone name, then pytz is only imported when the first time is converted."""
+
+    maxsize: int
+    is_dst: bool
+
+    def __init__(self, tz, fmt=FAST_FORMAT, maxsize=65536, is_dst=False):
+        """
+
+        :type tz: pytz.tzinfo.BaseTzInfo or str
+        :type fmt: str
+        :type maxsize: int
+        :type is_dst: bool
+        """
+
+        self._tz = tz
+        self.fmt = fmt
+        self.maxsize = maxsize
+        self.is_dst = is_dst
+        self.match = FAST_PATTERN.fullmatch if fmt == FAST_FORMAT else None
+        self.days = {}
+        self.offsets = {}
+        # convert_column lookups for the two halves of a time string, kept across columns
+        self.heads = {}, {}, {}
+        self.tails = {}, {}, {}
+        self.sliced = 0
+        self.convert = functools.lru_cache(maxsize=maxsize)(self.parse)
+
+    @property
+    def tz(self):
+        if isinstance(self._tz, str):
+            import pytz
+
+            self._tz = pytz.timezone(self._tz)
+        return self._tz
+
+    def hour_offset(self, year, month, day, hour):
+        """Return (epoch of the local hour, iso8601 up to the hour, utc offset suffix)"""
+
+        # raises ValueError for impossible dates like strptime would
+        dtz = self.tz.localize(datetime.datetime(year, month, day, hour), is_dst=self.is_dst)
+        iso = dtz.isoformat()
+        offset = int(dtz.utcoffset().total_seconds())
+        return (dtz.toordinal() - EPOCH_ORDINAL) * 86400 + hour * 3600 - offset, iso[:11], iso[19:]
+
+    @staticmethod
+    def ymd(date):
+        return int(date[6:10]), int(date[:2]), int(date[3:5])
+
+    def day_offset(self, date):
+        """Return hour_offset of midnight when the whole local date has one offset, else None"""
+
+        first = self.hour_offset(*self.ymd(date), 0)
+        last = self.hour_offset(*self.ymd(date), 23)
+        return first if last[0] - first[0] == 23 * 3600 and last[2] == first[2] else None
+
+    def parse(self, ts):
+        """Convert one time string without the LRU cache, raises ValueError like strptime"""
+
+        m = self.match(ts) if self.match else None
+        if not m:
+            return localize(ts, self.fmt, self.tz, self.is_dst)
+
+        # 12 AM is the first hour of the day and 12 PM the thirteenth
+        hour = int(ts[11:13]) % 12 + (12 if ts[20] in "Pp" else 0)
+        seconds = int(ts[14:16]) * 60 + int(ts[17:19])
+        date = ts[:10]
+        try:
+            day = self.days[date]
+        except KeyError:
+            if len(self.days) >= self.maxsize:
+                self.days.clear()
+            day = self.days[date] = self.day_offset(date)
+        if day is None:
+            try:
+                day = self.offsets[date, hour]
+            except KeyError:
+                if len(self.offsets) >= self.maxsize:
+                    self.offsets.clear()
+                day = self.offsets[date, hour] = self.hour_offset(*self.ymd(date), hour)
+        else:
+            seconds += hour * 3600
+        base, prefix, suffix = day
+        return base + seconds, prefix + HOURS[hour] + ts[14:19] + suffix
+
+    def convert_column(self, values):
+        """Convert a column of time strings and return lists of epochs and iso8601 strings, None where one fails.
+
+        Each value is split into date and hour, which repeat once per hour of history, and minute, second and AM or
+        PM, which repeat every hour. Each distinct half is checked and worked out once and kept, so most values come
+        out of a few dict lookups. Values on a date whose offset changes, in another layout or that do not parse go
+        through convert one at a time."""
+
+        values = list(values)
+        if not self.match or set(map(type, values)) != {str}:
+            return self.convert_each(values)
+
+        heads = [_[:14] for _ in values]
+        tails = [_[14:] for _ in values]
+        # head: epoch of the hour read as AM, iso8601 up to the hour for AM and PM, utc offset suffix
+        head_epoch, head_iso, head_suffix = self.heads
+        # tail: seconds into the hour plus 12 hours for PM, 1 for PM else 0, minutes and seconds
+        tail_seconds, tail_pm, tail_text = self.tails
+        new_heads = set(heads).difference(head_epoch)
+        if len(head_epoch) + len(new_heads) > self.maxsize:
+            for _ in self.heads:
+                _.clear()
+            new_heads = set(heads)
+        for head in new_heads:
+            m = HEAD_PATTERN.fullmatch(head)
+            if not m:
+                continue
+            date = head[:10]
+            if date not in self.days:
+                if len(self.days) >= self.maxsize:
+                    self.days.clear()
+                try:
+                    self.days[date] = self.day_offset(date)
+                except ValueError:
+                    self.days[date] = None
+            day = self.days[date]
+            if day is not None:
+                # 12 AM is the first hour of the day and 12 PM the thirteenth
+                hour = int(m.group(4)) % 12
+                head_epoch[head] = day[0] + hour * 3600
+                head_iso[head] = day[1] + HOURS[hour], day[1] + HOURS[hour + 12]
+                head_suffix[head] = day[2]
+        for tail in set(tails).difference(tail_pm):
+            m = TAIL_PATTERN.fullmatch(tail)
+            if m:
+                pm = 1 if m.group(3) in "Pp" else 0
+                tail_seconds[tail] = int(m.group(1)) * 60 + int(m.group(2)) + pm * 43200
+                tail_pm[tail] = pm
+                tail_text[tail] = tail[:5]
+
+        sliced = [h in head_epoch and t in tail_pm for h, t in zip(heads, tails)]
+        epochs = [head_epoch[h] + tail_seconds[t] if ok else None for h, t, ok in zip(heads, tails, sliced)]
+        isos = [
+            head_iso[h][tail_pm[t]] + tail_text[t] + head_suffix[h] if ok else None
+            for h, t, ok in zip(heads, tails, sliced)
+        ]
+        self.sliced += sum(sliced)
+
+        if not all(sliced):
+            for i, (value, ok) in enumerate(zip(values, sliced)):
+                if not ok:
+                    try:
+                        epochs[i], isos[i] = self.convert(value)
+                    except ValueError:
+                        pass
+        return epochs, isos
+
+    def convert_each(self, values):
+        """convert_column one value at a time through convert"""
+
+        epochs = []
+        isos = []
+        for value in values:
+            try:
+                epoch, iso = self.convert(value)
+            except ValueError:
+                epoch = iso = None
+            epochs.append(epoch)
+            isos.append(iso)
+        return epochs, isos
+
+    def info(self):
+        """Return dict of cache hits, misses and sizes"""
+
+        _ = self.convert.cache_info()
+        return {
+            "hits": _.hits,
+            "misses": _.misses,
+            "size": _.currsize,
+            "maxsize": _.maxsize,
+            "sliced": self.sliced,
+            "days": len(self.days),
+            "hours": len(self.offsets),
+        }
+
+    def clear(self):
+        """Empty the caches and reset counters"""
+
+        self.convert.cache_clear()
+        self.days.clear()
+        self.offsets.clear()
+        for _ in self.heads + self.tails:
+            _.clear()
+        self.sliced = 0
+
+
+class DistanceCache:
+    """Bounded cache of great circle meters between station coordinate pairs.
+
+    Keys are (start lon, start lat, end lon, end lat) so a station that moves gets a new entry instead of a stale one.
+    distances() works out all missing pairs in one pass with radians and cosines computed once per distinct point, so
+    a history riding the same routes over and over pays for each route once. Same formula as stations.haversine."""
+
+    maxsize: int
+
+    def __init__(self, maxsize=65536):
+        """
+
+        :type maxsize: int
+        """
+
+        self.maxsize = maxsize
+        self.meters = {}
+        self.hits = 0
+        self.misses = 0
+
+    def distances(self, pairs):
+        """Return dict of meters for each distinct (lon1, lat1, lon2, lat2) in pairs"""
+
+        pairs = set(pairs)
+        missing = [_ for _ in pairs if _ not in self.meters]
+        if len(self.meters) + len(missing) > self.maxsize:
+            self.meters.clear()
+            missing = list(pairs)
+        self.hits += len(pairs) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            points = {}
+            for lon1, lat1, lon2, lat2 in missing:
+                points[lon1, lat1] = points[lon2, lat2] = None
+            for lon, lat in points:
+                points[lon, lat] = (math.radians(lon), math.radians(lat), math.cos(math.radians(lat)))
+
+            sin, asin, sqrt = math.sin, math.asin, math.sqrt
+            diameter = 2 * EARTH_RADIUS_M
+            for pair in missing:
+                lon1, lat1, cos1 = points[pair[0], pair[1]]
+                lon2, lat2, cos2 = points[pair[2], pair[3]]
+                a = sin((lat2 - lat1) / 2) ** 2 + cos1 * cos2 * sin((lon2 - lon1) / 2) ** 2
+                self.meters[pair] = diameter * asin(min(1.0, sqrt(a)))
+
+        return {_: self.meters[_] for _ in pairs}
+
+    def info(self):
+        """Return dict of cache hits, misses and size"""
+
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.meters), "maxsize": self.maxsize}
+
+    def clear(self):
+        self.meters.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def distance_columns(start_station, end_station, ok, seconds, cache):
+    """Return dict of miles and mph columns from station_fields of both ends.
+
+    Trips where either station did not resolve get '-' like the other station columns, and mph is also '-' without
+    a duration. Round trips come out as 0 miles since only the stations are known, not the path ridden."""
+
+    coords = [(s[2], s[3], e[2], e[3]) if good else None for s, e, good in zip(start_station, end_station, ok)]
+    meters = cache.distances(_ for _ in coords if _ is not None)
+    trip_meters = [meters[_] if _ is not None else None for _ in coords]
+    return {
+        "miles": [round(m / METERS_PER_MILE, 3) if m is not None else "-" for m in trip_meters],
+        "mph": [
+            round(m / METERS_PER_MILE * 3600 / s, 1) if m is not None and s else "-" for m, s in zip(trip_meters, seconds)
+        ],
+    }
+
+
+def hydrate_columns(trips, station_by_name, account_id, observed, times, distances=None):
+    """Hydrate trips column at a time and return dict of columns keyed by csv_header_full names.
+
+    Station names, billed amounts and durations repeat heavily across a history, so each distinct value is converted
+    once and the columns are filled by lookup. Times go through TimeCache.convert_column. Values match the original
+    row at a time hydrate: a side whose station, billed amount or duration does not resolve gets '-' placeholders, and
+    dollars and seconds come from the end side with 0.0 and 0 when it fails. Unparseable start times raise ValueError
+    as before, an unparseable end time gets '-'. With a distances DistanceCache miles and mph columns are added too."""
+
+    n = len(trips)
+    # trips are scraped rows in TRIP_FIELDS order, everything below goes by field name
+    scraped = dict(zip(TRIP_FIELDS, zip(*trips))) if n else dict.fromkeys(TRIP_FIELDS, ())
+    start_time = scraped["start_time"]
+    end_time = scraped["end_time"]
+    start_name = scraped["start_name"]
+    end_name = scraped["end_name"]
+    billed = scraped["billed"]
+    duration = scraped["duration"]
+
+    stations = {_: station_fields(station_by_name(_)) for _ in set(start_name) | set(end_name)}
+    dollars = convert_unique(billed, dollars_to_float)
+    seconds = convert_unique(duration, str_to_secs)
+    log.debug(
+        "hydrating {} trips from {} stations {} amounts {} durations".format(
+            n, len(stations), len(dollars), len(seconds)
+        )
+    )
+
+    start_epoch, start_iso = times.convert_column(start_time)
+    if None in start_epoch:
+        # raise the ValueError of the first start time that did not parse
+        times.convert(start_time[start_epoch.index(None)])
+    end_epoch, end_iso = times.convert_column(end_time)
+    start_station = [stations[_] for _ in start_name]
+    end_station = [stations[_] for _ in end_name]
+    trip_dollars = [dollars[_] for _ in billed]
+    trip_seconds = [seconds[_] for _ in duration]
+    money_ok = [d is not None and s is not None for d, s in zip(trip_dollars, trip_seconds)]
+    start_ok = [s is not None and ok for s, ok in zip(start_station, money_ok)]
+    end_ok = [s is not None and ok for s, ok in zip(end_station, money_ok)]
+
+    def side(stations, ok):
+        # station_fields of each trip or '-' placeholders, transposed into id, terminal, lon and lat columns
+        if not stations:
+            return [], [], [], []
+        return [list(_) for _ in zip(*[s if good else UNRESOLVED for s, good in zip(stations, ok)])]
+
+    start_id, start_terminal, start_lon, start_lat = side(start_station, start_ok)
+    end_id, end_terminal, end_lon, end_lat = side(end_station, end_ok)
+
+    columns = {
+        "account_id": [account_id] * n,
+        "observed": [observed] * n,
+        "start_time": list(start_time),
+        "end_time": list(end_time),
+        "start_name": list(start_name),
+        "end_name": list(end_name),
+        "start_points": list(scraped["start_points"]),
+        "end_points": list(scraped["end_points"]),
+        "points": list(scraped["points"]),
+        "billed": list(billed),
+        "duration": list(duration),
+        "start_id": start_id,
+        "end_id": end_id,
+        "start_terminal": start_terminal,
+        "end_terminal": end_terminal,
+        "start_lon": start_lon,
+        "start_lat": start_lat,
+        "end_lon": end_lon,
+        "end_lat": end_lat,
+        "dollars": [d if ok else 0.0 for d, ok in zip(trip_dollars, end_ok)],
+        "seconds": [s if ok else 0 for s, ok in zip(trip_seconds, end_ok)],
+        "start_epoch": start_epoch,
+        "end_epoch": [t if t is not None and ok else "-" for t, ok in zip(end_epoch, end_ok)],
+        "start_iso8601": start_iso,
+        "end_iso8601": [t if t is not None and ok else "-" for t, ok in zip(end_iso, end_ok)],
+    }
+    if distances is not None:
+        ok = [a and b for a, b in zip(start_ok, end_ok)]
+        columns.update(distance_columns(start_station, end_station, ok, columns["seconds"], distances))
+    return columns
+
+
+def columns_to_rows(columns, header):
+    """Convert dict of columns into list of row tuples in header order"""
+
+    return list(zip(*(columns[h] for h in header)))
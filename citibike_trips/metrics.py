@@ -0,0 +1,166 @@
+import contextlib
+import json
+import logging
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+class Metrics:
+    """Wall and CPU time per phase plus per request and per trips page counters for one run.
+
+    Phases nest, so get_trips covers login, trips and the rest. CPU time is process time and includes every thread,
+    so it can exceed wall time when pages are fetched and parsed concurrently. Safe to update from worker threads."""
+
+    ts: int
+    phases: dict
+    pages: dict
+    requests: dict
+    connections: dict
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ts = int(time.time())
+        self.phases = {}
+        self.pages = {}
+        self.requests = {"count": 0, "bytes": 0, "seconds": 0.0, "wait": 0.0, "errors": 0}
+        self.connections = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager adding wall and cpu time of the block to phase name"""
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            with self.lock:
+                _ = self.phases.setdefault(name, {"count": 0, "wall": 0.0, "cpu": 0.0})
+                _["count"] += 1
+                _["wall"] += wall
+                _["cpu"] += cpu
+            log.debug("phase {} wall {:.3f}s cpu {:.3f}s".format(name, wall, cpu))
+
+    def request(self, seconds, size, status, wait=0.0):
+        """Count one http request that reached the network"""
+
+        with self.lock:
+            self.requests["count"] += 1
+            self.requests["bytes"] += size
+            self.requests["seconds"] += seconds
+            self.requests["wait"] += wait
+            if status >= 400:
+                self.requests["errors"] += 1
+
+    def page(self, page_num, **values):
+        """Add values like fetch, wait, bytes, parse and rows to the record for a trips page.
+
+        fetch is the time on the network and wait the time the rate limiter held the request back before it."""
+
+        with self.lock:
+            _ = self.pages.setdefault(page_num, {"page": page_num})
+            for key, value in values.items():
+                _[key] = _.get(key, 0) + value if isinstance(value, (int, float)) else value
+
+    def as_dict(self):
+        """Return plain dict of everything recorded, pages in page order"""
+
+        with self.lock:
+            pages = [dict(self.pages[_]) for _ in sorted(self.pages)]
+            totals = {key: sum(_.get(key, 0) for _ in pages) for key in ("fetch", "wait", "bytes", "parse", "rows")}
+            totals["pages"] = len(pages)
+            return {
+                "ts": self.ts,
+                "phases": {k: dict(v) for k, v in self.phases.items()},
+                "requests": dict(self.requests),
+                "pages": pages,
+                "totals": totals,
+                "connections": dict(self.connections),
+            }
+
+    def write_json(self, file):
+        log.info("writing metrics json to {}".format(file))
+        with open(file, "w") as f:
+            f.write(json.dumps(self.as_dict(), indent=2))
+
+    def prometheus(self, prefix="citibike_trips", labels=None):
+        """Return metrics in the Prometheus text exposition format"""
+
+        data = self.as_dict()
+        base = dict(labels or {})
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.append("# HELP {}_{} {}".format(prefix, name, help))
+            lines.append("# TYPE {}_{} {}".format(prefix, name, kind))
+            for extra, value in samples:
+                _ = dict(base, **extra)
+                label = "{" + ",".join('{}="{}"'.format(k, escape_label(v)) for k, v in sorted(_.items())) + "}"
+                lines.append("{}_{}{} {}".format(prefix, name, label if _ else "", value))
+
+        phases = sorted(data["phases"].items())
+        metric(
+            "phase_seconds",
+            "gauge",
+            "Seconds spent in each phase of the run by clock.",
+            [({"phase": k, "clock": c}, v[c]) for k, v in phases for c in ("wall", "cpu")],
+        )
+        metric("phase_runs", "gauge", "Times each phase ran.", [({"phase": k}, v["count"]) for k, v in phases])
+
+        requests = data["requests"]
+        metric("http_requests_total", "counter", "HTTP requests sent.", [({}, requests["count"])])
+        metric("http_errors_total", "counter", "HTTP responses with status 400 or above.", [({}, requests["errors"])])
+        metric("http_response_bytes_total", "counter", "HTTP response body bytes.", [({}, requests["bytes"])])
+        metric(
+            "http_request_seconds_total", "counter", "Seconds waiting on HTTP responses.", [({}, requests["seconds"])]
+        )
+        metric(
+            "http_rate_limit_wait_seconds_total",
+            "counter",
+            "Seconds held by the rate limiter.",
+            [({}, requests["wait"])],
+        )
+
+        connections = data["connections"]
+        if connections:
+            metric("http_connections_total", "counter", "Connections opened.", [({}, connections["connections"])])
+            metric(
+                "http_connections_reused_total",
+                "counter",
+                "Requests sent over an already open connection.",
+                [({}, connections["reused"])],
+            )
+            metric(
+                "http_retries_total",
+                "counter",
+                "Requests retried after 429, 5xx or connection errors.",
+                [({}, connections["retried"])],
+            )
+
+        totals = data["totals"]
+        metric("trips_pages_total", "counter", "Trips pages fetched.", [({}, totals["pages"])])
+        metric("trips_rows_total", "counter", "Trips extracted from pages.", [({}, totals["rows"])])
+        metric("trips_page_bytes_total", "counter", "Trips page bytes downloaded.", [({}, totals["bytes"])])
+        metric("trips_page_fetch_seconds_total", "counter", "Seconds fetching trips pages.", [({}, totals["fetch"])])
+        metric(
+            "trips_page_wait_seconds_total",
+            "counter",
+            "Seconds trips page requests waited on the rate limiter.",
+            [({}, totals["wait"])],
+        )
+        metric("trips_page_parse_seconds_total", "counter", "Seconds parsing trips pages.", [({}, totals["parse"])])
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, file, labels=None):
+        log.info("writing metrics prometheus text to {}".format(file))
+        with open(file, "w") as f:
+            f.write(self.prometheus(labels=labels))
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -0,0 +1,346 @@
+import collections
+import logging
+import multiprocessing
+import time
+
+import lxml.html
+from lxml import etree
+
+
+log = logging.getLogger(__name__)
+
+PARSERS = ("html5lib", "lxml")
+
+# compiled once, these mirror the find/find_all calls in CitibikeTrips.extract_trip_data
+XPATH_TRIP_TABLE = etree.XPath('//table[@class="ed-html-table ed-html-table_trip"]')
+XPATH_ROWS = etree.XPath(".//tr")
+XPATH_CELLS = etree.XPath(".//td")
+XPATH_DIVS = etree.XPath(".//div")
+
+
+def decode(content):
+    """Return page content as str, trying utf-8 before falling back to bs4 charset detection"""
+
+    if isinstance(content, str):
+        return content
+    try:
+        return content.decode("utf-8")
+    except UnicodeDecodeError:
+        from bs4 import UnicodeDammit
+
+        return UnicodeDammit(content).unicode_markup
+
+
+def soup(markup):
+    """Return html5lib BeautifulSoup of markup. bs4 and html5lib are imported on first use, not with the package."""
+
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(markup, "html5lib")
+
+
+def extract_trip_soup(soup):
+    """Extract trips from trips page soup, the html5lib counterpart of extract_trip_rows"""
+
+    table = soup.find("table", {"class": "ed-html-table ed-html-table_trip"})
+    log.debug("Found trip table: {}".format(table))
+
+    trips = []
+    for row in table.find_all("tr"):
+        cells = row.find_all("td")
+        log.debug("found trip table row has {} cells".format(len(cells)))
+        # first tr row is th header instead of td data cells
+        if len(cells) < 1:
+            # skip th header row or other possibly empty row
+            log.debug("skipping short trip table row")
+            continue
+
+        _ = cells[0].find_all("div")
+        start_station = _[0].text.strip()
+        start_time = _[1].text.strip()
+
+        # bikeangles points always return zero even if disabled
+        try:
+            start_points = int(_[2].text.strip())
+        except:
+            start_points = 0
+
+        _ = cells[1].find_all("div")
+        end_station = _[0].text.strip()
+        end_time = _[1].text.strip()
+
+        # bikeangles points always return zero even if disabled
+        try:
+            end_points = int(_[2].text.strip())
+        except:
+            end_points = 0
+
+        duration = cells[2].get_text().strip()
+        billed = cells[3].get_text().strip()
+        try:
+            points = int(cells[4].get_text().strip().split(" ")[0])
+        except:
+            points = 0
+
+        trip = (
+            start_station,
+            end_station,
+            start_time,
+            end_time,
+            start_points,
+            end_points,
+            points,
+            billed,
+            duration,
+        )
+        trips.append(trip)
+
+    return trips
+
+
+def extract_page(job):
+    """Parse one (page number, raw html, parser) job and return (page number, trips, parse seconds).
+
+    Module level so pool workers can run it, only the trip tuples go back to the parent."""
+
+    page_num, content, parser = job
+    t = time.perf_counter()
+    trips = extract_trip_rows(content) if parser == "lxml" else None
+    if trips is None:
+        trips = extract_trip_soup(soup(content))
+    return page_num, trips, time.perf_counter() - t
+
+
+def extract_pages(pages, parser="html5lib", processes=2):
+    """Generator of (page number, trips, parse seconds) for (page number, raw html) pairs parsed in a process pool.
+
+    Results come back in the order of pages. At most two pages per process are waiting to be parsed, so pages is
+    only consumed as fast as the pool keeps up and a fetch feeding it stays a little ahead."""
+
+    # multiprocessing.Pool forks every worker up front, before a threaded fetch feeding pages has started, where
+    # ProcessPoolExecutor would fork them on demand from a process already running fetch threads
+    with multiprocessing.Pool(processes) as pool:
+        pending = collections.deque()
+        for page_num, content in pages:
+            pending.append(pool.apply_async(extract_page, ((page_num, content, parser),)))
+            if len(pending) >= processes * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def extract_trip_rows(content):
+    """Extract trips from raw trips page html with lxml and compiled XPath.
+
+    Returns the same trip tuples as CitibikeTrips.extract_trip_data or None when the page has no trip table so the
+    caller can fall back to the html5lib soup."""
+
+    doc = lxml.html.fromstring(decode(content))
+    tables = XPATH_TRIP_TABLE(doc)
+    if not tables:
+        log.debug("lxml found no trip table")
+        return None
+
+    trips = []
+    for row in XPATH_ROWS(tables[0]):
+        cells = XPATH_CELLS(row)
+        # first tr row is th header instead of td data cells
+        if len(cells) < 1:
+            continue
+
+        _ = XPATH_DIVS(cells[0])
+        start_station = _[0].text_content().strip()
+        start_time = _[1].text_content().strip()
+
+        # bikeangles points always return zero even if disabled
+        try:
+            start_points = int(_[2].text_content().strip())
+        except:
+            start_points = 0
+
+        _ = XPATH_DIVS(cells[1])
+        end_station = _[0].text_content().strip()
+        end_time = _[1].text_content().strip()
+
+        try:
+            end_points = int(_[2].text_content().strip())
+        except:
+            end_points = 0
+
+        duration = cells[2].text_content().strip()
+        billed = cells[3].text_content().strip()
+        try:
+            points = int(cells[4].text_content().strip().split(" ")[0])
+        except:
+            points = 0
+
+        trips.append(
+            (start_station, end_station, start_time, end_time, start_points, end_points, points, billed, duration,)
+        )
+
+    return trips
+
+
+def ba_points(text):
+    """Extract leading number from bikeangels points string like '70 points (August)'"""
+
+    return int(text.split(" ")[0])
+
+
+VALUE_CLASS = "ed-panel__info__value"
+STATS_CLASS = "ed-panel__info__value ed-panel__info__value_member-stats-for-period"
+LIFETIME_CLASS = "{} ed-panel__info__value_member-stats-for-period_lifetime".format(STATS_CLASS)
+
+# account path, div class or tuple of classes for paired values, index among matching divs, conversion
+PROFILE_FIELDS = (
+    (("profile", "first_name"), "ed-panel__info__value ed-panel__info__value_firstname", 0, None),
+    (("profile", "last_name"), "ed-panel__info__value ed-panel__info__value_lastname", 0, None),
+    (("profile", "user_name"), "ed-panel__info__value ed-panel__info__value_username", 0, None),
+    (("profile", "date_of_birth"), "ed-panel__info__value ed-panel__info__value_date-of-birth", 0, None),
+    (("profile", "gender"), "ed-panel__info__value ed-panel__info__value_gender", 0, None),
+    (("profile", "phone"), "ed-panel__info__value ed-panel__info__value_phone-number", 0, None),
+    (("profile", "email"), "ed-panel__info__value ed-panel__info__value_email", 0, None),
+    (("profile", "member_since"), "ed-panel__info__value ed-panel__info__value_member-since", 0, None),
+    (("profile", "bike_angel_since"), "ed-panel__info__value ed-panel__info__value_bike-angel-since", 0, None),
+    (("trips", "lifetime"), LIFETIME_CLASS, 0, int),
+    (("my_statistics", "number_of_trips"), LIFETIME_CLASS, 0, None),
+    (("my_statistics", "total_usage_time"), STATS_CLASS, 0, None),
+    (("my_statistics", "distance_traveled"), STATS_CLASS, 1, None),
+    (("my_statistics", "gas_saved"), STATS_CLASS, 2, None),
+    (("my_statistics", "co2_reduced"), STATS_CLASS, 3, None),
+    (
+        ("last_trip", "date"),
+        (
+            "ed-panel__info__value__part ed-panel__info__value__part_start-date",
+            "ed-panel__info__value__part ed-panel__info__value__part_end-date",
+        ),
+        0,
+        None,
+    ),
+    (
+        ("last_trip", "station"),
+        (
+            "ed-panel__info__value__part ed-panel__info__value__part_start-station-name",
+            "ed-panel__info__value__part ed-panel__info__value__part_end-station-name",
+        ),
+        0,
+        None,
+    ),
+    (
+        ("last_trip", "trip_time"),
+        "ed-panel__info__value ed-panel__info__value_summary ed-panel__info__value_last-trip",
+        0,
+        None,
+    ),
+    (("bike_key", "number"), "ed-panel__info__value ed-panel__info__value_key-number", 0, None),
+    (("bike_key", "status"), "ed-panel__info__value ed-panel__info__value_key-status", 0, None),
+    (
+        ("membership_status", "current", "type"),
+        "ed-panel__info__value ed-panel__info__value_subscription-type",
+        0,
+        None,
+    ),
+    (
+        ("membership_status", "current", "status"),
+        "ed-panel__info__value ed-panel__info__value_subscription-status",
+        0,
+        None,
+    ),
+    (
+        ("membership_status", "current", "expiration"),
+        "ed-panel__info__value ed-panel__info__value_subscription-end-date",
+        0,
+        None,
+    ),
+    (
+        ("membership_status", "next", "type"),
+        "ed-panel__info__value ed-panel__info__value_renewed-subscription-type",
+        0,
+        None,
+    ),
+    (
+        ("membership_status", "next", "status"),
+        "ed-panel__info__value ed-panel__info__value_renewed-subscription-status",
+        0,
+        None,
+    ),
+    (
+        ("membership_status", "next", "start"),
+        "ed-panel__info__value ed-panel__info__value_renewed-subscription-start-date",
+        0,
+        None,
+    ),
+    (
+        ("membership_status", "next", "expiration"),
+        "ed-panel__info__value ed-panel__info__value_renewed-subscription-end-date",
+        0,
+        None,
+    ),
+    (("billing_summary", "next_billing_date"), "ed-panel__info__value ed-panel__info__value_period", 0, None),
+    (("billing_summary", "current_balance"), "ed-panel__info__value ed-panel__info__value_amount", 0, None),
+    (
+        ("billing_information", "postal_code"),
+        "ed-panel__info__value__part ed-panel__info__value__part_postalCode",
+        0,
+        None,
+    ),
+)
+
+BA_FIELDS = (
+    (("my_statistics", "bike_angels_current"), "ed-panel__info__value__part", 0, ba_points),
+    (("my_statistics", "bike_angels_annual"), "ed-panel__info__value__part ed-panel__info__value__part_1", 0, ba_points),
+    (
+        ("my_statistics", "bike_angels_lifetime"),
+        "ed-panel__info__value__part ed-panel__info__value__part_2",
+        0,
+        ba_points,
+    ),
+    (
+        ("last_trip", "bike_angels_points"),
+        "ed-panel__info__value ed-panel__info__value_last-trip-bike-angel",
+        0,
+        None,
+    ),
+)
+
+
+def index_profile_values(soup):
+    """Walk profile soup once and index every ed-panel__info__value* div by class.
+
+    Divs are keyed by their full class string and by each single class, in document order, which is how bs4 matches
+    a class string in find and find_all."""
+
+    values = {}
+    for div in soup.find_all("div"):
+        classes = div.get("class")
+        if not classes or not any(_.startswith(VALUE_CLASS) for _ in classes):
+            continue
+        for key in {" ".join(classes), *classes}:
+            values.setdefault(key, []).append(div)
+    return values
+
+
+def profile_value(values, cls, index=0, convert=None):
+    """Look up one field in indexed profile values. Raises IndexError, KeyError or ValueError when missing."""
+
+    if isinstance(cls, tuple):
+        return [profile_value(values, _, index, convert) for _ in cls]
+    _ = values[cls][index].text
+    return convert(_) if convert else _
+
+
+def extract_profile_fields(soup, ba=False):
+    """Return list of (account path, value) pairs from profile soup, None for fields not found"""
+
+    values = index_profile_values(soup)
+    fields = PROFILE_FIELDS + BA_FIELDS if ba else PROFILE_FIELDS
+
+    out = []
+    for path, cls, index, convert in fields:
+        try:
+            _ = profile_value(values, cls, index, convert)
+        except (IndexError, KeyError, ValueError) as e:
+            log.warning("profile field {} not found {}".format("/".join(path), repr(e)))
+            _ = (None, None) if isinstance(cls, tuple) else None
+        out.append((path, _))
+    return out
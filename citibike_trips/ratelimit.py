@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Thread safe token bucket shared by every request a CitibikeTrips object makes.
+
+    rate is the number of requests allowed per second and burst how many may go out back to back. Without a rate, a
+    positive wait is the number of seconds between requests, one at a time. A rate overrides the wait."""
+
+    rate: float
+    burst: int
+    wait: float
+
+    def __init__(self, rate=None, burst=1, wait=0):
+        """
+
+        :type rate: float
+        :type burst: int
+        :type wait: float
+        """
+
+        self.wait = wait or 0
+        if not rate and self.wait > 0:
+            rate = 1.0 / self.wait
+            # a fixed gap between requests means no bursting
+            burst = 1
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Take a token if one is available. Returns 0 on success or seconds until the next token."""
+
+        if not self.rate:
+            return 0.0
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Block until a request may be sent, return seconds spent waiting"""
+
+        waited = 0.0
+        delay = self.take()
+        while delay:
+            log.debug("rate limit sleeping {:.3f}s".format(delay))
+            time.sleep(delay)
+            waited += delay
+            delay = self.take()
+        return waited
+
+    async def acquire_async(self):
+        """Wait without blocking the event loop until a request may be sent, return seconds spent waiting"""
+
+        waited = 0.0
+        delay = self.take()
+        while delay:
+            log.debug("rate limit sleeping {:.3f}s".format(delay))
+            await asyncio.sleep(delay)
+            waited += delay
+            delay = self.take()
+        return waited
@@ -0,0 +1,400 @@
+"""Compact trip records and an array backed trips container.
+
+Trip and TripFull are __slots__ records over the csv_header and csv_header_full fields. TripTable keeps trips as
+columns: ints and floats in typed arrays, trip times packed into int64 and every other value interned in a Pool shared
+by all string columns, so a station name is stored once however many trips and accounts use it. Iterating a TripTable
+still yields plain tuples, so CSV, JSON and the stores take it wherever they took a list of trips.
+"""
+import array
+import json
+import re
+
+
+# the order extract_trip_data and extract_trip_rows produce, station before time on each side as the page shows them
+TRIP_FIELDS = (
+    "start_name",
+    "end_name",
+    "start_time",
+    "end_time",
+    "start_points",
+    "end_points",
+    "points",
+    "billed",
+    "duration",
+)
+
+TRIP_FULL_FIELDS = (
+    "account_id",
+    "observed",
+    "start_time",
+    "end_time",
+    "start_name",
+    "end_name",
+    "start_points",
+    "end_points",
+    "points",
+    "billed",
+    "duration",
+    "start_id",
+    "end_id",
+    "start_terminal",
+    "end_terminal",
+    "start_lon",
+    "start_lat",
+    "end_lon",
+    "end_lat",
+    "dollars",
+    "seconds",
+    "start_epoch",
+    "end_epoch",
+    "start_iso8601",
+    "end_iso8601",
+)
+
+# extended trips end with these columns when CitibikeTrips is created with distances=True
+DISTANCE_FIELDS = ("miles", "mph")
+
+
+class Record:
+    """Base for fixed field records that unpack, index and compare like the tuples they replace"""
+
+    __slots__ = ()
+    fields = ()
+
+    def __init__(self, *values):
+        if len(values) != len(self.fields):
+            raise TypeError("{} takes {} values, got {}".format(type(self).__name__, len(self.fields), len(values)))
+        for name, value in zip(self.fields, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    def __iter__(self):
+        return (getattr(self, _) for _ in self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __getitem__(self, i):
+        return tuple(self)[i]
+
+    def __eq__(self, other):
+        try:
+            return tuple(self) == tuple(other)
+        except TypeError:
+            return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, ", ".join("{}={!r}".format(_, getattr(self, _)) for _ in self.fields))
+
+    def as_dict(self):
+        return dict(zip(self.fields, self))
+
+
+class Trip(Record):
+    """One trip as scraped, fields in csv_header order"""
+
+    __slots__ = TRIP_FIELDS
+    fields = TRIP_FIELDS
+
+
+class TripFull(Record):
+    """One hydrated trip, fields in csv_header_full order"""
+
+    __slots__ = TRIP_FULL_FIELDS
+    fields = TRIP_FULL_FIELDS
+
+
+RECORDS = {TRIP_FIELDS: Trip, TRIP_FULL_FIELDS: TripFull}
+
+# trip times like 07/04/2019 05:32:10 PM pack into one int, anything else is interned like other strings
+TIME_PATTERN = re.compile(r"(\d\d)/(\d\d)/(\d{4}) (\d\d):(\d\d):(\d\d) (AM|PM|am|pm)")
+TIME_SUFFIXES = ("AM", "PM", "am", "pm")
+# TIME_PATTERN split at [:14] into date and hour and [14:] into minute, second and suffix, their codes add up
+TIME_HEAD_PATTERN = re.compile(r"(\d\d)/(\d\d)/(\d{4}) (\d\d):")
+TIME_TAIL_PATTERN = re.compile(r"(\d\d):(\d\d) (AM|PM|am|pm)")
+
+
+def pack_time(value):
+    """Pack trip time string into an int that unpack_time turns back into the same string, None if it does not fit"""
+
+    if type(value) is not str:
+        return None
+    m = TIME_PATTERN.fullmatch(value)
+    if not m:
+        return None
+    month, day, year, hour, minute, second, suffix = m.groups()
+    return int(year + month + day + hour + minute + second) * 4 + TIME_SUFFIXES.index(suffix)
+
+
+def unpack_time(code):
+    n, suffix = divmod(code, 4)
+    _ = "%014d" % n
+    return f"{_[4:6]}/{_[6:8]}/{_[:4]} {_[8:10]}:{_[10:12]}:{_[12:14]} {TIME_SUFFIXES[suffix]}"
+
+
+def pack_times(values):
+    """pack_time for a column, each distinct date and hour and each distinct minute, second and suffix parsed once"""
+
+    if set(map(type, values)) != {str}:
+        return [pack_time(_) for _ in values]
+    heads = [_[:14] for _ in values]
+    tails = [_[14:] for _ in values]
+    head = {}
+    for h in set(heads):
+        m = TIME_HEAD_PATTERN.fullmatch(h)
+        if m:
+            month, day, year, hour = m.groups()
+            head[h] = int(year + month + day + hour) * 40000
+    tail = {}
+    for t in set(tails):
+        m = TIME_TAIL_PATTERN.fullmatch(t)
+        if m:
+            minute, second, suffix = m.groups()
+            tail[t] = int(minute + second) * 4 + TIME_SUFFIXES.index(suffix)
+    return [head[h] + tail[t] if h in head and t in tail else None for h, t in zip(heads, tails)]
+
+
+def unpack_times(codes):
+    """unpack_time for a column of codes"""
+
+    pairs = [divmod(_, 40000) for _ in codes]
+    head = {}
+    for h in set(_[0] for _ in pairs):
+        _ = "%010d" % h
+        head[h] = f"{_[4:6]}/{_[6:8]}/{_[:4]} {_[8:10]}:"
+    tail = {}
+    for t in set(_[1] for _ in pairs):
+        n, suffix = divmod(t, 4)
+        tail[t] = f"{n // 100:02d}:{n % 100:02d} {TIME_SUFFIXES[suffix]}"
+    return [head[h] + tail[t] for h, t in pairs]
+
+
+class Pool:
+    """Interned values shared by the coded columns of one or more TripTables"""
+
+    def __init__(self):
+        self.values = []
+        self.lookup = {}
+
+    def __len__(self):
+        return len(self.values)
+
+    @staticmethod
+    def key(value):
+        # keep "1", 1, 1.0 and True apart, unhashable values like coordinates go by their json
+        if type(value) is str:
+            return value
+        try:
+            hash(value)
+            return type(value), value
+        except TypeError:
+            return type(value), json.dumps(value)
+
+    def code(self, value):
+        key = self.key(value)
+        code = self.lookup.get(key)
+        if code is None:
+            code = self.lookup[key] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def codes(self, values):
+        """Return int32 array of codes for values"""
+
+        lookup = self.lookup
+        values = list(values)
+        keys = [_ if type(_) is str else self.key(_) for _ in values]
+        new = [_ for _ in dict.fromkeys(keys) if _ not in lookup]
+        if new:
+            # new values get codes in the order they first appear, keeping the first of equal keys
+            first = dict(zip(reversed(keys), reversed(values)))
+            lookup.update(zip(new, range(len(self.values), len(self.values) + len(new))))
+            self.values.extend(map(first.__getitem__, new))
+        return array.array("i", map(lookup.__getitem__, keys))
+
+
+TYPECODES = {"q": "q", "d": "d", "t": "q", "s": "i"}
+
+
+class Column:
+    """One TripTable column. kind is q for int64, d for float64, t for packed times and s for pool codes.
+
+    The kind is picked from the first values and falls back to s when a value does not fit."""
+
+    __slots__ = ("kind", "data", "pool")
+
+    def __init__(self, pool):
+        self.kind = None
+        self.data = None
+        self.pool = pool
+
+    @staticmethod
+    def pick(values):
+        # encode checks every value and falls back to s
+        value = values[0]
+        if type(value) is int:
+            return "q"
+        if type(value) is float:
+            return "d"
+        if pack_time(value) is not None:
+            return "t"
+        return "s"
+
+    def encode(self, values):
+        """Return array for values in this column kind or None when one does not fit"""
+
+        if self.kind in ("q", "d"):
+            check = int if self.kind == "q" else float
+            if set(map(type, values)) != {check}:
+                return None
+            try:
+                return array.array(self.kind, values)
+            except OverflowError:
+                return None
+        if self.kind == "t":
+            codes = pack_times(values)
+            if None in codes:
+                return None
+            return array.array("q", codes)
+        return self.pool.codes(values)
+
+    def extend(self, values):
+        values = list(values)
+        if not values:
+            return
+        if self.kind is None:
+            self.kind = self.pick(values)
+            self.data = array.array(TYPECODES[self.kind])
+        data = self.encode(values)
+        if data is None:
+            # a value does not fit, re-encode what is stored so far into the pool
+            existing = list(self)
+            self.kind = "s"
+            self.data = self.pool.codes(existing)
+            data = self.pool.codes(values)
+        self.data.extend(data)
+
+    def __len__(self):
+        return len(self.data) if self.data is not None else 0
+
+    def __getitem__(self, i):
+        return self.decode(self.data[i])
+
+    def decode(self, value):
+        if self.kind == "s":
+            return self.pool.values[value]
+        if self.kind == "t":
+            return unpack_time(value)
+        return value
+
+    def __iter__(self):
+        if self.data is None:
+            return iter(())
+        if self.kind == "s":
+            return map(self.pool.values.__getitem__, self.data)
+        if self.kind == "t":
+            return iter(unpack_times(self.data))
+        return iter(self.data)
+
+    def nbytes(self):
+        return self.data.itemsize * len(self.data) if self.data is not None else 0
+
+
+class TripTable:
+    """Column store for trips that iterates, indexes and slices as tuples in header order.
+
+    record(i) and records() return Trip or TripFull objects when the header is csv_header or csv_header_full. Pass the
+    same pool to tables for several accounts or snapshots to intern their strings once."""
+
+    header: tuple
+    pool: Pool
+
+    def __init__(self, header=TRIP_FIELDS, pool=None):
+        """
+
+        :type header: tuple
+        :type pool: Pool
+        """
+
+        self.header = tuple(header)
+        self.pool = pool if pool is not None else Pool()
+        self.columns = {name: Column(self.pool) for name in self.header}
+        self.record_type = RECORDS.get(self.header)
+
+    @classmethod
+    def from_rows(cls, rows, header=TRIP_FIELDS, pool=None):
+        table = cls(header, pool)
+        table.extend(rows)
+        return table
+
+    @classmethod
+    def from_columns(cls, columns, header=TRIP_FULL_FIELDS, pool=None):
+        """Build table from dict of column lists like hydrate_columns returns"""
+
+        table = cls(header, pool)
+        for name in table.header:
+            table.columns[name].extend(columns[name])
+        return table
+
+    def extend(self, rows):
+        """Append row sequences, transposed once so each column is encoded in bulk"""
+
+        rows = list(rows)
+        if not rows:
+            return
+        for name, values in zip(self.header, zip(*rows)):
+            self.columns[name].extend(values)
+
+    def append(self, row):
+        self.extend([row])
+
+    def __len__(self):
+        return len(self.columns[self.header[0]]) if self.header else 0
+
+    def __iter__(self):
+        return zip(*(self.columns[_] for _ in self.header))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[_] for _ in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return tuple(self.columns[_][i] for _ in self.header)
+
+    def __eq__(self, other):
+        try:
+            return len(self) == len(other) and all(a == tuple(b) for a, b in zip(self, other))
+        except TypeError:
+            return NotImplemented
+
+    def column(self, name):
+        """Return list of values of one column"""
+
+        return list(self.columns[name])
+
+    def record(self, i):
+        row = self[i]
+        return self.record_type(*row) if self.record_type else row
+
+    def records(self):
+        """Generator of Trip or TripFull records, tuples for other headers"""
+
+        if not self.record_type:
+            return iter(self)
+        return (self.record_type(*_) for _ in self)
+
+    def to_rows(self):
+        """Materialize all rows as a list of tuples"""
+
+        return list(self)
+
+    def nbytes(self):
+        """Bytes held by the column arrays, not counting the shared pool"""
+
+        return sum(_.nbytes() for _ in self.columns.values())
@@ -0,0 +1,245 @@
+"""Origin destination matrix over trips for route analytics.
+
+Stations are coded as ints in order of first appearance and pairs are kept sparse, keyed by origin << 32 | destination,
+with trip counts and summed seconds. Station in and out flows and round trips are maintained as trips are added, so
+queries never rescan trips and a matrix saved with save() picks up new trips on the next run without starting over.
+"""
+import heapq
+import json
+import logging
+import os
+
+from . import hydrate
+from .cache import replace
+from .records import TIME_PATTERN
+
+
+log = logging.getLogger(__name__)
+
+SHIFT = 32
+MASK = (1 << SHIFT) - 1
+
+
+def time_key(value):
+    """Return sortable int like 20190704173210 for a trip time like 07/04/2019 05:32:10 PM, None if it does not parse"""
+
+    m = TIME_PATTERN.fullmatch(value) if type(value) is str else None
+    if not m:
+        return None
+    month, day, year, hour, minute, second, suffix = m.groups()
+    hour = int(hour) % 12 + (12 if suffix in ("PM", "pm") else 0)
+    return int("{}{}{}{:02d}{}{}".format(year, month, day, hour, minute, second))
+
+
+class ODMatrix:
+    """Sparse origin destination counts and durations with integer station codes.
+
+    add() takes trips or trips_full rows with their header. The matrix remembers the oldest and newest start time it
+    has counted and only counts trips outside that range, so the whole history can be passed again after an
+    incremental sync, and older pages fetched by a later run are still added. That holds as long as every add covers
+    a contiguous stretch of the history, as pages fetched newest first do. Trips whose start time does not parse are
+    always counted."""
+
+    names: list
+    codes: dict
+    trips: int
+    oldest: int
+    newest: int
+
+    def __init__(self, dedupe=True):
+        """
+
+        :type dedupe: bool
+        """
+
+        self.names = []
+        self.codes = {}
+        self.counts = {}
+        self.seconds = {}
+        self.timed = {}
+        self.out_flow = []
+        self.in_flow = []
+        self.round_flow = []
+        self.trips = 0
+        self.dedupe = dedupe
+        self.oldest = None
+        self.newest = None
+
+    def code(self, name):
+        """Return int code for station name, assigning the next one if new"""
+
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+            self.out_flow.append(0)
+            self.in_flow.append(0)
+            self.round_flow.append(0)
+        return code
+
+    def add(self, trips, header):
+        """Add trip rows described by header, returns number of trips added"""
+
+        start_time = header.index("start_time")
+        start_name = header.index("start_name")
+        end_name = header.index("end_name")
+        if "seconds" in header:
+            seconds = header.index("seconds")
+            convert = None
+        else:
+            seconds = header.index("duration")
+            convert = {}
+
+        added = 0
+        oldest, newest = self.oldest, self.newest
+        # trips in this call are deduped on start time and station, earlier calls on the range of start times counted
+        seen = set()
+        for trip in trips:
+            if self.dedupe:
+                key = time_key(trip[start_time])
+                if key is not None:
+                    if self.newest is not None and self.oldest <= key <= self.newest:
+                        continue
+                    if (key, trip[start_name]) in seen:
+                        continue
+                    seen.add((key, trip[start_name]))
+                    oldest = key if oldest is None else min(oldest, key)
+                    newest = key if newest is None else max(newest, key)
+
+            o = self.code(trip[start_name])
+            d = self.code(trip[end_name])
+            pair = o << SHIFT | d
+            self.counts[pair] = self.counts.get(pair, 0) + 1
+            self.out_flow[o] += 1
+            self.in_flow[d] += 1
+            if o == d:
+                self.round_flow[o] += 1
+
+            secs = trip[seconds]
+            if convert is None:
+                # hydrate writes 0 seconds for trips whose station, amount or duration did not resolve
+                secs = secs if isinstance(secs, int) and secs > 0 else None
+            elif secs in convert:
+                secs = convert[secs]
+            else:
+                try:
+                    secs = convert[secs] = hydrate.str_to_secs(secs)
+                except Exception:
+                    secs = convert[secs] = None
+            if secs is not None:
+                self.seconds[pair] = self.seconds.get(pair, 0) + secs
+                self.timed[pair] = self.timed.get(pair, 0) + 1
+            added += 1
+
+        self.trips += added
+        self.oldest, self.newest = oldest, newest
+        log.debug("od matrix added {} trips, {} stations {} routes".format(added, len(self.names), len(self.counts)))
+        return added
+
+    def __len__(self):
+        return len(self.counts)
+
+    def route(self, pair):
+        o, d = pair >> SHIFT, pair & MASK
+        timed = self.timed.get(pair, 0)
+        seconds = self.seconds.get(pair, 0)
+        return {
+            "start": self.names[o],
+            "end": self.names[d],
+            "count": self.counts[pair],
+            "seconds": seconds,
+            "mean_seconds": seconds / timed if timed else None,
+        }
+
+    def top_routes(self, n=10, by="count", round_trips=True):
+        """Return the n routes with the most trips, or the most total seconds with by='seconds'"""
+
+        values = self.counts if by == "count" else self.seconds
+        pairs = values if round_trips else (_ for _ in values if _ >> SHIFT != _ & MASK)
+        return [self.route(_) for _ in heapq.nlargest(n, pairs, key=values.__getitem__)]
+
+    def round_trips(self, n=None):
+        """Return [(station name, count)] of trips ending where they started, most first"""
+
+        out = [(self.names[i], c) for i, c in enumerate(self.round_flow) if c]
+        out.sort(key=lambda _: -_[1])
+        return out[:n] if n else out
+
+    def flow(self, name):
+        """Return dict of trips out of, into and round trips at one station, None if never used"""
+
+        code = self.codes.get(name)
+        if code is None:
+            return None
+        return {
+            "out": self.out_flow[code],
+            "in": self.in_flow[code],
+            "net": self.in_flow[code] - self.out_flow[code],
+            "round": self.round_flow[code],
+        }
+
+    def flows(self):
+        """Return dict of flow() for every station"""
+
+        return {name: self.flow(name) for name in self.names}
+
+    def between(self, start, end):
+        """Return route dict for one station pair, None if never ridden"""
+
+        if start not in self.codes or end not in self.codes:
+            return None
+        pair = self.codes[start] << SHIFT | self.codes[end]
+        return self.route(pair) if pair in self.counts else None
+
+    def triplets(self):
+        """Generator of (origin code, destination code, count, seconds) for the sparse matrix"""
+
+        for pair, count in self.counts.items():
+            yield pair >> SHIFT, pair & MASK, count, self.seconds.get(pair, 0)
+
+    def to_dict(self):
+        return {
+            "names": self.names,
+            "trips": self.trips,
+            "pairs": [
+                [pair, count, self.seconds.get(pair, 0), self.timed.get(pair, 0)] for pair, count in self.counts.items()
+            ],
+            "dedupe": self.dedupe,
+            "oldest": self.oldest,
+            "newest": self.newest,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        od = cls(dedupe=data.get("dedupe", True))
+        for name in data["names"]:
+            od.code(name)
+        for pair, count, seconds, timed in data["pairs"]:
+            o, d = pair >> SHIFT, pair & MASK
+            od.counts[pair] = count
+            if timed:
+                od.seconds[pair] = seconds
+                od.timed[pair] = timed
+            od.out_flow[o] += count
+            od.in_flow[d] += count
+            if o == d:
+                od.round_flow[o] += count
+        od.trips = data["trips"]
+        od.oldest = data.get("oldest")
+        od.newest = data.get("newest")
+        if od.oldest is None:
+            od.newest = None
+        return od
+
+    def save(self, file):
+        log.info("writing od matrix to {}".format(file))
+        replace(file, json.dumps(self.to_dict()).encode("utf-8"))
+
+    @classmethod
+    def load(cls, file):
+        """Return matrix saved in file, or an empty one if the file does not exist"""
+
+        if not os.path.exists(file):
+            return cls()
+        with open(file, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,189 @@
+"""Bulk loader for the cb_<kind>_<ts>.json snapshots kept in a data dir, gz or zst compressed or not.
+
+Files are decoded in a process pool, with orjson when it is installed, and merged into one deduplicated trip history
+plus a per snapshot series of account objects. Every snapshot holds the whole history up to its run, so most of a year
+of daily snapshots is repeated trips, and merging keeps each trip once, as it was in the newest snapshot holding it.
+"""
+import collections
+import hashlib
+import json
+import logging
+import operator
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .records import TRIP_FIELDS, TRIP_FULL_FIELDS
+from .writers import read_bytes
+
+
+log = logging.getLogger(__name__)
+
+KINDS = ("trips", "trips_full", "account", "stations")
+TRIP_KINDS = ("trips", "trips_full")
+# a trip keeps its start time and station across snapshots while billed, points and observed can change
+TRIP_KEYS = {
+    "trips": operator.itemgetter(*map(TRIP_FIELDS.index, ("start_time", "start_name"))),
+    "trips_full": operator.itemgetter(*map(TRIP_FULL_FIELDS.index, ("account_id", "start_time", "start_name"))),
+}
+FILE_PATTERN = re.compile(r"cb_({})_(\d+)\.json(\.gz|\.zst|\.zstd)?".format("|".join(KINDS)))
+
+# decode in the calling process below this many files, starting a pool costs more than it saves
+INLINE_FILES = 4
+
+
+def json_loads():
+    """Return (backend name, loads function), orjson when installed else the json module"""
+
+    try:
+        import orjson
+    except ImportError:
+        return "json", json.loads
+    return "orjson", orjson.loads
+
+
+def discover(directory, kinds=KINDS):
+    """Return dict of ts to dict of kind to file for json snapshots in directory"""
+
+    found = collections.defaultdict(dict)
+    # sorted so a plain json file wins over a compressed copy of the same snapshot
+    for name in sorted(os.listdir(directory)):
+        m = FILE_PATTERN.fullmatch(name)
+        if m and m.group(1) in kinds:
+            found[int(m.group(2))].setdefault(m.group(1), os.path.join(directory, name))
+    return dict(found)
+
+
+def decode_file(kind, raw, loads):
+    """Decode one snapshot file, trip rows as tuples so they hash like scraped trips"""
+
+    data = loads(raw)
+    if kind in TRIP_KINDS:
+        data = list(map(tuple, data))
+    return data
+
+
+def decode_chunk(jobs):
+    """Decode (kind, ts, file) jobs and return (dict of merged trips per kind, dict of (kind, ts) to other data).
+
+    Runs in pool workers. Trips are merged within the chunk before going back to the parent, so a chunk of daily
+    snapshots sends about one snapshot worth of trips instead of all of them. A trips file identical to one already
+    merged, like the snapshots of days without a ride, is skipped without decoding."""
+
+    loads = json_loads()[1]
+    trips = {_: {} for _ in TRIP_KINDS}
+    digests = set()
+    other = {}
+    for kind, ts, file in jobs:
+        raw = read_bytes(file)
+        if kind in trips:
+            digest = (kind, hashlib.sha1(raw).digest())
+            if digest not in digests:
+                digests.add(digest)
+                merge_trips(trips[kind], decode_file(kind, raw, loads), TRIP_KEYS[kind])
+        else:
+            other[kind, ts] = decode_file(kind, raw, loads)
+    return {k: list(v.values()) for k, v in trips.items()}, other
+
+
+def decode_chunks(jobs, processes=None):
+    """Generator of decode_chunk results in job order over a pool of processes, inline for a few files"""
+
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(jobs) <= INLINE_FILES:
+        yield decode_chunk(jobs)
+        return
+
+    # a few chunks per process keeps them all busy when files differ in size
+    size = -(-len(jobs) // (processes * 4))
+    chunks = [jobs[i : i + size] for i in range(0, len(jobs), size)]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        yield from pool.map(decode_chunk, chunks)
+
+
+def merge_trips(merged, trips, key):
+    """Add trips to the merged dict of trip key to trip, which keeps first insertion order.
+
+    Fed snapshots newest first, the newest keeps its order and its version of each trip, and older ones only add trips
+    no newer one has, the same way an incremental run puts new trips ahead of known ones."""
+
+    for k, trip in zip(map(key, trips), trips):
+        if k not in merged:
+            merged[k] = trip
+
+
+class History:
+    """Merged trips and per snapshot account objects and stations feeds loaded from a data dir"""
+
+    trips: list
+    trips_full: list
+    accounts: dict
+    stations: dict
+    timestamps: list
+
+    def __init__(self):
+        self.trips = []
+        self.trips_full = []
+        self.accounts = collections.OrderedDict()
+        self.stations = collections.OrderedDict()
+        self.timestamps = []
+        self.files = 0
+        self.backend = None
+        self.seconds = 0.0
+
+    def account(self, ts=None):
+        """Return account object of snapshot ts, the newest by default, or None"""
+
+        if not self.accounts:
+            return None
+        return self.accounts[ts if ts is not None else next(reversed(self.accounts))]
+
+    def series(self, *path):
+        """Return [(ts, value)] of one account value over time, for example series('trips', 'lifetime')"""
+
+        out = []
+        for ts, account in self.accounts.items():
+            value = account
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            out.append((ts, value))
+        return out
+
+
+def load_history(directory, kinds=("trips", "account"), processes=None, start=None, end=None):
+    """Load every json snapshot of kinds in directory with ts between start and end and return History.
+
+    trips and trips_full come back merged and deduplicated, accounts and stations keyed by ts in ts order."""
+
+    t = time.perf_counter()
+    found = discover(directory, kinds)
+    stamps = sorted(_ for _ in found if (start is None or _ >= start) and (end is None or _ <= end))
+    # newest first so merging keeps the newest order, and big trips files are handed out before small ones
+    jobs = [(kind, ts, found[ts][kind]) for ts in reversed(stamps) for kind in kinds if kind in found[ts]]
+
+    history = History()
+    history.timestamps = stamps
+    history.backend = json_loads()[0]
+    history.files = len(jobs)
+    log.info("loading {} snapshot files from {} with {}".format(len(jobs), directory, history.backend))
+
+    merged = {_: {} for _ in TRIP_KINDS}
+    other = {}
+    for trips, data in decode_chunks(jobs, processes=processes):
+        for kind in TRIP_KINDS:
+            merge_trips(merged[kind], trips[kind], TRIP_KEYS[kind])
+        other.update(data)
+
+    history.trips = list(merged["trips"].values())
+    history.trips_full = list(merged["trips_full"].values())
+
+    for kind, ts in sorted(other, key=lambda _: _[1]):
+        (history.accounts if kind == "account" else history.stations)[ts] = other[kind, ts]
+    history.seconds = time.perf_counter() - t
+    log.info(
+        "loaded {} snapshots, {} trips, {} trips full in {:.2f}s".format(
+            len(stamps), len(history.trips), len(history.trips_full), history.seconds
+        )
+    )
+    return history
@@ -0,0 +1,109 @@
+"""Startup import time check for the command line.
+
+    python -m citibike_trips.startup --budget 300
+
+Each command runs a few times in a fresh interpreter under python -X importtime. The fastest run's import time, summed
+over top level imports including interpreter startup, must stay within budget milliseconds, and none of the modules
+that are only needed on demand may have been imported.
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+
+
+log = logging.getLogger(__name__)
+
+BUDGET_MS = 300
+
+# only imported on the code paths that need them: cookie jar, html5lib soup, time conversion, asyncio client
+LAZY = ("browser_cookie3", "bs4", "html5lib", "pytz", "aiohttp")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, "citibike-trips")
+
+COMMANDS = (
+    ("help", [SCRIPT, "--help"]),
+    ("import", ["-c", "import citibike_trips"]),
+    ("offline", ["-c", "from citibike_trips import CitibikeTrips; CitibikeTrips('user', 'pass', keep='.', offline=True)"]),
+)
+
+
+def importtime(args, cwd=None):
+    """Run python -X importtime with args and return (dict of module to self and cumulative us, total us)"""
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (ROOT, os.environ.get("PYTHONPATH")))))
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime"] + list(args),
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        timeout=60,
+    )
+    modules = {}
+    total = 0
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        modules[name.strip()] = (int(own), int(cumulative))
+        # nested imports are indented below the module that imported them
+        if len(name) - len(name.lstrip()) == 1:
+            total += int(cumulative)
+    return modules, total
+
+
+def check(budget=BUDGET_MS, repeat=3, commands=COMMANDS):
+    """Return list of result dicts, one per command, with ok False when over budget or a lazy module loaded"""
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="citibike_startup_") as cwd:
+        for name, args in commands:
+            runs = [importtime(args, cwd=cwd) for _ in range(max(1, repeat))]
+            modules, total = min(runs, key=lambda _: _[1])
+            loaded = [_ for _ in LAZY if _ in modules]
+            slowest = sorted(modules.items(), key=lambda _: -_[1][0])[:5]
+            ms = total / 1000
+            results.append(
+                {
+                    "name": name,
+                    "ms": ms,
+                    "modules": len(modules),
+                    "lazy_loaded": loaded,
+                    "slowest": [(k, v[0] / 1000) for k, v in slowest],
+                    "ok": ms <= budget and not loaded,
+                }
+            )
+            log.info("{} {:.1f}ms {} modules".format(name, ms, len(modules)))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check citibike-trips startup import time.")
+    parser.add_argument(
+        "-b", "--budget", required=False, default=BUDGET_MS, type=float, help="Milliseconds allowed per command.",
+    )
+    parser.add_argument("-r", "--repeat", required=False, default=3, type=int, help="Runs per command, fastest counts.")
+    parser.add_argument("-v", "--verbose", required=False, action="store_true", help="Print slowest modules.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    failed = False
+    for _ in check(budget=args.budget, repeat=args.repeat):
+        status = "ok" if _["ok"] else "FAIL"
+        print("{:<8} {:>8.1f}ms {:>5} modules {}".format(_["name"], _["ms"], _["modules"], status))
+        if _["lazy_loaded"]:
+            print("  imported eagerly: {}".format(", ".join(_["lazy_loaded"])))
+        if args.verbose:
+            for module, ms in _["slowest"]:
+                print("  {:<40} {:>8.1f}ms".format(module, ms))
+        failed = failed or not _["ok"]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
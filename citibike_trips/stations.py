@@ -0,0 +1,304 @@
+import logging
+import math
+
+
+log = logging.getLogger(__name__)
+
+
+class StationIndex:
+    """Hash indexes over a stations feed for constant time station lookups.
+
+    Built from the GeoJSON returned by the stations url. When a key repeats in the feed the first station wins, which
+    matches the old behaviour of taking the first list comprehension result."""
+
+    features: list
+    by_name: dict
+    by_id: dict
+    by_terminal: dict
+    by_location: dict
+    size: int
+
+    def __init__(self, stations=None):
+        """
+
+        :type stations: dict
+        """
+
+        self.features = []
+        self.by_name = {}
+        self.by_id = {}
+        self.by_terminal = {}
+        self.by_location = {}
+        self.size = 0
+        self._spatial = None
+
+        if stations:
+            self.build(stations)
+
+    def build(self, stations):
+        """Build all indexes from a stations feed object"""
+
+        features = stations.get("features") if isinstance(stations, dict) else None
+        self.features = features if features is not None else []
+        self.by_name = {}
+        self.by_id = {}
+        self.by_terminal = {}
+        self.by_location = {}
+        self._spatial = None
+
+        for station in self.features:
+            try:
+                properties = station["properties"]
+            except (KeyError, TypeError):
+                continue
+
+            if "name" in properties:
+                self.by_name.setdefault(properties["name"], station)
+            if "station_id" in properties:
+                self.by_id.setdefault(properties["station_id"], station)
+            if "terminal" in properties:
+                self.by_terminal.setdefault(properties["terminal"], station)
+
+            try:
+                self.by_location.setdefault(self.location_key(station["geometry"]["coordinates"]), station)
+            except (KeyError, TypeError):
+                pass
+
+        self.size = len(self.features)
+        log.debug("indexed {} stations".format(self.size))
+        return self
+
+    def is_stale(self, stations):
+        """Return True if stations feed is not the one this index was built from"""
+
+        features = stations.get("features") if isinstance(stations, dict) else None
+        if features is None:
+            return self.size != 0
+        return features is not self.features or len(features) != self.size
+
+    @property
+    def spatial(self):
+        """SpatialIndex over the same features, built on first use"""
+
+        if self._spatial is None:
+            self._spatial = SpatialIndex(self.features)
+        return self._spatial
+
+    @staticmethod
+    def location_key(location):
+        """Convert coordinates list into a hashable key"""
+
+        return tuple(location)
+
+    def name(self, name):
+        """Return station object by name or None"""
+
+        return self.by_name.get(name)
+
+    def id(self, id):
+        """Return station object by station_id or None"""
+
+        return self.by_id.get(id)
+
+    def terminal(self, terminal):
+        """Return station object by terminal or None"""
+
+        return self.by_terminal.get(terminal)
+
+    def location(self, location):
+        """Return station object by exact coordinates or None"""
+
+        try:
+            return self.by_location.get(self.location_key(location))
+        except TypeError:
+            return None
+
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    """Return great circle distance in meters between two lon+lat points"""
+
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class SpatialIndex:
+    """Uniform grid over station coordinates for nearest and radius queries.
+
+    Stations are bucketed into roughly square cells of cell_size meters. Queries only compute haversine distances for
+    stations in the rings of cells around the query point, so a lookup touches a handful of stations instead of the
+    whole feed."""
+
+    cell_size: float
+    stations: list
+    lons: list
+    lats: list
+    cells: dict
+
+    def __init__(self, features=None, cell_size=250):
+        """
+
+        :type features: list
+        :type cell_size: float
+        """
+
+        self.cell_size = cell_size
+        self.stations = []
+        self.lons = []
+        self.lats = []
+        self.cells = {}
+        self.cell_lat = cell_size / (math.pi * EARTH_RADIUS_M / 180)
+        self.cell_lon = self.cell_lat
+        self.bounds = None
+
+        if features:
+            self.build(features)
+
+    def build(self, features):
+        """Bucket station features with point geometry into grid cells"""
+
+        self.stations = []
+        self.lons = []
+        self.lats = []
+        self.cells = {}
+
+        for station in features:
+            try:
+                lon, lat = station["geometry"]["coordinates"][:2]
+                lon, lat = float(lon), float(lat)
+            except (KeyError, TypeError, ValueError):
+                continue
+            self.stations.append(station)
+            self.lons.append(lon)
+            self.lats.append(lat)
+
+        if not self.stations:
+            return self
+
+        # widen longitude cells so they stay square at the most poleward station
+        max_lat = max(abs(_) for _ in self.lats)
+        self.cell_lon = self.cell_lat / max(math.cos(math.radians(max_lat)), 1e-6)
+
+        for i, (lon, lat) in enumerate(zip(self.lons, self.lats)):
+            self.cells.setdefault(self.cell(lon, lat), []).append(i)
+
+        xs = [_[0] for _ in self.cells]
+        ys = [_[1] for _ in self.cells]
+        self.bounds = (min(xs), min(ys), max(xs), max(ys))
+        log.debug("spatial index {} stations in {} cells".format(len(self.stations), len(self.cells)))
+        return self
+
+    def __len__(self):
+        return len(self.stations)
+
+    def cell(self, lon, lat):
+        """Return grid cell key for a lon+lat point"""
+
+        return int(math.floor(lon / self.cell_lon)), int(math.floor(lat / self.cell_lat))
+
+    def _ring(self, cx, cy, r):
+        """Yield station positions in cells exactly r cells away from cx, cy"""
+
+        if r == 0:
+            yield from self.cells.get((cx, cy), ())
+            return
+        for x in range(cx - r, cx + r + 1):
+            yield from self.cells.get((x, cy - r), ())
+            yield from self.cells.get((x, cy + r), ())
+        for y in range(cy - r + 1, cy + r):
+            yield from self.cells.get((cx - r, y), ())
+            yield from self.cells.get((cx + r, y), ())
+
+    def _distances(self, lon, lat, positions):
+        """Return list of (meters, position) for station positions from lon, lat"""
+
+        rlon = math.radians(lon)
+        rlat = math.radians(lat)
+        cos_lat = math.cos(rlat)
+        sin = math.sin
+        cos = math.cos
+        radians = math.radians
+        lons = self.lons
+        lats = self.lats
+        out = []
+        for i in positions:
+            slat = radians(lats[i])
+            a = sin((slat - rlat) / 2) ** 2 + cos_lat * cos(slat) * sin((radians(lons[i]) - rlon) / 2) ** 2
+            out.append((2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a))), i))
+        return out
+
+    def _max_ring(self, cx, cy):
+        """Number of rings needed from cx, cy to cover every occupied cell"""
+
+        x0, y0, x1, y1 = self.bounds
+        return max(abs(cx - x0), abs(cx - x1), abs(cy - y0), abs(cy - y1))
+
+    def _min_ring(self, cx, cy):
+        """First ring from cx, cy that can contain an occupied cell"""
+
+        x0, y0, x1, y1 = self.bounds
+        return max(x0 - cx, cx - x1, y0 - cy, cy - y1, 0)
+
+    def nearest(self, lon, lat, k=1, max_distance=None):
+        """Return up to k (meters, station) pairs closest to lon, lat, nearest first"""
+
+        if not self.stations or k < 1:
+            return []
+
+        cx, cy = self.cell(lon, lat)
+        max_ring = self._max_ring(cx, cy)
+        found = []
+        r = self._min_ring(cx, cy)
+        while r <= max_ring:
+            if 8 * r > len(self.cells):
+                # ring is wider than the occupied grid, cheaper to check every station
+                found = self._distances(lon, lat, range(len(self.stations)))
+                break
+            found.extend(self._distances(lon, lat, self._ring(cx, cy, r)))
+            # anything in ring r+1 or further is at least r whole cells away
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= r * self.cell_size:
+                    break
+            if max_distance is not None and r * self.cell_size >= max_distance:
+                break
+            r += 1
+
+        found.sort()
+        if max_distance is not None:
+            found = [_ for _ in found if _[0] <= max_distance]
+        return [(d, self.stations[i]) for d, i in found[:k]]
+
+    def within(self, lon, lat, radius):
+        """Return all (meters, station) pairs within radius meters of lon, lat, nearest first"""
+
+        if not self.stations:
+            return []
+
+        cx, cy = self.cell(lon, lat)
+        rings = min(int(math.ceil(radius / self.cell_size)) + 1, self._max_ring(cx, cy))
+        first = self._min_ring(cx, cy)
+        if 8 * rings > len(self.cells):
+            positions = range(len(self.stations))
+        else:
+            positions = (i for r in range(first, rings + 1) for i in self._ring(cx, cy, r))
+        found = [_ for _ in self._distances(lon, lat, positions) if _[0] <= radius]
+        found.sort()
+        return [(d, self.stations[i]) for d, i in found]
+
+    def nearest_many(self, points, k=1, max_distance=None):
+        """Resolve an iterable of (lon, lat) points in one call.
+
+        Returns a list with one nearest() result per point. Repeated points are only resolved once."""
+
+        results = []
+        cache = {}
+        for lon, lat in points:
+            key = (lon, lat)
+            if key not in cache:
+                cache[key] = self.nearest(lon, lat, k=k, max_distance=max_distance)
+            results.append(cache[key])
+        return results
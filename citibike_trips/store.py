@@ -0,0 +1,197 @@
+import hashlib
+import json
+import logging
+import sqlite3
+
+
+log = logging.getLogger(__name__)
+
+TRIP_COLUMNS = (
+    ("account_id", "TEXT NOT NULL"),
+    ("start_time", "TEXT NOT NULL"),
+    ("end_time", "TEXT"),
+    ("start_name", "TEXT NOT NULL"),
+    ("end_name", "TEXT"),
+    ("start_points", "INTEGER"),
+    ("end_points", "INTEGER"),
+    ("points", "INTEGER"),
+    ("billed", "TEXT"),
+    ("duration", "TEXT"),
+    ("start_id", "TEXT"),
+    ("end_id", "TEXT"),
+    ("start_terminal", "TEXT"),
+    ("end_terminal", "TEXT"),
+    ("start_lon", "REAL"),
+    ("start_lat", "REAL"),
+    ("end_lon", "REAL"),
+    ("end_lat", "REAL"),
+    ("dollars", "REAL"),
+    ("seconds", "INTEGER"),
+    ("start_epoch", "INTEGER"),
+    ("end_epoch", "INTEGER"),
+    ("start_iso8601", "TEXT"),
+    ("end_iso8601", "TEXT"),
+    ("first_observed", "INTEGER"),
+    ("last_observed", "INTEGER"),
+)
+
+TRIP_KEY = ("account_id", "start_time", "start_name")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trips (
+    {columns},
+    PRIMARY KEY ({key})
+);
+-- the primary key doubles as the account_id index
+CREATE INDEX IF NOT EXISTS trips_start_epoch ON trips (start_epoch);
+CREATE INDEX IF NOT EXISTS trips_start_id ON trips (start_id, start_epoch);
+CREATE INDEX IF NOT EXISTS trips_end_id ON trips (end_id, start_epoch);
+CREATE TABLE IF NOT EXISTS accounts (
+    account_id TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    account TEXT NOT NULL,
+    PRIMARY KEY (account_id, ts)
+);
+CREATE TABLE IF NOT EXISTS stations (
+    hash TEXT PRIMARY KEY,
+    stations TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS station_snapshots (
+    ts INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL REFERENCES stations (hash)
+);
+""".format(
+    columns=",\n    ".join("{} {}".format(*_) for _ in TRIP_COLUMNS), key=", ".join(TRIP_KEY)
+)
+
+# keys only change the first time a trip is seen, hydrated fields fill in when a later run has them
+UPSERT_TRIP = """
+INSERT INTO trips ({names}) VALUES ({marks})
+ON CONFLICT ({key}) DO UPDATE SET {updates}, last_observed = max(trips.last_observed, excluded.last_observed)
+""".format(
+    names=", ".join(_[0] for _ in TRIP_COLUMNS),
+    marks=", ".join("?" for _ in TRIP_COLUMNS),
+    key=", ".join(TRIP_KEY),
+    updates=", ".join(
+        "{0} = coalesce(excluded.{0}, trips.{0})".format(_[0])
+        for _ in TRIP_COLUMNS
+        if _[0] not in TRIP_KEY + ("first_observed", "last_observed")
+    ),
+)
+
+
+def null(value):
+    """Map the '-' placeholder hydrate uses for missing values to NULL"""
+
+    return None if value == "-" else value
+
+
+class TripStore:
+    """SQLite store for trips, account snapshots and station feeds deduplicated across runs.
+
+    Trips are upserted on (account_id, start_time, start_name) so the database grows with new trips, not with the
+    number of runs. Station feeds are stored once per distinct content hash."""
+
+    file: str
+
+    def __init__(self, file):
+        """
+
+        :type file: str
+        """
+
+        self.file = file
+        # several batch processes may share one store, wait on their write locks instead of failing
+        self.db = sqlite3.connect(file, timeout=60)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def save_trips(self, trips, header, account_id, observed):
+        """Upsert trips rows described by header in one transaction. Returns number of rows written."""
+
+        positions = [header.index(name) if name in header else None for name, _ in TRIP_COLUMNS]
+        fixed = {"account_id": account_id, "first_observed": observed, "last_observed": observed}
+
+        def values(trip):
+            return [
+                fixed[name] if name in fixed else (null(trip[i]) if i is not None else None)
+                for (name, _), i in zip(TRIP_COLUMNS, positions)
+            ]
+
+        with self.db:
+            self.db.executemany(UPSERT_TRIP, map(values, trips))
+        log.info("stored {} trips for {} in {}".format(len(trips), account_id, self.file))
+        return len(trips)
+
+    def save_account(self, account, account_id, ts):
+        """Store account snapshot for timestamp"""
+
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO accounts (account_id, ts, account) VALUES (?, ?, ?)",
+                (account_id, ts, json.dumps(account)),
+            )
+
+    def save_stations(self, stations, ts):
+        """Store stations feed once per distinct content and point timestamp at it. Returns content hash."""
+
+        encoded = json.dumps(stations, sort_keys=True)
+        digest = hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+        with self.db:
+            self.db.execute("INSERT OR IGNORE INTO stations (hash, stations) VALUES (?, ?)", (digest, encoded))
+            self.db.execute("INSERT OR REPLACE INTO station_snapshots (ts, hash) VALUES (?, ?)", (ts, digest))
+        return digest
+
+    def query_trips(self, account_id=None, station_id=None, start=None, end=None):
+        """Return trips rows as dicts filtered by account, station used at either end and start_epoch range"""
+
+        where = []
+        params = []
+        if account_id is not None:
+            where.append("account_id = ?")
+            params.append(account_id)
+        if station_id is not None:
+            where.append("(start_id = ? OR end_id = ?)")
+            params.extend([station_id, station_id])
+        if start is not None:
+            where.append("start_epoch >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("start_epoch < ?")
+            params.append(end)
+
+        sql = "SELECT * FROM trips"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY start_epoch"
+        return [dict(_) for _ in self.db.execute(sql, params)]
+
+    def load_account(self, account_id, ts=None):
+        """Return latest account snapshot or the one for ts, None if missing"""
+
+        if ts is None:
+            sql = "SELECT account FROM accounts WHERE account_id = ? ORDER BY ts DESC LIMIT 1"
+            row = self.db.execute(sql, (account_id,)).fetchone()
+        else:
+            sql = "SELECT account FROM accounts WHERE account_id = ? AND ts = ?"
+            row = self.db.execute(sql, (account_id, ts)).fetchone()
+        return json.loads(row["account"]) if row else None
+
+    def load_stations(self, ts=None):
+        """Return latest stations feed or the one observed at ts, None if missing"""
+
+        sql = "SELECT s.stations FROM station_snapshots n JOIN stations s ON s.hash = n.hash"
+        if ts is None:
+            row = self.db.execute(sql + " ORDER BY n.ts DESC LIMIT 1").fetchone()
+        else:
+            row = self.db.execute(sql + " WHERE n.ts = ?", (ts,)).fetchone()
+        return json.loads(row["stations"]) if row else None
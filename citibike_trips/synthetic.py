@@ -0,0 +1,188 @@
+"""Synthetic stations feeds, trips and pages shaped like the citibike member site for benchmarks and offline runs.
+
+Everything is generated from a seed so the same arguments always give the same output.
+"""
+import datetime
+import random
+from xml.sax.saxutils import escape
+
+
+STREETS = ("W {} St", "E {} St", "{} Ave", "Broadway", "Bleecker St", "Lafayette St", "Park Pl", "Fulton St")
+DTS_OUT = "%m/%d/%Y %I:%M:%S %p"
+
+
+def station_names(n, seed=0):
+    """Return n distinct station names like 'W 17 St & 9 Ave'"""
+
+    r = random.Random(seed)
+    names = []
+    seen = set()
+    while len(names) < n:
+        a = r.choice(STREETS).format(r.randint(1, 200))
+        b = r.choice(STREETS).format(r.randint(1, 12))
+        name = "{} & {}".format(a, b)
+        if name in seen:
+            name = "{} {}".format(name, len(names))
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def stations_feed(n=1000, seed=0):
+    """Return GeoJSON stations feed with n stations spread over Manhattan and Brooklyn"""
+
+    r = random.Random(seed)
+    features = []
+    for i, name in enumerate(station_names(n, seed)):
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [-74.02 + r.random() * 0.1, 40.68 + r.random() * 0.15]},
+                "properties": {"name": name, "station_id": str(72 + i), "terminal": "{:04d}".format(5000 + i)},
+            }
+        )
+    return {"type": "FeatureCollection", "features": features}
+
+
+def trips(n, names=None, seed=0, start=datetime.datetime(2016, 1, 1), days=4 * 365):
+    """Return n trips newest first as tuples in csv_header order, the order the trips page scrapers return"""
+
+    r = random.Random(seed)
+    names = names or station_names(500, seed)
+    out = []
+    for i in range(n):
+        begin = start + datetime.timedelta(seconds=r.randrange(days * 86400))
+        seconds = r.randint(120, 3600)
+        end = begin + datetime.timedelta(seconds=seconds)
+        billed = "$ 0.00" if seconds < 2700 else "$ {:.2f}".format((seconds - 2700) // 900 * 2.5 + 2.5)
+        out.append(
+            (
+                r.choice(names),
+                r.choice(names),
+                begin.strftime(DTS_OUT),
+                end.strftime(DTS_OUT),
+                r.choice((0, 0, 0, 1, 2)),
+                r.choice((0, 0, 0, 1, 2)),
+                r.choice((0, 0, 0, 2, 4)),
+                billed,
+                "{} min {} s".format(seconds // 60, seconds % 60),
+            )
+        )
+    out.sort(key=lambda _: datetime.datetime.strptime(_[2], DTS_OUT), reverse=True)
+    return out
+
+
+TRIP_ROW = """<tr class="ed-table__item ed-table__item_trip">
+<td class="ed-table__col ed-table__item__info ed-table__item__info_trip-start"><div class="ed-table__item__info__sub-info ed-table__item__info__sub-info_trip-start-station">{start_name}</div>
+<div class="ed-table__item__info__sub-info ed-table__item__info__sub-info_trip-start-date">{start_time}</div>
+<div class="ed-table__item__info__sub-info ed-table__item__info__sub-info_trip-start-bike-angels-points">{start_points}</div></td>
+<td class="ed-table__col ed-table__item__info ed-table__item__info_trip-end"><div class="ed-table__item__info__sub-info ed-table__item__info__sub-info_trip-end-station">{end_name}</div>
+<div class="ed-table__item__info__sub-info ed-table__item__info__sub-info_trip-end-date">{end_time}</div>
+<div class="ed-table__item__info__sub-info ed-table__item__info__sub-info_trip-end-bike-angels-points">{end_points}</div></td>
+<td class="ed-table__col ed-table__item__info ed-table__item__info_trip-duration">{duration}</td>
+<td class="ed-table__col ed-table__item__info ed-table__item__info_trip-cost">{billed}</td>
+<td class="ed-table__col ed-table__item__info ed-table__item__info_trip-bike-angels-points">{points} points</td>
+</tr>"""
+
+TRIPS_PAGE = """<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>Trips | Citi Bike</title>
+<script>window.dataLayer = window.dataLayer || []; if (1 < 2) {{ dataLayer.push({{}}); }}</script></head>
+<body class="ed-profile-page">
+<ul class="ed-profile-menu"><li class="ed-profile-menu__link ed-profile-menu__link_trips ed-profile-menu__link_level1"><a href="/profile/trips/{account_id}">Trips</a></li></ul>
+<div class="ed-panel ed-panel_trips">
+<table class="ed-html-table ed-html-table_trip">
+<thead><tr><th>Start</th><th>End</th><th>Duration</th><th>Billed</th><th>Points</th></tr></thead>
+<tbody>
+{rows}
+</tbody></table>
+<div class="ed-paginated-navigation"><div class="ed-paginated-navigation__pages-group">
+<a class="ed-paginated-navigation__pages-group__link" href="/profile/trips/{account_id}?pageNumber={page}">{page}</a>
+<a class="ed-paginated-navigation__pages-group__link_last ed-paginated-navigation__pages-group__link" href="/profile/trips/{account_id}?pageNumber={last}">Last</a>
+</div></div></div></body></html>"""
+
+
+def trips_page(rows, page=1, last=1, account_id="ACCT1"):
+    """Return trips page html for trip tuples in csv_header order, which the scrapers extract back unchanged"""
+
+    html = []
+    for _ in rows:
+        html.append(
+            TRIP_ROW.format(
+                start_name=escape(_[0]),
+                end_name=escape(_[1]),
+                start_time=_[2],
+                end_time=_[3],
+                start_points=_[4],
+                end_points=_[5],
+                points=_[6],
+                billed=escape(_[7]),
+                duration=_[8],
+            )
+        )
+    return TRIPS_PAGE.format(rows="\n".join(html), page=page, last=last, account_id=account_id)
+
+
+PROFILE_VALUES = (
+    ("ed-panel__info__value ed-panel__info__value_firstname", "Jane"),
+    ("ed-panel__info__value ed-panel__info__value_lastname", "Doe"),
+    ("ed-panel__info__value ed-panel__info__value_username", "jdoe"),
+    ("ed-panel__info__value ed-panel__info__value_date-of-birth", "01/01/1980"),
+    ("ed-panel__info__value ed-panel__info__value_gender", "Female"),
+    ("ed-panel__info__value ed-panel__info__value_email", "jdoe@example.com"),
+    ("ed-panel__info__value ed-panel__info__value_phone-number", "+1 555 0100"),
+    ("ed-panel__info__value ed-panel__info__value_member-since", "05/27/2013"),
+    ("ed-panel__info__value ed-panel__info__value_bike-angel-since", "06/01/2017"),
+    (
+        "ed-panel__info__value ed-panel__info__value_member-stats-for-period "
+        "ed-panel__info__value_member-stats-for-period_lifetime",
+        "{lifetime}",
+    ),
+    ("ed-panel__info__value ed-panel__info__value_member-stats-for-period", "87 hours 35 minutes 52 seconds"),
+    ("ed-panel__info__value ed-panel__info__value_member-stats-for-period", "653.1&nbsp;miles"),
+    ("ed-panel__info__value ed-panel__info__value_member-stats-for-period", "27.1&nbsp;gallons"),
+    ("ed-panel__info__value ed-panel__info__value_member-stats-for-period", "530.5&nbsp;lbs"),
+    ("ed-panel__info__value__part", "70 points (August)"),
+    ("ed-panel__info__value__part ed-panel__info__value__part_1", "400 points"),
+    ("ed-panel__info__value__part ed-panel__info__value__part_2", "900 points"),
+    ("ed-panel__info__value__part ed-panel__info__value__part_start-date", "August 11th, 2019 12:47 PM"),
+    ("ed-panel__info__value__part ed-panel__info__value__part_end-date", "August 11th, 2019 1:03 PM"),
+    ("ed-panel__info__value__part ed-panel__info__value__part_start-station-name", "10 Ave &amp; W 28 St"),
+    ("ed-panel__info__value__part ed-panel__info__value__part_end-station-name", "W 17 St &amp; 9 Ave"),
+    ("ed-panel__info__value ed-panel__info__value_summary ed-panel__info__value_last-trip", "16 minutes 10 seconds"),
+    ("ed-panel__info__value ed-panel__info__value_last-trip-bike-angel", "2"),
+    ("ed-panel__info__value ed-panel__info__value_key-number", "123456789"),
+    ("ed-panel__info__value ed-panel__info__value_key-status", "Active"),
+    ("ed-panel__info__value ed-panel__info__value_subscription-type", "Annual Membership"),
+    ("ed-panel__info__value ed-panel__info__value_subscription-status", "Active"),
+    ("ed-panel__info__value ed-panel__info__value_subscription-end-date", "05/27/2021"),
+    ("ed-panel__info__value ed-panel__info__value_renewed-subscription-type", "Annual Membership"),
+    ("ed-panel__info__value ed-panel__info__value_renewed-subscription-status", "Pending"),
+    ("ed-panel__info__value ed-panel__info__value_renewed-subscription-start-date", "05/27/2021"),
+    ("ed-panel__info__value ed-panel__info__value_renewed-subscription-end-date", "05/27/2022"),
+    ("ed-panel__info__value ed-panel__info__value_period", "September 1st, 2020"),
+    ("ed-panel__info__value ed-panel__info__value_amount", "$ 0.00"),
+    ("ed-panel__info__value__part ed-panel__info__value__part_postalCode", "10001"),
+)
+
+FILLER = """<div class="ed-panel ed-panel_filler"><div class="ed-panel__header">Notice {0}</div>
+<div class="ed-panel__info ed-panel__info_with-label"><div class="ed-panel__info__label">Item {0}</div>
+<p class="ed-panel__text">Ride safely and remember to dock your bike at station {0}.</p></div></div>"""
+
+
+def profile_page(account_id="ACCT1", lifetime=1040, padding=0):
+    """Return profile page html with every field extract_profile reads, padding adds that many unrelated panels"""
+
+    values = "\n".join(
+        '<div class="ed-panel__info"><div class="{}">{}</div></div>'.format(cls, value.format(lifetime=lifetime))
+        for cls, value in PROFILE_VALUES
+    )
+    return """<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>Profile | Citi Bike</title></head>
+<body class="ed-profile-page">
+<ul class="ed-profile-menu"><li class="ed-profile-menu__link ed-profile-menu__link_trips ed-profile-menu__link_level1"><a href="/profile/trips/{account_id}">Trips</a></li></ul>
+{filler}
+<div class="ed-panel ed-panel_profile">
+{values}
+</div></body></html>""".format(
+        account_id=account_id, values=values, filler="\n".join(FILLER.format(_) for _ in range(padding))
+    )
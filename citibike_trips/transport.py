@@ -0,0 +1,130 @@
+import collections
+import inspect
+import logging
+import random
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+
+
+log = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RETRY_METHODS = ("GET", "HEAD")
+
+# urllib3 only lists br and zstd here when a decoder for them is installed, advertising more would break responses
+ACCEPT = ACCEPT_ENCODING.replace(",", ", ")
+
+
+class Session(requests.Session):
+    """requests Session applying a default timeout to every request and counting retries and status codes"""
+
+    def __init__(self, timeout=None):
+        """
+
+        :type timeout: float
+        """
+
+        super().__init__()
+        self.timeout = timeout
+        self.retried = 0
+        self.statuses = collections.Counter()
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        res = super().request(method, url, **kwargs)
+        self.statuses[res.status_code] += 1
+        retries = getattr(res.raw, "retries", None)
+        if retries is not None and retries.history:
+            self.retried += len(retries.history)
+            log.info("{} {} retried {} times".format(method, url, len(retries.history)))
+        return res
+
+
+def retry_kwargs(**kwargs):
+    """Drop Retry arguments the installed urllib3 does not have, backoff_jitter needs urllib3 2"""
+
+    known = inspect.signature(Retry.__init__).parameters
+    if "allowed_methods" in kwargs and "allowed_methods" not in known:
+        kwargs["method_whitelist"] = kwargs.pop("allowed_methods")
+    dropped = [_ for _ in kwargs if _ not in known and _ != "method_whitelist"]
+    if dropped:
+        log.debug("urllib3 Retry does not support {}".format(", ".join(dropped)))
+    return {k: v for k, v in kwargs.items() if k not in dropped}
+
+
+def session(user_agent="curl", pool_size=10, timeout=60, retries=3, backoff=0.5):
+    """Return Session with a keep-alive connection pool of pool_size per host, compression and retries.
+
+    GET requests answered with 429 or 5xx, or failing to connect, are retried with exponential backoff of backoff
+    seconds, doubled each attempt, plus up to backoff seconds of random jitter, honouring Retry-After. POST is never
+    retried so a login is not sent twice."""
+
+    s = Session(timeout=timeout)
+    retry = Retry(
+        **retry_kwargs(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(RETRY_METHODS),
+            backoff_factor=backoff,
+            backoff_jitter=backoff,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, pool_size), max_retries=retry)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    s.headers.update({"User-Agent": user_agent, "Accept-Encoding": ACCEPT, "Connection": "keep-alive"})
+    return s
+
+
+def backoff_delay(attempt, backoff=0.5, retry_after=None):
+    """Seconds to wait before retry number attempt, starting at 1, same policy as the requests session"""
+
+    if retry_after is not None:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+    return backoff * 2 ** (attempt - 1) + random.uniform(0, backoff)
+
+
+def connection_stats(s):
+    """Return dict of connection pool statistics for a requests session.
+
+    requests minus connections is how many requests went over an already open connection, a crawl reusing keep-alive
+    connections opens about one connection per worker whatever the number of pages."""
+
+    hosts = {}
+    seen = set()
+    for adapter in s.adapters.values():
+        if id(adapter) in seen or not hasattr(adapter, "poolmanager"):
+            continue
+        seen.add(id(adapter))
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            _ = hosts.setdefault("{}://{}:{}".format(pool.scheme, pool.host, pool.port), {"connections": 0, "requests": 0})
+            _["connections"] += pool.num_connections
+            _["requests"] += pool.num_requests
+
+    connections = sum(_["connections"] for _ in hosts.values())
+    total = sum(_["requests"] for _ in hosts.values())
+    return {
+        "connections": connections,
+        "requests": total,
+        "reused": total - connections,
+        "reuse_ratio": (total - connections) / total if total else None,
+        "retried": getattr(s, "retried", 0),
+        "statuses": dict(getattr(s, "statuses", {})),
+        "hosts": hosts,
+    }
@@ -0,0 +1,237 @@
+import csv
+import gzip
+import itertools
+import json
+import logging
+import os
+
+
+log = logging.getLogger(__name__)
+
+COMPRESSION = {".gz": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+
+# separators json.dumps uses with an indent, without one output is compact
+COMPACT = (",", ":")
+
+# bytes of encoded json collected before each write to the file
+CHUNK_SIZE = 1 << 16
+
+
+def compression(file):
+    """Return gzip, zstd or None from the file name extension"""
+
+    return COMPRESSION.get(os.path.splitext(file)[1].lower())
+
+
+def zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("zstd compressed files need the zstandard package") from e
+    return zstandard
+
+
+def open_text(file, mode="r"):
+    """Open file for reading or writing utf-8 text, through gzip or zstd when the name ends in .gz or .zst"""
+
+    kind = compression(file)
+    if kind == "gzip":
+        # zlib's default level, gzip's 9 is several times slower for a few percent smaller files
+        return gzip.open(file, mode + "t", compresslevel=6, encoding="utf-8")
+    if kind == "zstd":
+        return zstandard().open(file, mode + "t", encoding="utf-8")
+    return open(file, mode, encoding="utf-8")
+
+
+def read_bytes(file):
+    """Return the uncompressed content of file"""
+
+    with open(file, "rb") as f:
+        raw = f.read()
+    kind = compression(file)
+    if kind == "gzip":
+        return gzip.decompress(raw)
+    if kind == "zstd":
+        return zstandard().ZstdDecompressor().decompressobj().decompress(raw)
+    return raw
+
+
+def find_json(file):
+    """Return file or the first of its .gz and .zst compressed variants that exists, file when none do"""
+
+    for _ in (file, file + ".gz", file + ".zst"):
+        if os.path.exists(_):
+            return _
+    return file
+
+
+def iter_json(obj, indent=None, depth=2, batch=1000, level=0, encoder=None):
+    """Generator of pieces of the json text of obj, the same text json.dumps gives.
+
+    Dicts down to depth are split by key, lists and other iterables are encoded batch items at a time, so a big
+    trips list or stations feed is never encoded as one string. Without an indent the output is compact."""
+
+    if encoder is None:
+        encoder = json.JSONEncoder(indent=indent, separators=None if indent is not None else COMPACT)
+    close_pad = "\n" + " " * indent * level if indent is not None else ""
+
+    if isinstance(obj, dict) and obj and depth:
+        if indent is None:
+            sep, open_pad, colon = ",", "", ":"
+        else:
+            open_pad = "\n" + " " * indent * (level + 1)
+            sep, colon = "," + open_pad, ": "
+        yield "{" + open_pad
+        for i, (key, value) in enumerate(obj.items()):
+            if i:
+                yield sep
+            yield json.dumps(key if isinstance(key, str) else encoder.encode(key)) + colon
+            yield from iter_json(value, indent, depth - 1, batch, level + 1, encoder)
+        yield close_pad + "}"
+        return
+
+    if isinstance(obj, (str, bytes, dict)) or not hasattr(obj, "__iter__"):
+        text = encoder.encode(obj)
+        # strings in json never hold a raw newline, so every newline is indentation
+        yield text.replace("\n", close_pad) if indent and level else text
+        return
+
+    items = iter(obj)
+    first = True
+    while True:
+        chunk = list(itertools.islice(items, batch))
+        if not chunk:
+            break
+        text = encoder.encode(chunk)
+        if indent and level:
+            text = text.replace("\n", close_pad)
+        # drop the brackets, and the newline before the closing one, to join batches into one list
+        yield ("[" if first else ",") + text[1 : len(text) - 1 - len(close_pad)]
+        first = False
+    yield "[]" if first else close_pad + "]"
+
+
+def write_json(obj, file, indent=None, chunk_size=CHUNK_SIZE):
+    """Stream obj as json to file in chunks, compressed by extension, compact unless indent is given"""
+
+    with open_text(file, "w") as f:
+        chunk = []
+        size = 0
+        for piece in iter_json(obj, indent=indent):
+            chunk.append(piece)
+            size += len(piece)
+            if size >= chunk_size:
+                f.write("".join(chunk))
+                chunk = []
+                size = 0
+        f.write("".join(chunk))
+
+
+def read_json(file):
+    """Return object read from a json file, decompressed by extension"""
+
+    with open_text(file, "r") as f:
+        return json.load(f)
+
+
+class TripsCsvWriter:
+    """Write trips to a CSV file, flushing after every write.
+
+    The file is truncated unless append is set. Appending only writes the header when the file is new or empty, so
+    repeated runs can append to the same file."""
+
+    file: str
+    count: int
+
+    def __init__(self, file, header, append=False):
+        """
+
+        :type file: str
+        :type header: tuple
+        :type append: bool
+        """
+
+        self.file = file
+        self.count = 0
+        new = not append or not os.path.exists(file) or os.path.getsize(file) == 0
+        log.info("streaming trips csv to {}".format(file))
+        self.f = open(file, "a" if append else "w")
+        self.writer = csv.writer(self.f)
+        if new:
+            self.writer.writerow(header)
+            self.f.flush()
+
+    def write(self, trips):
+        """Append trips and flush to disk"""
+
+        self.writer.writerows(trips)
+        self.f.flush()
+        self.count += len(trips)
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TripsNdjsonWriter:
+    """Write trips to a newline delimited json file, one trip array per line, flushing after every write.
+
+    The file is truncated unless append is set."""
+
+    file: str
+    count: int
+
+    def __init__(self, file, append=False):
+        """
+
+        :type file: str
+        :type append: bool
+        """
+
+        self.file = file
+        self.count = 0
+        log.info("streaming trips ndjson to {}".format(file))
+        self.f = open(file, "a" if append else "w", encoding="utf-8")
+
+    def write(self, trips):
+        """Append trips and flush to disk"""
+
+        self.f.write("".join("{}\n".format(json.dumps(trip)) for trip in trips))
+        self.f.flush()
+        self.count += len(trips)
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_csv(file):
+    """Generator of row lists from a CSV file written by TripsCsvWriter, skipping the header"""
+
+    with open_text(file, "r") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        yield from reader
+
+
+def read_ndjson(file):
+    """Generator of objects from a newline delimited json file, skipping a truncated last line"""
+
+    with open_text(file, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                log.warning("skipping unreadable line in {}".format(file))
@@ -0,0 +1,92 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from citibike_trips import synthetic
+
+
+LOGIN = '<html><body><form><input name="_login_csrf_security_token" value="token"></form></body></html>'
+
+
+class MemberSite:
+    """Stand-in for the citibike member site serving synthetic profile, trips pages and stations feed"""
+
+    def __init__(self, trips=95, per_page=10, delay=0.0):
+        self.stations = synthetic.stations_feed(50)
+        names = [_["properties"]["name"] for _ in self.stations["features"]]
+        self.history = synthetic.trips(trips, names=names)
+        self.per_page = per_page
+        self.last = max(1, -(-trips // per_page))
+        self.delay = delay
+        self.hits = []
+        self.active = 0
+        self.most_active = 0
+        self.lock = threading.Lock()
+
+    def page(self, n):
+        rows = self.history[(n - 1) * self.per_page : n * self.per_page]
+        return synthetic.trips_page(rows, page=n, last=self.last)
+
+    def respond(self, path):
+        if path.startswith("/profile/login"):
+            return LOGIN, "text/html"
+        if path.startswith("/profile/trips/"):
+            return self.page(int(path.split("pageNumber=")[1])), "text/html"
+        if path.startswith("/profile/"):
+            return synthetic.profile_page(), "text/html"
+        if path.startswith("/stations"):
+            return json.dumps(self.stations), "application/json"
+        return None, None
+
+    def handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send(self, body, content_type="text/html", status=200):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                with site.lock:
+                    site.hits.append(self.path)
+                    site.active += 1
+                    site.most_active = max(site.most_active, site.active)
+                try:
+                    time.sleep(site.delay)
+                    body, content_type = site.respond(self.path)
+                    if body is None:
+                        self.send("not found", status=404)
+                    else:
+                        self.send(body, content_type)
+                finally:
+                    with site.lock:
+                        site.active -= 1
+
+            def do_POST(self):
+                site.hits.append(self.path)
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.send("ok")
+
+        return Handler
+
+
+@pytest.fixture
+def member_site():
+    site = MemberSite(delay=0.02)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), site.handler())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    site.base = "http://127.0.0.1:{}".format(server.server_address[1])
+    yield site
+    server.shutdown()
+    server.server_close()
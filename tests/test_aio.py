@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from citibike_trips import CitibikeTrips
+from citibike_trips.aio import AsyncCitibikeTrips
+
+
+def options(site, **kwargs):
+    return dict(url_member_base=site.base, url_stations=site.base + "/stations", http_wait=0, formats=(), **kwargs)
+
+
+def trips_hits(site):
+    return [_ for _ in site.hits if "pageNumber=" in _]
+
+
+def test_get_trips_matches_sync_client(member_site):
+    async def main():
+        async with AsyncCitibikeTrips("user", "pass", http_limit_per_host=3, **options(member_site)) as cb:
+            return await cb.get_trips(last_page=0)
+
+    trips = asyncio.run(main())
+    assert trips == member_site.history
+    hits = trips_hits(member_site)
+    assert sorted(hits) == sorted(set(hits)) and len(hits) == member_site.last
+    assert member_site.most_active <= 3
+
+    del member_site.hits[:]
+    assert CitibikeTrips("user", "pass", **options(member_site)).get_trips(last_page=0) == trips
+    assert len(trips_hits(member_site)) == member_site.last
+
+
+def test_lxml_recent_pages(member_site):
+    async def main():
+        async with AsyncCitibikeTrips("user", "pass", parser="lxml", **options(member_site)) as cb:
+            assert await cb.login()
+            await cb.extract_profile()
+            return [tp async for tp, trips in cb.iter_trips_pages(last_page=3)]
+
+    assert asyncio.run(main()) == [1, 2, 3]
+    assert len(trips_hits(member_site)) == 3
+
+
+def test_slow_consumer_bounds_pages_in_flight(member_site):
+    async def main():
+        async with AsyncCitibikeTrips("user", "pass", http_limit_per_host=2, **options(member_site)) as cb:
+            await cb.login()
+            async for tp, trips in cb.iter_trips_pages(last_page=0):
+                # pages keep arriving while the consumer is busy, but only up to two per connection
+                await asyncio.sleep(0.3)
+                break
+
+    asyncio.run(main())
+    assert len(trips_hits(member_site)) <= 2 * 2 + 1 < member_site.last
+
+
+@pytest.mark.parametrize("option", [dict(incremental=True), dict(http_cache=True), dict(offline=True)])
+def test_unsupported_options(tmp_path, option):
+    with pytest.raises(ValueError):
+        AsyncCitibikeTrips("user", "pass", keep=str(tmp_path), **option)
+    assert not list(tmp_path.iterdir())
+
+
+def test_no_requests_session(tmp_path):
+    cb = AsyncCitibikeTrips("user", "pass", keep=str(tmp_path))
+    assert cb.s is None and cb.cache is None
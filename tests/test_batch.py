@@ -0,0 +1,22 @@
+import pytest
+
+from citibike_trips import CitibikeTrips, batch
+
+
+def test_accounts_get_separate_caches(tmp_path):
+    config = {
+        "keep": str(tmp_path),
+        "http_cache": True,
+        "accounts": [{"username": "a@example.com", "password": "x"}, {"username": "b@example.com", "password": "x"}],
+    }
+    options, processes = batch.account_options(config)
+    clients = [CitibikeTrips(**{k: v for k, v in _.items() if k != "last_page"}) for _ in options]
+    assert clients[0].cache.directory != clients[1].cache.directory
+
+
+def test_same_login_twice_with_cache():
+    config = {"offline": True, "accounts": [{"username": "a", "password": "x"}, {"username": "a", "password": "y"}]}
+    with pytest.raises(ValueError):
+        batch.account_options(config)
+    config["offline"] = False
+    assert len(batch.account_options(config)[0]) == 2
@@ -0,0 +1,73 @@
+import pytest
+import requests
+
+from citibike_trips import CitibikeTrips
+from citibike_trips.cache import ResponseCache
+
+
+def classify(url):
+    if "pageNumber=" in url:
+        return "trips_first" if url.endswith("pageNumber=1") else "trips"
+    return "profile"
+
+
+def fetch(url, **kwargs):
+    res = requests.models.Response()
+    res.url = url
+    res.status_code = 200
+    res._content = url.encode("utf-8")
+    return res
+
+
+def test_invalidate_on_change_drops_deep_pages(tmp_path):
+    cache = ResponseCache(str(tmp_path), classify)
+    urls = ["https://example.com/trips?pageNumber={}".format(_) for _ in (1, 2, 3)]
+    for url in urls:
+        cache.get(fetch, url)
+
+    assert cache.invalidate_on_change("trips", [3, ["07/04/2019 05:32:10 PM", "W 17 St & 9 Ave"]]) == 2
+    assert cache.invalidate_on_change("trips", [3, ["07/04/2019 05:32:10 PM", "W 17 St & 9 Ave"]]) == 0
+    cache.get(fetch, urls[1])
+    assert cache.hits == 0 and cache.misses == 4
+
+    cache.get(fetch, urls[1])
+    assert cache.hits == 1
+    assert cache.invalidate_on_change("trips", [3, ["07/05/2019 08:00:00 AM", "W 17 St & 9 Ave"]]) == 1
+    assert cache.load(urls[0])[0] is not None
+
+
+def test_offline_keeps_pages(tmp_path):
+    ResponseCache(str(tmp_path), classify).get(fetch, "https://example.com/trips?pageNumber=2")
+    cache = ResponseCache(str(tmp_path), classify, offline=True)
+    assert cache.invalidate_on_change("trips", [9]) == 0
+    assert cache.get(fetch, "https://example.com/trips?pageNumber=2").status_code == 200
+
+
+def test_cache_needs_keep():
+    with pytest.raises(ValueError):
+        CitibikeTrips("user", "pass", http_cache=True)
+
+
+def test_invalidate_on_change_per_prefix(tmp_path):
+    cache = ResponseCache(str(tmp_path), classify)
+    for account in ("A", "B"):
+        cache.invalidate_on_change("trips", [3, account], prefix="https://example.com/trips/{}".format(account))
+        for page in (1, 2, 3):
+            cache.get(fetch, "https://example.com/trips/{}?pageNumber={}".format(account, page))
+
+    assert cache.invalidate_on_change("trips", [4, "B"], prefix="https://example.com/trips/B") == 2
+    assert cache.invalidate_on_change("trips", [3, "A"], prefix="https://example.com/trips/A") == 0
+    assert cache.load("https://example.com/trips/A?pageNumber=2")[0] is not None
+
+
+def test_cache_per_username(member_site, tmp_path):
+    options = dict(url_member_base=member_site.base, url_stations=member_site.base + "/stations", http_wait=0)
+    a = CitibikeTrips("alice", "pass", keep=str(tmp_path), http_cache=True, formats=(), **options)
+    a.get_trips(last_page=0)
+    b = CitibikeTrips("bob", "pass", keep=str(tmp_path), offline=True, formats=(), **options)
+    assert a.cache.directory != b.cache.directory
+    assert b.http_get(b.url_profile).status_code == 504
+
+    del member_site.hits[:]
+    CitibikeTrips("alice", "pass", keep=str(tmp_path), http_cache=True, formats=(), **options).get_trips(last_page=0)
+    assert len([_ for _ in member_site.hits if "pageNumber=" in _]) == 1
@@ -0,0 +1,101 @@
+import datetime
+
+import pytz
+
+from citibike_trips import CitibikeTrips, hydrate, parse, records, synthetic
+
+
+def scraped_client(n=40, seed=0):
+    """Return CitibikeTrips with trips scraped from a synthetic trips page and the matching stations feed"""
+
+    stations = synthetic.stations_feed(50, seed=seed)
+    names = [_["properties"]["name"] for _ in stations["features"]]
+    page = synthetic.trips_page(synthetic.trips(n, names=names, seed=seed)).encode("utf-8")
+    cb = CitibikeTrips("user", "pass")
+    cb.stations = stations
+    cb.account["id"] = ["ACCT1"]
+    cb.trips = parse.extract_trip_rows(page)
+    return cb
+
+
+def test_hydrate_scraped_page():
+    cb = scraped_client()
+    ids = {_["properties"]["name"]: _["properties"]["station_id"] for _ in cb.stations["features"]}
+    full = cb.hydrate_trips()
+    assert len(full) == len(cb.trips)
+    for scraped, row in zip(cb.trips, full):
+        trip = records.Trip(*scraped)
+        hydrated = records.TripFull(*row)
+        assert hydrated.account_id == "ACCT1"
+        assert hydrated.start_name == trip.start_name and hydrated.start_time == trip.start_time
+        assert hydrated.start_id == ids[trip.start_name]
+        assert hydrated.end_id == ids[trip.end_name]
+        assert hydrated.start_epoch == cb.time_cache.convert(trip.start_time)[0]
+        assert hydrated.end_epoch == cb.time_cache.convert(trip.end_time)[0]
+        assert hydrated.end_iso8601 == cb.time_cache.convert(trip.end_time)[1]
+        assert hydrated.seconds == cb.str_to_secs(trip.duration)
+
+
+def test_hydrate_unknown_station_and_end_time():
+    cb = scraped_client(n=2)
+    first = list(cb.trips[0])
+    first[1] = "Nowhere & Nothing"
+    second = list(cb.trips[1])
+    second[3] = "-"
+    cb.trips = [tuple(first), tuple(second)]
+    full = [records.TripFull(*_) for _ in cb.hydrate_trips()]
+    assert full[0].end_id == "-" and full[0].end_epoch == "-" and full[0].start_id != "-"
+    assert full[1].end_id != "-" and full[1].end_epoch == "-" and full[1].start_epoch != "-"
+
+
+def test_time_cache_twelve_hour_clock():
+    tz = pytz.timezone("US/Eastern")
+    times = hydrate.TimeCache("US/Eastern")
+    values = [
+        "07/04/2019 05:32:10 PM",
+        "07/04/2019 05:32:10 AM",
+        "07/04/2019 12:05:00 AM",
+        "07/04/2019 12:05:00 PM",
+        "07/04/2019 11:59:59 pm",
+        "03/10/2019 01:30:00 AM",
+        "11/03/2019 01:30:00 AM",
+        "12/31/2019 12:00:00 PM",
+    ]
+    for value in values:
+        dtz = tz.localize(datetime.datetime.strptime(value, "%m/%d/%Y %I:%M:%S %p"))
+        assert times.convert(value) == (int(dtz.timestamp()), dtz.isoformat())
+    assert times.convert("07/04/2019 12:05:00 PM")[1] == "2019-07-04T12:05:00-04:00"
+    assert times.convert("07/04/2019 12:05:00 AM")[1] == "2019-07-04T00:05:00-04:00"
+    assert times.convert("07/04/2019 05:32:10 PM")[1] == "2019-07-04T17:32:10-04:00"
+
+
+def test_convert_column_matches_convert():
+    times = hydrate.TimeCache("US/Eastern")
+    # across the spring change, then the first hours of the fall change minute by minute
+    minutes = [datetime.datetime(2019, 3, 9) + datetime.timedelta(minutes=7 * _) for _ in range(1000)]
+    minutes += [datetime.datetime(2019, 11, 3) + datetime.timedelta(minutes=_) for _ in range(150)]
+    values = [_.strftime("%m/%d/%Y %I:%M:%S %p") for _ in minutes]
+    values += ["07/04/2019 05:32:10 pm", "02/30/2019 01:00:00 PM", "07/04/2019 13:00:00 PM", "-", ""]
+    epochs, isos = times.convert_column(values)
+    for value, epoch, iso in zip(values, epochs, isos):
+        try:
+            expected = hydrate.TimeCache("US/Eastern").convert(value)
+        except ValueError:
+            expected = None, None
+        assert (epoch, iso) == expected, value
+    assert epochs[-5:] == [epochs[-5], None, None, None, None]
+    assert times.info()["sliced"] < len(values) - 5
+
+
+def test_hydrate_compact_matches_rows():
+    stations = synthetic.stations_feed(50, seed=5)
+    names = [_["properties"]["name"] for _ in stations["features"]]
+    trips = synthetic.trips(3000, names=names, seed=5)
+    hydrated = []
+    for compact in (False, True):
+        cb = CitibikeTrips("user", "pass", compact=compact)
+        cb.stations = stations
+        cb.account["id"] = ["ACCT1"]
+        cb.trips = cb.trips_table(trips)
+        hydrated.append([tuple(_) for _ in cb.hydrate_trips()])
+    assert hydrated[0] == hydrated[1] and len(hydrated[0]) == 3000
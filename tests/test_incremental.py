@@ -0,0 +1,56 @@
+import json
+
+from citibike_trips import CitibikeTrips, synthetic
+
+
+def client(keep, history, per_page=10):
+    """Return CitibikeTrips in incremental mode whose trips pages serve history per_page trips at a time"""
+
+    pages = [history[i : i + per_page] for i in range(0, len(history), per_page)]
+    cb = CitibikeTrips("user", "pass", keep=str(keep), incremental=True)
+    cb.trips_last = len(pages)
+    cb.fetched = []
+
+    def get_trips_page(tp):
+        cb.fetched.append(tp)
+        return pages[tp - 1]
+
+    cb.get_trips_page = get_trips_page
+    return cb
+
+
+def snapshot(keep, trips, ts=1000):
+    with open(keep / "cb_trips_{}.json".format(ts), "w") as f:
+        json.dump(trips, f)
+
+
+def test_pages_until_overlap_past_last_page(tmp_path):
+    history = synthetic.trips(60, seed=6)
+    snapshot(tmp_path, history[35:])
+    cb = client(tmp_path, history)
+    cb.get_trips_incremental(last_page=1)
+    assert cb.fetched == [1, 2, 3, 4]
+    assert cb.trips_new == history[:35]
+    assert [tuple(_) for _ in cb.trips] == history
+
+
+def test_overlap_ignores_changed_billed_amount(tmp_path):
+    history = synthetic.trips(30, seed=7)
+    known = [list(_) for _ in history[5:]]
+    known[0][7] = "$ 99.00"
+    snapshot(tmp_path, known)
+    cb = client(tmp_path, history)
+    cb.get_trips_incremental()
+    assert cb.fetched == [1]
+    assert cb.trips_new == history[:5]
+    assert len(cb.trips) == 30
+
+
+def test_no_overlap_merges_full_crawl(tmp_path):
+    history = synthetic.trips(25, seed=8)
+    dropped = synthetic.trips(3, seed=9, days=30)
+    snapshot(tmp_path, dropped)
+    cb = client(tmp_path, history)
+    cb.get_trips_incremental(last_page=1)
+    assert cb.fetched == [1, 2, 3]
+    assert [tuple(_) for _ in cb.trips] == history + dropped
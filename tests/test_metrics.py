@@ -0,0 +1,36 @@
+import asyncio
+
+from citibike_trips import CitibikeTrips
+from citibike_trips.aio import AsyncCitibikeTrips
+
+
+def options(site):
+    return dict(url_member_base=site.base, url_stations=site.base + "/stations", http_wait=0.2, formats=())
+
+
+def check_pages(cb):
+    pages = cb.metrics.as_dict()["pages"]
+    assert [_["page"] for _ in pages] == [1, 2, 3]
+    for page in pages:
+        # requests wait up to http_wait on the limiter, minus time spent parsing, the site answers in about 0.02s
+        assert 0.05 < page["wait"] < 0.4
+        assert 0 < page["fetch"] < 0.15
+    assert cb.metrics.as_dict()["totals"]["wait"] == sum(_["wait"] for _ in pages)
+
+
+def test_page_fetch_excludes_rate_limit_wait(member_site):
+    cb = CitibikeTrips("user", "pass", **options(member_site))
+    cb.login()
+    cb.get_trips_loop(last_page=3)
+    check_pages(cb)
+    assert "trips_page_wait_seconds_total" in cb.metrics.prometheus()
+
+
+def test_async_page_fetch_excludes_rate_limit_wait(member_site):
+    async def main():
+        async with AsyncCitibikeTrips("user", "pass", **options(member_site)) as cb:
+            await cb.login()
+            await cb.get_trips_loop(last_page=3)
+            return cb
+
+    check_pages(asyncio.run(main()))
@@ -0,0 +1,24 @@
+import time
+
+from citibike_trips import CitibikeTrips
+from citibike_trips.ratelimit import RateLimiter
+
+
+def test_rate_overrides_wait():
+    limiter = RateLimiter(rate=50, burst=4, wait=1)
+    assert (limiter.rate, limiter.burst) == (50, 4)
+    t = time.monotonic()
+    waited = sum(limiter.acquire() for _ in range(9))
+    assert 0.08 <= time.monotonic() - t < 0.5
+    assert waited > 0
+
+
+def test_wait_without_rate():
+    limiter = RateLimiter(burst=4, wait=0.5)
+    assert (limiter.rate, limiter.burst) == (2, 1)
+    assert RateLimiter(burst=4, wait=0).rate is None
+
+
+def test_client_rate():
+    cb = CitibikeTrips("user", "pass", http_workers=3, http_rate=6)
+    assert (cb.limiter.rate, cb.limiter.burst) == (6, 3)
@@ -0,0 +1,62 @@
+import datetime
+
+from citibike_trips import CitibikeTrips, parse, records, routes, synthetic
+
+
+def scraped(n, seed=0, start=datetime.datetime(2016, 1, 1), days=365):
+    names = synthetic.station_names(20, seed=0)
+    page = synthetic.trips_page(synthetic.trips(n, names=names, seed=seed, start=start, days=days))
+    return parse.extract_trip_rows(page.encode("utf-8"))
+
+
+def test_add_scraped_trips():
+    trips = scraped(200)
+    od = routes.ODMatrix()
+    assert od.add(trips, records.TRIP_FIELDS) == 200
+    assert set(od.names) <= set(synthetic.station_names(20, seed=0))
+    assert sum(od.counts.values()) == 200
+    assert sum(_["count"] for _ in od.top_routes(1000)) == 200
+
+
+def test_add_again_after_save_counts_only_newer_trips():
+    old = scraped(100, seed=1)
+    od = routes.ODMatrix()
+    od.add(old, records.TRIP_FIELDS)
+    od = routes.ODMatrix.from_dict(od.to_dict())
+    assert od.add(old, records.TRIP_FIELDS) == 0
+
+    new = scraped(10, seed=2, start=datetime.datetime(2017, 6, 1), days=30)
+    assert od.add(new + old, records.TRIP_FIELDS) == 10
+    assert od.trips == 110
+    assert od.to_dict()["newest"] == routes.time_key(new[0][2])
+
+
+def test_time_key_orders_afternoon_after_noon():
+    assert routes.time_key("07/04/2019 12:10:00 PM") < routes.time_key("07/04/2019 01:10:00 PM")
+    assert routes.time_key("07/04/2019 12:10:00 AM") < routes.time_key("07/04/2019 01:10:00 AM")
+    assert routes.time_key("not a time") is None
+
+
+def test_add_older_trips_after_recent_page():
+    history = scraped(100, seed=3)
+    od = routes.ODMatrix()
+    assert od.add(history[:10], records.TRIP_FIELDS) == 10
+    od = routes.ODMatrix.from_dict(od.to_dict())
+    assert od.add(history, records.TRIP_FIELDS) == 90
+    assert od.trips == 100 and sum(od.counts.values()) == 100
+    assert od.add(history, records.TRIP_FIELDS) == 0
+
+
+def test_unhydrated_trips_are_not_timed():
+    header = ("start_time", "start_name", "end_name", "seconds")
+    od = routes.ODMatrix()
+    od.add([("07/04/2019 05:32:10 PM", "A", "B", 600), ("07/03/2019 05:32:10 PM", "A", "B", 0)], header)
+    assert od.between("A", "B") == {"start": "A", "end": "B", "count": 2, "seconds": 600, "mean_seconds": 600}
+
+
+def test_recent_run_then_full_run(member_site, tmp_path):
+    options = dict(url_member_base=member_site.base, url_stations=member_site.base + "/stations", http_wait=0)
+    CitibikeTrips("user", "pass", keep=str(tmp_path), formats=("routes",), **options).get_trips(last_page=1)
+    assert routes.ODMatrix.load(str(tmp_path / "cb_routes.json")).trips == member_site.per_page
+    CitibikeTrips("user", "pass", keep=str(tmp_path), formats=("routes",), **options).get_trips(last_page=0)
+    assert routes.ODMatrix.load(str(tmp_path / "cb_routes.json")).trips == len(member_site.history)
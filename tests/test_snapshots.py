@@ -0,0 +1,36 @@
+import json
+
+from citibike_trips import records, snapshots, synthetic
+
+
+def full_row(trip, observed):
+    values = dict(records.Trip(*trip).as_dict(), account_id="ACCT1", observed=observed)
+    return tuple(values.get(_, "-") for _ in records.TRIP_FULL_FIELDS)
+
+
+def write(directory, kind, ts, rows):
+    with open(directory / "cb_{}_{}.json".format(kind, ts), "w") as f:
+        json.dump(rows, f)
+
+
+def test_merge_keeps_each_trip_once_newest_version(tmp_path):
+    trips = synthetic.trips(100, seed=4)
+    for ts in (1000, 2000, 3000):
+        write(tmp_path, "trips_full", ts, [full_row(_, ts) for _ in trips])
+        # billed changes after the first snapshot, the newest value wins
+        write(tmp_path, "trips", ts, [_[:7] + ("$ {}.00".format(ts),) + _[8:] for _ in trips])
+
+    history = snapshots.load_history(str(tmp_path), kinds=("trips", "trips_full"), processes=2)
+    assert len(history.trips_full) == 100
+    assert {records.TripFull(*_).observed for _ in history.trips_full} == {3000}
+    assert len(history.trips) == 100
+    assert {records.Trip(*_).billed for _ in history.trips} == {"$ 3000.00"}
+
+
+def test_merge_adds_older_trips_after_newer():
+    merged = {}
+    key = snapshots.TRIP_KEYS["trips"]
+    trips = synthetic.trips(10, seed=5)
+    snapshots.merge_trips(merged, trips[:6], key)
+    snapshots.merge_trips(merged, trips[3:], key)
+    assert list(merged.values()) == trips
@@ -0,0 +1,20 @@
+from citibike_trips import CitibikeTrips
+
+
+def options(site, keep, **kwargs):
+    return dict(url_member_base=site.base, url_stations=site.base + "/stations", http_wait=0, keep=str(keep), **kwargs)
+
+
+def test_stations_ttl_without_feed_format(member_site, tmp_path):
+    for _ in range(3):
+        cb = CitibikeTrips("user", "pass", **options(member_site, tmp_path, formats=("json",), stations_ttl=3600))
+        cb.get_stations()
+        assert cb.stations == member_site.stations
+    assert member_site.hits.count("/stations") == 1
+
+
+def test_stations_downloaded_without_ttl(member_site, tmp_path):
+    for _ in range(2):
+        CitibikeTrips("user", "pass", **options(member_site, tmp_path, formats=("json",))).get_stations()
+    assert member_site.hits.count("/stations") == 2
+    assert not (tmp_path / "stations").exists()
@@ -0,0 +1,23 @@
+from citibike_trips import CitibikeTrips, parse, records, synthetic
+from citibike_trips.store import TripStore
+
+
+def test_save_scraped_trips(tmp_path):
+    rows = synthetic.trips(20, seed=13)
+    trips = parse.extract_trip_rows(synthetic.trips_page(rows).encode("utf-8"))
+    with TripStore(str(tmp_path / "trips.sqlite")) as db:
+        assert db.save_trips(trips, records.TRIP_FIELDS, "ACCT1", 1000) == 20
+        assert db.save_trips(trips, records.TRIP_FIELDS, "ACCT1", 2000) == 20
+        stored = db.query_trips(account_id="ACCT1")
+    assert len(stored) == 20
+    assert {(_["start_time"], _["start_name"], _["end_name"]) for _ in stored} == {(_[2], _[0], _[1]) for _ in rows}
+    assert {_["last_observed"] for _ in stored} == {2000}
+
+
+def test_save_account_resolves_account_id(tmp_path):
+    cb = CitibikeTrips("user", "pass", keep=str(tmp_path), formats=("sqlite",))
+    cb.soup_profile = parse.soup(synthetic.profile_page(account_id="ACCT7"))
+    cb.save_account()
+    with TripStore(str(tmp_path / "citibike_trips.sqlite")) as db:
+        assert db.load_account("-") is None
+        assert db.load_account("ACCT7")["id"] == ["ACCT7"]
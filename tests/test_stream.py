@@ -0,0 +1,41 @@
+from citibike_trips import CitibikeTrips, synthetic, writers
+
+
+def client(history, per_page=10, **kwargs):
+    """Return CitibikeTrips whose trips pages serve history per_page trips at a time"""
+
+    cb = CitibikeTrips("user", "pass", **kwargs)
+    pages = [history[i : i + per_page] for i in range(0, len(history), per_page)]
+    cb.iter_trips_pages = lambda last_page=0: enumerate(pages, 1)
+    return cb
+
+
+def test_rewrites_by_default(tmp_path):
+    csv_file, ndjson_file = str(tmp_path / "trips.csv"), str(tmp_path / "trips.ndjson")
+    history = synthetic.trips(25, seed=10)
+    for _ in range(2):
+        assert client(history).write_trips_stream(csv_file=csv_file, ndjson_file=ndjson_file) == 25
+    assert len(list(writers.read_csv(csv_file))) == 25
+    assert len(list(writers.read_ndjson(ndjson_file))) == 25
+
+
+def test_incremental_appends_new_trips(tmp_path):
+    csv_file, ndjson_file = str(tmp_path / "trips.csv"), str(tmp_path / "trips.ndjson")
+    history = synthetic.trips(25, seed=11)
+    client(history[12:]).write_trips_stream(csv_file=csv_file, ndjson_file=ndjson_file)
+
+    cb = client(history, incremental=True)
+    assert cb.write_trips_stream(csv_file=csv_file, ndjson_file=ndjson_file) == 12
+    assert list(map(tuple, writers.read_ndjson(ndjson_file))) == history[12:] + history[:12]
+    rows = list(writers.read_csv(csv_file))
+    assert len(rows) == 25 and [_[2] for _ in rows[13:]] == [_[2] for _ in history[:12]]
+    with open(csv_file) as f:
+        assert f.read().count("start_name") == 1
+
+
+def test_incremental_reads_csv_without_ndjson(tmp_path):
+    csv_file = str(tmp_path / "trips.csv")
+    history = synthetic.trips(15, seed=12)
+    client(history[5:]).write_trips_stream(csv_file=csv_file)
+    assert client(history, incremental=True).write_trips_stream(csv_file=csv_file) == 5
+    assert list(writers.read_csv(csv_file))[-1][:4] == list(history[4][:4])
@@ -0,0 +1,27 @@
+from citibike_trips import parse, records, synthetic
+
+
+def test_trips_page_round_trip_lxml():
+    rows = synthetic.trips(50, seed=1)
+    assert parse.extract_trip_rows(synthetic.trips_page(rows).encode("utf-8")) == rows
+
+
+def test_trips_page_round_trip_html5lib():
+    rows = synthetic.trips(50, seed=2)
+    assert parse.extract_trip_soup(parse.soup(synthetic.trips_page(rows))) == rows
+
+
+def test_trips_match_trip_fields():
+    trip = records.Trip(*synthetic.trips(1, names=["W 17 St & 9 Ave", "Broadway & E 14 St"], seed=3)[0])
+    assert trip.start_name in ("W 17 St & 9 Ave", "Broadway & E 14 St")
+    assert records.pack_time(trip.start_time) is not None
+    assert trip.duration.endswith(" s")
+
+
+def test_pack_times_match_pack_time():
+    values = [_[2] for _ in synthetic.trips(500, seed=4)]
+    values += ["07/04/2019 05:32:10 pm", "07/04/2019 05:32:10 Pm", "-", ""]
+    codes = records.pack_times(values)
+    assert codes == [records.pack_time(_) for _ in values] and codes[-3:] == [None, None, None]
+    assert records.unpack_times(codes[:-3]) == values[:-3]
+    assert records.pack_times(values + [None]) == codes + [None]
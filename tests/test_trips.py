@@ -0,0 +1,9 @@
+from citibike_trips import CitibikeTrips
+
+
+def test_get_trips_recent_fetches_first_page(member_site):
+    options = dict(url_member_base=member_site.base, url_stations=member_site.base + "/stations", http_wait=0)
+    cb = CitibikeTrips("user", "pass", **options)
+    trips = cb.get_trips_recent()
+    assert [tuple(_) for _ in trips] == member_site.history[: member_site.per_page]
+    assert [_ for _ in member_site.hits if "pageNumber=" in _] == ["/profile/trips/ACCT1?pageNumber=1"]